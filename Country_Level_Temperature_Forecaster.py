@@ -1,14 +1,20 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-import joblib
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
-import plotly.express as px
+from climatemap import direct, forecast_store, preprocessing
+from climatemap.decimate import decimate, max_points
+from climatemap.figure_cache import figure_cache
+from climatemap.figures import create_choropleth, create_country_heatmap
+from climatemap.metrics import debug_panel, set_page
+from climatemap import preload
+from climatemap.batching import predict_future
+from climatemap.upload import UploadError, read_upload
 
 # Page config
 st.set_page_config(layout="wide", page_title="Temperature Forecasting App")
+set_page('country')  # labels this rerun's stage timings
 
 # Add logo
 image = 'images/climatemap_logo.png'
@@ -18,9 +24,6 @@ st.image(image, width=200)  # Adjust the width as needed
 st.title("Country Level Temperature Forecasting")
 st.write("Select countries and years to forecast future temperatures.")
 
-# Load the pre-trained model
-model = joblib.load('temperature_forecaster.pkl')
-
 def get_nearest_date(selected_date, date_index):
     """
     Given a selected date (as a Timestamp) and a sorted date_index,
@@ -35,16 +38,11 @@ def get_nearest_date(selected_date, date_index):
         # Find the position of the nearest date using the 'nearest' method
         nearest_idx = sorted_index.get_indexer([selected_date], method='nearest')[0]
         return sorted_index[nearest_idx]
-        
-path = 'data/Monthly_Temperature_Data_2010.csv'
-historical_data = pd.read_csv(path)
-#historical_data = historical_data[historical_data.Date>='2010']
-
-df_country = historical_data.copy()
-#df_country.drop('Unnamed: 0', axis=1, inplace=True)
-df_pivot = df_country.pivot_table(index='Date', columns='Country', values='Monthly_temperature', aggfunc='first')
-df_pivot.index = pd.to_datetime(df_pivot.index)
-df_pivot = df_pivot.sort_index()
+
+
+# Pivoted history, fitted scaler and last input window, cached per data version
+stage = preprocessing.get_stage('country')
+df_pivot = stage.pivot
 all_countries = df_pivot.columns.tolist()
 
 # -----------------------------
@@ -73,24 +71,8 @@ def create_sequences(data, seq_length):
         labels.append(label)
     return np.array(sequences), np.array(labels)
 
-# Function to predict future values
-def predict_future(model, last_sequence, num_steps, seq_length):
-    future_predictions = []
-    current_sequence = last_sequence.copy()
-    for _ in range(num_steps):
-        prediction = model.predict(current_sequence.reshape(1, seq_length, -1))[0]
-        future_predictions.append(prediction)
-        current_sequence = np.roll(current_sequence, -1, axis=0)
-        current_sequence[-1] = prediction
-    return np.array(future_predictions)
-
-# Prepare the dataset
-df_country = historical_data.copy()
-df_pivot = df_country.pivot_table(index='Date', columns='Country', values='Monthly_temperature', aggfunc='first')
-
-# Scaling the data
-scaler = MinMaxScaler()
-scaled_data = scaler.fit_transform(df_pivot)
+# Scaler fitted on the pivoted history
+scaler = stage.scaler
 
 # Get a list of countries from the dataset
 country_list = df_pivot.columns.tolist()
@@ -98,18 +80,30 @@ country_list = df_pivot.columns.tolist()
 # To add country and year selectors
 selected_countries = st.multiselect('Select countries to predict', country_list)
 year_range = st.slider('Select the range of years for prediction', min_value=2025, max_value=2030, value=(2025, 2030))
+method = st.radio(
+    'Forecast method', forecast_store.METHODS, horizontal=True,
+    format_func={'recursive': 'Recursive (month by month)', 'direct': 'Direct (all months at once)'}.get,
+    help='The direct model predicts every month in one pass, so errors do not compound over the years.',
+)
+if method == 'direct' and not direct.available('country'):
+    st.info('No direct model has been trained yet, so the recursive forecast is shown.')
+    method = 'recursive'
+elif method == 'direct' and direct.stale('country'):
+    st.warning('The direct model was trained before the latest data was added. Its forecast starts from the '
+               'latest months, but retrain it with `python -m climatemap.direct country` to learn from them.')
 
 if selected_countries:
-    num_months = 12 * (year_range[1] - year_range[0] + 1)
-    seq_length = 12  # Sequence length (1 year)
-    last_sequence = scaled_data[-seq_length:]
+    # Rows of the forecast for the selected years, counted from the month after the last observation
+    start, stop = forecast_store.year_steps('country', *year_range)
 
     with st.spinner('Generating forecast...'):
-        # Generate predictions
-        future_scaled = predict_future(model, last_sequence, num_months, seq_length)
-        future_temperatures = scaler.inverse_transform(future_scaled)
+        # Slice the precomputed forecast; the model only runs if the store is missing or stale
+        future_temperatures = forecast_store.forecast('country', stop, method)[df_pivot.columns].to_numpy()[start:]
 
-        future_dates = pd.date_range(start=f'{year_range[0]}-01-01', periods=num_months, freq='M').strftime('%b-%Y')
+        # Identifies the forecast values for the figure cache
+        forecast_version = (stage.data_version, forecast_store.model_version('country', method))
+
+        future_dates = forecast_store.forecast_dates('country', stop)[start:].strftime('%b-%Y')
         future_df = pd.DataFrame(np.round(future_temperatures, 2), index=future_dates, columns=df_pivot.columns)
         future_df.index.name = 'Date'
     
@@ -126,16 +120,19 @@ if selected_countries:
     
         # Plot historical and predicted data (line chart)
         fig = make_subplots(rows=1, cols=1, subplot_titles=['Historical and predicted temperatures for selected countries'])
+        # Long histories are decimated to about one point per pixel on a real date axis
+        future_x = pd.to_datetime(future_df.index, format='%b-%Y')
         for country in selected_countries:
-            fig.add_trace(go.Scatter(x=pd.to_datetime(df_pivot.index).strftime('%b-%Y'), y=df_pivot[country], name=f'{country} (Historical)', mode='lines'))
-            fig.add_trace(go.Scatter(x=pd.to_datetime(future_df.index).strftime('%b-%Y'), y=future_df[country], name=f'{country} (Predicted)', mode='lines'))
+            hist_x, hist_y = decimate(df_pivot.index, df_pivot[country], max_points())
+            fig.add_trace(go.Scatter(x=hist_x, y=hist_y, name=f'{country} (Historical)', mode='lines'))
+            fig.add_trace(go.Scatter(x=future_x, y=future_df[country], name=f'{country} (Predicted)', mode='lines'))
     
         # Update layout for better visualization
         fig.update_layout(title='Historical and predicted temperatures for selected countries',
                           xaxis_title='Year', 
                           yaxis_title='Temperature (°C)', 
                           legend_title='Country',
-                          xaxis=dict(type='category', title_font=dict(size=18)),
+                          xaxis=dict(type='date', title_font=dict(size=18)),
                           yaxis=dict(title_font=dict(size=18)),
                           title_font=dict(size=22),
                           legend=dict(font=dict(size=16)))
@@ -155,37 +152,11 @@ if selected_countries:
     }
     future_df['Month_Name'] = future_df['Month'].map(month_names)
     
-    # Loop through selected countries to generate heatmaps
+    # Loop through selected countries to generate heatmaps (cached per country and year range)
     for country in selected_countries:
-        country_df = heatmap_data[[country, 'Year', 'Month']].copy()
-        country_df = country_df.rename(columns={country: 'Temperature'})
-    
-        # Create pivot table for heatmap (Months vs. Years)
-        heatmap_pivot = country_df.pivot_table(index='Month', columns='Year', values='Temperature')
-
-        sorted_months = sorted(heatmap_pivot.index)
-        sorted_months = sorted_months[::-1]
-    
-        # Build heatmap figure
-        heatmap_fig = go.Figure(data=go.Heatmap(
-            x=heatmap_pivot.columns,  # Years
-            #y=[month_names[m] for m in heatmap_pivot.index],  # Month names
-            z=heatmap_pivot.loc[sorted_months].values,
-            y=[month_names[m] for m in sorted_months],
-            colorscale='RdBu',
-            colorbar=dict(title='Temperature (°C)'),
-            reversescale=True,
-            hovertemplate='Year: %{x}<br>Month: %{y}<br>Temperature: %{z}°C<extra></extra>'
-        ))
-    
-        heatmap_fig.update_layout(
-            title=f'Monthly Temperature Heatmap by Year - {country}',
-            xaxis_title='Year',
-            yaxis_title='Month',
-            title_font=dict(size=22),
-            xaxis_title_font=dict(size=18),
-            yaxis_title_font=dict(size=18),
-            xaxis=dict(tickangle=-45)
+        heatmap_fig = figure_cache.get(
+            'country_heatmap', country, year_range, forecast_version,
+            lambda: create_country_heatmap(heatmap_data, country, month_names),
         )
     
         # Display the heatmap in Streamlit
@@ -228,31 +199,21 @@ if selected_countries:
     
     # Display maps side by side
     col1, col2 = st.columns(2)
+    # Both maps share a colour range, so each is keyed by both dates and the forecast rows shown
+    map_dates = (str(hist_date), str(pred_date), (start, stop))
     with col1:
         #st.markdown(f"Historical temperatures on {pd.to_datetime(hist_date).strftime('%b-%Y')}")
-        fig_hist_map = px.choropleth(
-            hist_map_df,
-            locations='Country',
-            locationmode='country names',
-            color='Temperature',
-            scope='africa',
-            color_continuous_scale='RdBu_r',
-            range_color=(common_min, common_max),
-            title=f'Historical ({pd.to_datetime(hist_date).strftime("%b-%Y")})'
+        fig_hist_map = figure_cache.get(
+            'historical_map', 'africa', map_dates, forecast_version,
+            lambda: create_choropleth(hist_map_df, f'Historical ({pd.to_datetime(hist_date).strftime("%b-%Y")})', common_min, common_max),
         )
         st.plotly_chart(fig_hist_map)
         
     with col2:
         #st.markdown(f"Predicted temperatures on {pd.to_datetime(pred_date).strftime('%b-%Y')}")
-        fig_pred_map = px.choropleth(
-            pred_map_df,
-            locations='Country',
-            locationmode='country names',
-            color='Temperature',
-            scope='africa',
-            color_continuous_scale='RdBu_r',
-            range_color=(common_min, common_max),
-            title=f'Predicted ({pd.to_datetime(pred_date).strftime("%b-%Y")})'
+        fig_pred_map = figure_cache.get(
+            'predicted_map', 'africa', map_dates, forecast_version,
+            lambda: create_choropleth(pred_map_df, f'Predicted ({pd.to_datetime(pred_date).strftime("%b-%Y")})', common_min, common_max),
         )
         st.plotly_chart(fig_pred_map)
 
@@ -262,61 +223,40 @@ st.subheader("Upload your own data for prediction")
 # File uploader for custom data
 uploaded_file = st.file_uploader("Upload a CSV file with monthly temperature data", type=["csv"])
 
-# Load the pre-trained scaler
-scaler = joblib.load('models/scaler.pkl')  # Ensure scaler.pkl is available in the directory
-
-# Function to rename uploaded data columns to match expected names
-import pandas as pd
-
-def process_uploaded_data(user_df, reference_df):
-    expected_columns = reference_df.columns.tolist()
-    
-    matching_columns = [col for col in user_df.columns if col in expected_columns]
-    
-    if not matching_columns:
-        raise ValueError("No columns in the uploaded data match the historical data columns.")
-
-    user_df = user_df[matching_columns]
-    
-    rename_map = {col: col for col in matching_columns if col in expected_columns}
-    user_df = user_df.rename(columns=rename_map)
-    
-    missing_columns = [col for col in expected_columns if col not in user_df.columns]
-    for col in missing_columns:
-        user_df[col] = pd.NA  # Fill missing columns with NaN
-
-    # Reorder columns to match the historical data
-    user_df = user_df[expected_columns]
-    
-    return user_df
+# Months of uploaded history kept for the chart; only the last 12 feed the model
+upload_history_months = 120
 
 # If a file is uploaded
 if uploaded_file:
-    user_data = pd.read_csv(uploaded_file)
-    
-    # Ensure the uploaded data matches expected structure
-    if len(user_data.columns) == len(df_pivot.columns):  # Check column count matches
-        user_data = process_uploaded_data(user_data, df_pivot.columns)  # Rename to match expected columns
-        st.write("Uploaded Data (after renaming columns):")
-        st.write(user_data.head())
-
-        # Scale user data
-        user_data_scaled = scaler.transform(user_data)
-        
-        # Define sequence length and prepare the last sequence for prediction
+    try:
+        # Validate the header, then stream the rows keeping only the trailing months
+        upload = read_upload(uploaded_file, df_pivot.columns, keep_rows=upload_history_months)
+    except UploadError as e:
+        st.error(f"The uploaded file does not match the expected format. {e}")
+    else:
+        user_data = upload.history
+        st.write(f"Uploaded Data ({upload.n_rows} rows, last {len(user_data)} shown):")
+        st.write(user_data.tail())
+        if upload.missing_columns:
+            st.warning(f"No uploaded data for: {', '.join(upload.missing_columns)}. "
+                       "Their latest historical months are used instead.")
+
+        # Scale only the last sequence, with the scaler of the columns the upload was aligned to
         seq_length = 12  # Adjust as needed
-        last_sequence = user_data_scaled[-seq_length:]
+        last_sequence = scaler.transform(user_data.iloc[-seq_length:])
+        # Columns missing from the upload take the stored history's last window
+        last_sequence = np.where(np.isnan(last_sequence), stage.last_window, last_sequence)
 
         # Number of prediction steps
         num_months = st.slider('Number of months to predict', min_value=1, max_value=120, value=12)
 
-        # Generate predictions
+        # Generate predictions, batched with other sessions forecasting at the same time
         with st.spinner('Generating forecast for uploaded data...'):
-            future_scaled = predict_future(model, last_sequence, num_months, seq_length)
+            future_scaled = predict_future('country', last_sequence, num_months, seq_length)
             future_temperatures = scaler.inverse_transform(future_scaled)
 
         # Create a DataFrame for the forecasted data
-        start_date = pd.to_datetime(user_data['Date'].iloc[-1]) + pd.DateOffset(months=1)
+        start_date = user_data.index[-1] + pd.DateOffset(months=1)
         future_dates = pd.date_range(start=start_date, periods=num_months, freq='M')
         future_df = pd.DataFrame(np.round(future_temperatures, 2), index=future_dates, columns=df_pivot.columns)
 
@@ -330,8 +270,8 @@ if uploaded_file:
 
         # Plot both the original uploaded and predicted data
         fig = make_subplots(rows=1, cols=1, subplot_titles=['Uploaded and Predicted Temperatures'])
-        for column in df_pivot.columns:
-            fig.add_trace(go.Scatter(x=user_data['Date'], y=user_data[column], name=f'{column} (Uploaded)', mode='lines'))
+        for column in upload.matched_columns:
+            fig.add_trace(go.Scatter(x=user_data.index, y=user_data[column], name=f'{column} (Uploaded)', mode='lines'))
             fig.add_trace(go.Scatter(x=future_df.index, y=future_df[column], name=f'{column} (Predicted)', mode='lines'))
 
         # Customize plot layout
@@ -342,8 +282,6 @@ if uploaded_file:
             legend_title='Country/Region'
         )
         st.plotly_chart(fig)
-    else:
-        st.error("The uploaded file does not match the expected format. Please upload a file with the correct structure.")
 
 # Footer section for Methodology
 #st.markdown("---")
@@ -357,3 +295,9 @@ if uploaded_file:
     #Model performance was evaluated using Mean Squared Error (MSE), showing good predictive accuracy in capturing temperature trends, though some discrepancies emerged during rapid changes. The approach proved effective for temperature forecasting, with further tuning potentially improving results. 
     #For more information about the whole methodology please go this website: [climatemapped.AFRICA](https://climatemapped-africa.dev.codeforafrica.org/about/Methodology)
     #""")
+
+# Stage timings, shown with ?debug=1
+debug_panel(st)
+
+# The page has rendered: import the heavy libraries in the background for the next forecast
+preload.start()
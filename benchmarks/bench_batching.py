@@ -0,0 +1,67 @@
+"""Compare per-session rollouts with the micro-batching scheduler under a burst of sessions.
+
+Usage:
+    python benchmarks/bench_batching.py [--sessions 10 50 100] [--steps 72]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from climatemap import inference  # noqa: E402
+from climatemap.batching import BatchScheduler  # noqa: E402
+from climatemap.registry import registry  # noqa: E402
+
+
+def burst(windows, forecast):
+    """Start one thread per window at the same moment and time until all finish"""
+    results = [None] * len(windows)
+    barrier = threading.Barrier(len(windows) + 1)
+
+    def session(i):
+        barrier.wait()
+        results[i] = forecast(windows[i])
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(len(windows))]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, np.stack(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='country', help='registry model name')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--steps', type=int, default=72)
+    parser.add_argument('--seq-length', type=int, default=12)
+    args = parser.parse_args()
+
+    model = registry.get(args.model)
+    n_features = model.input_shape[-1]
+    rng = np.random.default_rng(0)
+
+    # Trace the graph for both batch shapes before timing
+    inference.rollout(model, rng.random((2, args.seq_length, n_features)), 1)
+
+    print(f"{'sessions':>8} {'single s':>9} {'batched s':>9} {'batches':>7} {'speedup':>8} {'max diff':>9}")
+    for sessions in args.sessions:
+        windows = rng.random((sessions, args.seq_length, n_features)).astype(np.float32)
+        single_time, single = burst(windows, lambda w: inference.rollout(model, w[np.newaxis], args.steps)[0])
+        scheduler = BatchScheduler()
+        batched_time, batched = burst(windows, lambda w: scheduler.predict(args.model, w, args.steps))
+        max_diff = float(np.max(np.abs(single - batched)))
+        print(f"{sessions:>8} {single_time:>9.3f} {batched_time:>9.3f} {scheduler.batches:>7} "
+              f"{single_time / batched_time:>7.1f}x {max_diff:>9.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Compare the old step-by-step predict_future loop with the compiled rollout.
+
+Usage:
+    python benchmarks/bench_inference.py [--model temperature_forecaster.pkl] [--steps 12 72 120]
+"""
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from climatemap import inference  # noqa: E402
+
+
+class CountingModel:
+    """Wrap a model and count calls to ``predict``"""
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def predict(self, x, **kwargs):
+        self.calls += 1
+        return self.model.predict(x, verbose=0, **kwargs)
+
+
+class CountingCall:
+    """Wrap a callable, such as the compiled rollout, and count its calls"""
+
+    def __init__(self, func):
+        self.func = func
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.func(*args, **kwargs)
+
+
+def legacy_predict_future(model, last_sequence, num_steps, seq_length):
+    """The loop the pages used before climatemap.inference"""
+    future_predictions = []
+    current_sequence = last_sequence.copy()
+    for _ in range(num_steps):
+        prediction = model.predict(current_sequence.reshape(1, seq_length, -1))[0]
+        future_predictions.append(prediction)
+        current_sequence = np.roll(current_sequence, -1, axis=0)
+        current_sequence[-1] = prediction
+    return np.array(future_predictions)
+
+
+def best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='temperature_forecaster.pkl')
+    parser.add_argument('--steps', type=int, nargs='+', default=[12, 72, 120])
+    parser.add_argument('--seq-length', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    n_features = model.input_shape[-1]
+    last_sequence = np.random.default_rng(0).random((args.seq_length, n_features)).astype(np.float32)
+
+    # The first compiled call traces the graph; report it separately
+    start = time.perf_counter()
+    inference.predict_future(model, last_sequence, 1, args.seq_length)
+    print(f"graph trace: {time.perf_counter() - start:.3f}s")
+    # Count the engine's calls into the compiled graph (or the model, for non-Keras models)
+    engine_model = model
+    compiled = inference._compiled.get(id(model))
+    if compiled is not None:
+        engine_calls = inference._compiled[id(model)] = CountingCall(compiled)
+    else:
+        engine_model = engine_calls = CountingModel(model)
+
+    print(f"{'steps':>5} {'legacy calls':>12} {'legacy s':>9} {'engine calls':>12} {'engine s':>9} {'speedup':>8} {'max diff':>9}")
+    for num_steps in args.steps:
+        counting = CountingModel(model)
+        engine_calls.calls = 0
+        legacy_time, legacy = best_of(
+            args.repeat, lambda: legacy_predict_future(counting, last_sequence, num_steps, args.seq_length))
+        engine_time, engine = best_of(
+            args.repeat, lambda: inference.predict_future(engine_model, last_sequence, num_steps, args.seq_length))
+        max_diff = float(np.max(np.abs(legacy - engine)))
+        print(f"{num_steps:>5} {counting.calls // args.repeat:>12} {legacy_time:>9.3f} "
+              f"{engine_calls.calls // args.repeat:>12} {engine_time:>9.3f} {legacy_time / engine_time:>7.1f}x {max_diff:>9.2e}")
+
+
+if __name__ == '__main__':
+    main()
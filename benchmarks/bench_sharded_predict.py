@@ -0,0 +1,64 @@
+"""Time city predictions sharded over 1, 2, 4, ... worker processes.
+
+A stand-in MLForecast model is fitted on synthetic cities and saved to a
+temporary file, which each worker loads, as the fitted city model is in the app.
+
+Usage:
+    python benchmarks/bench_sharded_predict.py [--cities 20000] [--horizon 120] [--workers 1 2 4 8 16]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic  # noqa: E402
+from climatemap import city_forecast  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', type=int, default=20000)
+    parser.add_argument('--horizon', type=int, default=city_forecast.FULL_HORIZON)
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='pool sizes to try (default: powers of two up to the core count)')
+    args = parser.parse_args()
+
+    from mlforecast import MLForecast
+    from sklearn.linear_model import LinearRegression
+
+    history = city_forecast.prepare_history(synthetic.city_table(n_cities=args.cities, end=city_forecast.LAST_OBSERVED))
+    history = history[['unique_id', 'ds', 'y']].astype({'unique_id': str})
+    model = MLForecast(models=[LinearRegression()], freq='MS', lags=[1, 12]).fit(history, static_features=[])
+    ids = list(model.ts.uids)
+
+    cores = os.cpu_count() or 1
+    pool_sizes = args.workers or [2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores]
+    print(f"{len(ids)} cities, {args.horizon} months, {cores} cores")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.pkl')
+        joblib.dump(model, path)
+
+        start = time.perf_counter()
+        expected = model.predict(h=args.horizon)
+        single = time.perf_counter() - start
+        expected = expected.sort_values(['unique_id', 'ds'])['LinearRegression'].to_numpy()
+        print(f"{'in process':>12}: {single:7.2f}s")
+
+        for workers in pool_sizes:
+            start = time.perf_counter()
+            future, shards = city_forecast.predict_shards(path, ids, args.horizon, workers)
+            seconds = time.perf_counter() - start
+            actual = future.sort_values(['unique_id', 'ds'])['LinearRegression'].to_numpy()
+            slowest = max(shard_seconds for _, shard_seconds, _ in shards)
+            print(f"{len(shards):>4} shards: {seconds:7.2f}s (slowest shard {slowest:.2f}s, "
+                  f"speedup {single / seconds:.1f}x, max diff {np.max(np.abs(expected - actual)):.1e})")
+
+
+if __name__ == '__main__':
+    main()
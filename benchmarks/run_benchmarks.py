@@ -0,0 +1,316 @@
+"""Benchmark the import, load, preprocessing, inference and rendering hot paths.
+
+Runs offline on the bundled data and models where they can be read, falling
+back to synthetic tables of the same shape. ``--cities`` and ``--years`` scale
+the tables up (e.g. 10x cities, 10x years). Save a run with ``--save`` and
+check a later run against it with ``--compare`` to catch regressions before
+deploying.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--only pivot anomaly] [--cities 10] [--years 10]
+                                        [--save baseline.json] [--compare baseline.json]
+"""
+import argparse
+import calendar
+import copy
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import joblib
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from climatemap import anomaly, city_forecast, dashboard, data, feature_store, figures, preprocessing  # noqa: E402
+from climatemap import preload  # noqa: E402
+from climatemap.anomaly import AnomalyEngine  # noqa: E402
+from climatemap.map_tiles import MapLayers  # noqa: E402
+from climatemap.registry import MODEL_PATHS, registry  # noqa: E402
+
+# A run slower than baseline * REGRESSION_RATIO fails --compare
+REGRESSION_RATIO = 1.25
+
+
+def timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def source_or_synthetic(name, make_synthetic):
+    """The bundled source if it can be read, else a synthetic table of the same shape"""
+    try:
+        return data.load(name), 'bundled'
+    except Exception:
+        return make_synthetic(), 'synthetic'
+
+
+# --- benchmarks ---
+# Each yields (name, callable, note) cases; args carries the scale factors
+
+def bench_model_load(args):
+    for name in MODEL_PATHS:
+        path = registry.path(name)
+        if not os.path.exists(path) or os.path.getsize(path) < 1024:
+            # Missing, or a git-lfs pointer that was never pulled
+            yield f'load:{name}', None, f'{path} not available'
+            continue
+        yield f'load:{name}', lambda path=path: joblib.load(path), path
+
+
+def bench_pivot(args):
+    cases = {
+        'country': (lambda: synthetic.country_table(), 'Country', 'Date'),
+        'subnational': (lambda: synthetic.subnational_table(), 'Area', 'Date'),
+    }
+    from sklearn.preprocessing import MinMaxScaler
+
+    for name, (make, key, time_column) in cases.items():
+        df, origin = source_or_synthetic(name, make)
+        df = synthetic.scale_years(synthetic.scale_series(df, key, args.cities), time_column, args.years)
+        pivot = preprocessing.PIVOTS[name]
+        yield (f'pivot+scaler:{name}',
+               lambda df=df, pivot=pivot: MinMaxScaler().fit_transform(pivot(df)),
+               f'{origin}, {len(df)} rows')
+
+
+def bench_predict_future(args):
+    from climatemap.inference import predict_future
+
+    try:
+        model = registry.get('country')
+    except Exception as e:
+        yield 'predict_future', None, f'country model not available: {e}'
+        return
+    n_features = model.input_shape[-1]
+    window = np.random.default_rng(0).random((preprocessing.SEQ_LENGTH, n_features)).astype(np.float32)
+    # Trace the compiled rollout once so the timings measure steady state
+    predict_future(model, window, 1, preprocessing.SEQ_LENGTH)
+    for steps in (12, 72, 120):
+        yield (f'predict_future:{steps}',
+               lambda steps=steps: predict_future(model, window, steps, preprocessing.SEQ_LENGTH),
+               f'{n_features} series')
+
+
+def _city_model():
+    try:
+        return copy.deepcopy(registry.get('city')), 'bundled model'
+    except Exception:
+        from mlforecast import MLForecast
+        from sklearn.linear_model import LinearRegression
+
+        return MLForecast(models=[LinearRegression()], freq='MS', lags=[1, 12]), 'stand-in model'
+
+
+def bench_mlforecast(args):
+    df, origin = source_or_synthetic('city', synthetic.city_table)
+    df = synthetic.scale_years(synthetic.scale_series(df, 'city', args.cities), 'date', args.years)
+    history = city_forecast.prepare_history(df)[['unique_id', 'ds', 'y']].astype({'unique_id': str})
+    model, model_origin = _city_model()
+    note = f'{origin} data, {model_origin}, {history["unique_id"].nunique()} cities'
+
+    def fit():
+        model.fit(history, static_features=[])
+
+    yield 'mlforecast:fit', fit, note
+
+    # A refit from the feature store: series state from the tails, then only the regressor
+    n = feature_store.lookback(model)
+    if n is not None:
+        prep = copy.deepcopy(model).preprocess(history, static_features=[])
+        tails = history.groupby('unique_id', sort=False).tail(n)
+
+        def fit_stored():
+            model.preprocess(tails, static_features=[], dropna=False)
+            model.fit_models(prep[model.ts.features_order_], prep['y'].to_numpy())
+
+        yield 'mlforecast:fit_stored', fit_stored, note
+    fit()
+    yield 'mlforecast:predict', lambda: model.predict(h=12), note
+
+
+def _dashboard_sources(args):
+    """The historical and predicted tables as data.load returns them, bundled if they can be read"""
+    try:
+        historical, predictions = data.load('historical'), data.load('predictions')
+        origin = 'bundled'
+    except Exception:
+        historical, predictions = synthetic.dashboard_tables()
+        origin = 'synthetic'
+    historical = synthetic.scale_years(synthetic.scale_series(historical, 'city', args.cities), 'year', args.years)
+    predictions = synthetic.scale_series(predictions, 'city', args.cities)
+    return historical, predictions, origin
+
+
+def _dashboard_engine(historical, predictions):
+    """What the dashboard's load_data builds, from tables already in memory"""
+    return AnomalyEngine(dashboard.prepare_historical(historical.copy()),
+                         dashboard.prepare_predictions(predictions.copy()))
+
+
+def bench_anomaly(args):
+    historical, predictions, origin = _dashboard_sources(args)
+    note = f'{origin}, {historical["city"].nunique()} cities, {len(historical)} rows'
+    if origin == 'bundled' and args.cities == 1 and args.years == 1:
+        def load_data():
+            anomaly._engine = None  # cold: rebuild the engine from the mapped Arrow caches
+            return dashboard.load_data()
+
+        yield 'dashboard:load_data', load_data, note
+    else:
+        # Synthetic or scaled tables are not in the data layer; time the same work without the file reads
+        yield 'dashboard:load_data', lambda: _dashboard_engine(historical, predictions), f'{note}, in memory'
+
+
+def _country_forecast_frame():
+    """The country page's forecast table, with the last 72 months of history standing in for the forecast"""
+    df, origin = source_or_synthetic('country', synthetic.country_table)
+    future = preprocessing.country_pivot(df).iloc[-72:].copy()
+    future['Year'] = future.index.year
+    future['Month'] = future.index.month
+    return future, origin
+
+
+def bench_figures(args):
+    import plotly.io as pio
+
+    historical, predictions, origin = _dashboard_sources(args)
+    engine = _dashboard_engine(historical, predictions)
+    latest = engine.latest_data
+    city = engine.cities[0]
+    city_pred = engine.city_predictions(city)
+    city_hist = engine.city(city)
+    year = int(city_pred['year'].iloc[0])
+    layers = MapLayers(latest)
+    center, zoom = {'lat': 0, 'lon': 20}, 2
+
+    future, country_origin = _country_forecast_frame()
+    countries = [col for col in future.columns if col not in ('Year', 'Month')]
+    month_names = dict(enumerate(calendar.month_name))
+    map_df = future[countries].iloc[-1].rename_axis('Country').reset_index(name='Temperature')
+    temperature_range = (map_df['Temperature'].min(), map_df['Temperature'].max())
+
+    # The pages' own builders, serialized as the figure cache does on a miss
+    cases = {
+        'figure:city_map': (lambda: figures.create_city_map(layers, center, zoom),
+                            f'{len(layers.level(zoom))} clusters of {len(latest)} cities'),
+        'figure:temperature_trend': (lambda: figures.create_temperature_trend_chart(city_hist, city),
+                                     f'{len(city_hist)} years'),
+        'figure:climate_heatmap': (lambda: figures.create_climate_heatmap(city_hist, city), f'{len(city_hist)} years'),
+        'figure:monthly_trend': (lambda: figures.create_yearly_monthly_trend_chart(city_pred, city, year), str(year)),
+        'figure:monthly_heatmap': (lambda: figures.create_yearly_monthly_heatmap(city_pred, city, year), str(year)),
+        'figure:country_heatmap': (lambda: figures.create_country_heatmap(future, countries[0], month_names),
+                                   f'{country_origin}, {len(future)} months'),
+        'figure:choropleth': (lambda: figures.create_choropleth(map_df, 'Predicted', *temperature_range),
+                              f'{country_origin}, {len(countries)} countries'),
+    }
+    yield 'map:layers', lambda: MapLayers(latest), f'{origin}, {len(latest)} cities, {len(layers.levels)} zoom levels'
+    for name, (build, note) in cases.items():
+        yield name, lambda build=build: pio.to_json(build(), validate=False), note
+
+
+# What a page imports before its first paint
+APP_MODULES = ('climatemap.batching', 'climatemap.dashboard', 'climatemap.data', 'climatemap.figure_cache',
+               'climatemap.figures', 'climatemap.forecast_store', 'climatemap.preload', 'climatemap.preprocessing',
+               'climatemap.upload')
+
+
+def import_time(module):
+    """Cumulative import time of a module in a fresh interpreter, from ``-X importtime``"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=ROOT)
+    if result.returncode != 0:
+        return None
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    return None
+
+
+def bench_imports(args):
+    for module in (', '.join(APP_MODULES),) + preload.HEAVY_MODULES + ('ai_edge_litert.interpreter',):
+        modules = [m.strip() for m in module.split(',')]
+        cumulative = [import_time(m) for m in modules]
+        name = 'import:app' if len(modules) > 1 else f'import:{module}'
+        if any(seconds is None for seconds in cumulative):
+            yield name, None, 'not installed'
+            continue
+        # Timed as a fresh interpreter importing the module(s); the note has -X importtime's own figure
+        statement = '; '.join(f'import {m}' for m in modules)
+        yield (name,
+               lambda statement=statement: subprocess.run([sys.executable, '-c', statement], check=True, capture_output=True, cwd=ROOT),
+               f'-X importtime: {1000 * max(cumulative):.0f} ms cumulative')
+
+
+BENCHMARKS = {
+    'imports': bench_imports,
+    'load': bench_model_load,
+    'pivot': bench_pivot,
+    'predict': bench_predict_future,
+    'mlforecast': bench_mlforecast,
+    'anomaly': bench_anomaly,
+    'figures': bench_figures,
+}
+
+
+def compare(results, scale, baseline_path, ratio):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline['scale'] != scale:
+        raise SystemExit(f"{baseline_path} was run at scale {baseline['scale']}, not {scale}")
+    regressions = []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before and result['best'] > before['best'] * ratio:
+            regressions.append(f"{name}: {before['best']:.4f}s -> {result['best']:.4f}s "
+                               f"({result['best'] / before['best']:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help='benchmark groups to run (default: all)')
+    parser.add_argument('--cities', type=int, default=1, help='scale the number of cities/series by this factor')
+    parser.add_argument('--years', type=int, default=1, help='scale the number of years by this factor')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help=f'fail if any benchmark is {REGRESSION_RATIO}x slower than this saved run')
+    args = parser.parse_args()
+
+    results = {}
+    # 'first' is the cold call (e.g. a model load with nothing cached yet)
+    print(f"{'benchmark':<28} {'first s':>9} {'best s':>9} {'median s':>9}  notes")
+    for group in args.only or BENCHMARKS:
+        for name, func, note in BENCHMARKS[group](args):
+            if func is None:
+                print(f"{name:<28} {'skipped':>9} {'':>9} {'':>9}  {note}")
+                continue
+            times = timeit(func, args.repeat)
+            results[name] = {'first': times[0], 'best': min(times), 'median': statistics.median(times), 'notes': note}
+            print(f"{name:<28} {times[0]:>9.4f} {min(times):>9.4f} {statistics.median(times):>9.4f}  {note}")
+
+    scale = {'cities': args.cities, 'years': args.years}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'scale': scale, 'results': results}, f, indent=2)
+    if args.compare:
+        regressions = compare(results, scale, args.compare, REGRESSION_RATIO)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Synthetic stand-ins for the data sources, and scale-up of real or synthetic tables.
+
+The generators produce frames with the same columns and dtypes as
+``climatemap.data.load`` returns for each source. The scale functions repeat
+a table under new city names or over earlier years, so 10x-cities and
+10x-years runs can be made from bundled data and from synthetic data alike.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _seasonal(rng, n_series, dates, base=None):
+    base = rng.uniform(10, 30, n_series) if base is None else base
+    months = np.asarray(pd.DatetimeIndex(dates).month)
+    season = 4 * np.sin(2 * np.pi * (months - 1) / 12)
+    noise = rng.normal(0, 0.8, (n_series, len(months)))
+    return (base[:, None] + season[None, :] + noise).astype(np.float32)
+
+
+def country_table(n_countries=54, start='2010-01-01', end='2024-12-01', seed=0):
+    """Date, Country, Monthly_temperature"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq='MS')
+    countries = [f'Country {i:03d}' for i in range(n_countries)]
+    values = _seasonal(rng, n_countries, dates)
+    return pd.DataFrame({
+        'Date': np.tile(dates, n_countries),
+        'Country': pd.Categorical(np.repeat(countries, len(dates))),
+        'Monthly_temperature': values.ravel(),
+    })
+
+
+def subnational_table(n_countries=54, regions_per_country=10, start='2010-01-01', end='2024-12-01', seed=0):
+    """Date, Country, Area, Monthly_temperature"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq='MS')
+    n_series = n_countries * regions_per_country
+    values = _seasonal(rng, n_series, dates)
+    return pd.DataFrame({
+        'Date': np.tile(dates, n_series),
+        'Country': pd.Categorical(np.repeat([f'Country {i:03d}' for i in range(n_countries)], regions_per_country * len(dates))),
+        'Area': pd.Categorical(np.tile(np.repeat([f'Region {j:02d}' for j in range(regions_per_country)], len(dates)), n_countries)),
+        'Monthly_temperature': values.ravel(),
+    })
+
+
+# ISO codes of the 54 countries, as the city sources use them
+COUNTRY_CODES = (
+    'DZ', 'AO', 'BJ', 'BW', 'BF', 'BI', 'CM', 'CV', 'CF', 'TD', 'KM', 'CG', 'CD', 'CI', 'DJ', 'EG', 'GQ', 'ER',
+    'ET', 'GA', 'GM', 'GH', 'GN', 'GW', 'KE', 'LS', 'LR', 'LY', 'MG', 'MW', 'ML', 'MR', 'MU', 'MA', 'MZ', 'NA',
+    'NE', 'NG', 'RW', 'ST', 'SN', 'SC', 'SL', 'SO', 'ZA', 'SS', 'SD', 'SZ', 'TZ', 'TG', 'TN', 'UG', 'ZM', 'ZW',
+)
+
+
+def _cities(rng, n_cities):
+    names = np.array([f'City {i:04d}' for i in range(n_cities)])
+    countries = np.array([COUNTRY_CODES[i % len(COUNTRY_CODES)] for i in range(n_cities)])
+    return names, countries, rng.uniform(-35, 37, n_cities), rng.uniform(-17, 51, n_cities)
+
+
+def city_table(n_cities=200, start='2015-01-01', end='2025-06-01', seed=0):
+    """city, country, date, temperature (the MLForecast training source)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq='MS')
+    names, countries, _, _ = _cities(rng, n_cities)
+    values = _seasonal(rng, n_cities, dates)
+    return pd.DataFrame({
+        'city': pd.Categorical(np.repeat(names, len(dates))),
+        'country': pd.Categorical(np.repeat(countries, len(dates))),
+        'date': np.tile(dates, n_cities),
+        'temperature': values.ravel(),
+    })
+
+
+def dashboard_tables(n_cities=200, first_year=1950, last_year=2025, seed=0):
+    """(historical, predictions) frames as data.load returns them, before the dashboard prepares them"""
+    rng = np.random.default_rng(seed)
+    names, countries, lat, lng = _cities(rng, n_cities)
+    years = np.arange(first_year, last_year + 1)
+    trend = 0.02 * (years - first_year)
+    base = rng.uniform(15, 30, n_cities)
+    historical = pd.DataFrame({
+        'city': pd.Categorical(np.repeat(names, len(years))),
+        'country': pd.Categorical(np.repeat(countries, len(years))),
+        'year': np.tile(years, n_cities).astype(np.int16),
+        'temperature': (base[:, None] + trend[None, :] + rng.normal(0, 0.4, (n_cities, len(years)))).ravel().astype(np.float32),
+        'latitude': np.repeat(lat, len(years)).astype(np.float32),
+        'lng': np.repeat(lng, len(years)).astype(np.float32),
+    })
+
+    dates = pd.date_range('2025-01-01', '2029-12-01', freq='MS')
+    predictions = pd.DataFrame({
+        'city': pd.Categorical(np.repeat(names, len(dates))),
+        'country': pd.Categorical(np.repeat(countries, len(dates))),
+        'date': np.tile(dates, n_cities),
+        'temperature': _seasonal(rng, n_cities, dates, base + 1.5).ravel(),
+        'latitude': np.repeat(lat, len(dates)).astype(np.float32),
+        'lng': np.repeat(lng, len(dates)).astype(np.float32),
+    })
+    return historical, predictions
+
+
+def scale_series(df, key, factor):
+    """Repeat a table ``factor`` times under renamed ``key`` values (10x cities, countries, ...)"""
+    if factor <= 1:
+        return df
+    copies = []
+    for i in range(factor):
+        copy = df.copy()
+        copy[key] = copy[key].astype(str) if i == 0 else copy[key].astype(str) + f' #{i}'
+        copies.append(copy)
+    scaled = pd.concat(copies, ignore_index=True)
+    if isinstance(df[key].dtype, pd.CategoricalDtype):
+        scaled[key] = scaled[key].astype('category')
+    return scaled
+
+
+def scale_years(df, time_column, factor):
+    """Extend a table ``factor`` times further into the past by repeating it at earlier dates"""
+    if factor <= 1:
+        return df
+    column = df[time_column]
+    copies = []
+    if pd.api.types.is_datetime64_any_dtype(column):
+        # Monthly data: shift by whole spans of months so the copies join without gaps
+        first, last = column.min(), column.max()
+        span = (last.year - first.year) * 12 + last.month - first.month + 1
+        for i in range(factor):
+            copy = df.copy()
+            copy[time_column] = column - pd.DateOffset(months=i * span)
+            copies.append(copy)
+    else:
+        span = int(column.max() - column.min() + 1)
+        for i in range(factor):
+            copy = df.copy()
+            copy[time_column] = (column - i * span).astype(column.dtype)
+            copies.append(copy)
+    return pd.concat(copies[::-1], ignore_index=True)
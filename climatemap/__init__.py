@@ -0,0 +1 @@
+"""Shared loading and forecasting helpers for the ClimateMapped.AFRICA pages."""
@@ -0,0 +1,149 @@
+"""Temperature anomalies for the Climate Map Dashboard.
+
+Both tables are sorted by city once, the 1961-1990 baselines are computed with
+a single ``np.bincount`` over integer city codes, and anomalies are attached by
+indexing the baseline array, with no merges. Each city's rows are then one
+contiguous block, so per-city lookups are slices instead of scans of the whole
+multi-decade table. The same ranges back a ``CityIndex`` for the page's
+other city lookups.
+
+``load_engine`` keeps one engine per process. After ``data.append`` adds rows
+it extends the previous engine, and only the baselines of the cities with new
+rows in the baseline years are recomputed.
+"""
+import functools
+import threading
+
+import numpy as np
+import pandas as pd
+
+from climatemap import data
+from climatemap.city_index import CityIndex, sorted_bounds
+
+BASELINE_START = 1961
+BASELINE_END = 1990
+
+
+def _sort_by_city(df, cities, time_column):
+    codes = cities.get_indexer(df['city'])
+    order = np.lexsort((df[time_column].to_numpy(), codes))
+    df = df.take(order).reset_index(drop=True)
+    codes = codes[order]
+    # bounds[i]:bounds[i + 1] are the rows of cities[i]
+    return df, codes, sorted_bounds(codes, len(cities))
+
+
+class AnomalyEngine:
+    """Historical and predicted temperatures with baseline anomalies, sliced by city"""
+
+    def __init__(self, df, df_pred, baseline_start=BASELINE_START, baseline_end=BASELINE_END, known_baselines=None):
+        # known_baselines: city -> baseline still valid, so those cities are not summed again
+        self.baseline_start, self.baseline_end = baseline_start, baseline_end
+        self.cities = pd.Index(sorted(set(df['city'].dropna()) | set(df_pred['city'].dropna())))
+
+        self.df, codes, bounds = _sort_by_city(df, self.cities, 'year')
+        self.df_pred, pred_codes, self._pred_bounds = _sort_by_city(df_pred, self.cities, 'date_parsed')
+
+        # Baseline: mean temperature per city over the baseline years
+        years = self.df['year'].to_numpy()
+        temperatures = self.df['temperature'].to_numpy(dtype=np.float64)
+        in_baseline = (years >= baseline_start) & (years <= baseline_end) & np.isfinite(temperatures) & (codes >= 0)
+        known = np.full(len(self.cities), np.nan)
+        if known_baselines is not None:
+            known = known_baselines.reindex(self.cities).to_numpy(dtype=np.float64)
+            in_baseline &= np.isnan(np.append(known, np.nan)[codes])
+        sums = np.bincount(codes[in_baseline], weights=temperatures[in_baseline], minlength=len(self.cities))
+        counts = np.bincount(codes[in_baseline], minlength=len(self.cities))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.baselines = np.where(np.isfinite(known), known, np.where(counts > 0, sums / counts, np.nan))
+
+        # A trailing NaN lets rows with an unknown city (code -1) get no baseline
+        lookup = np.append(self.baselines, np.nan)
+        for frame, frame_codes in ((self.df, codes), (self.df_pred, pred_codes)):
+            frame['baseline_temp'] = lookup[frame_codes]
+            frame['temperature_anomaly'] = frame['temperature'].to_numpy(dtype=np.float64) - frame['baseline_temp'].to_numpy()
+
+        self.index = CityIndex(self.cities, bounds, self.df)
+
+        # One row per city for the latest year, used by the map and the headline stats
+        self.latest_year = self.df['year'].max()
+        self.latest_data = self.df[self.df['year'] == self.latest_year].reset_index(drop=True)
+
+    def extend(self, df_new, df_pred_new):
+        """An engine with rows appended, reusing the baselines of cities without new baseline-year rows"""
+        years = df_new['year'].to_numpy()
+        in_baseline = (years >= self.baseline_start) & (years <= self.baseline_end)
+        touched = set(df_new.loc[in_baseline, 'city'].dropna())
+        known = pd.Series(self.baselines, index=self.cities).drop(list(touched), errors='ignore')
+        derived = ['baseline_temp', 'temperature_anomaly']
+        return AnomalyEngine(
+            data.concat_rows(self.df.drop(columns=derived), df_new),
+            data.concat_rows(self.df_pred.drop(columns=derived), df_pred_new),
+            self.baseline_start, self.baseline_end, known,
+        )
+
+    @functools.cached_property
+    def map_layers(self):
+        """Zoom-level clusters of ``latest_data`` for the city map, built on first use"""
+        from climatemap.map_tiles import MapLayers
+
+        return MapLayers(self.latest_data)
+
+    @property
+    def baseline_temps(self):
+        """Baselines as a city, baseline_temp frame"""
+        return pd.DataFrame({'city': self.cities, 'baseline_temp': self.baselines})
+
+    def city(self, city):
+        """Historical rows of a city, sorted by year"""
+        return self.df.iloc[self.index.rows(city)]
+
+    def city_predictions(self, city):
+        """Predicted rows of a city, sorted by date"""
+        i = self.index.position(city)
+        if i < 0:
+            return self.df_pred.iloc[0:0]
+        return self.df_pred.iloc[self._pred_bounds[i]:self._pred_bounds[i + 1]]
+
+
+SOURCES = ('historical', 'predictions')
+
+_engine = None  # (source versions, AnomalyEngine)
+_engine_lock = threading.Lock()
+
+
+def _appended_rows(previous_versions):
+    """Rows appended to each source since ``previous_versions``, or None if a source was replaced"""
+    frames = []
+    for name, previous in zip(SOURCES, previous_versions):
+        if data.version(name) == previous:
+            frames.append(data.load(name).iloc[0:0])
+            continue
+        appended = data.last_append(name)
+        if appended is None or appended['from'] != previous:
+            return None
+        frames.append(data.appended_rows(name))
+    return frames
+
+
+def load_engine(prepare_historical, prepare_predictions):
+    """The engine for the current historical and predicted tables, shared by the process
+
+    ``prepare_*`` add the page's derived columns to a copy of a table (or of
+    just its appended rows).
+    """
+    global _engine
+    versions = tuple(data.version(name) for name in SOURCES)
+    with _engine_lock:
+        if _engine is not None and _engine[0] == versions:
+            return _engine[1]
+        new_rows = _appended_rows(_engine[0]) if _engine is not None else None
+        if new_rows is not None:
+            engine = _engine[1].extend(prepare_historical(new_rows[0].copy()), prepare_predictions(new_rows[1].copy()))
+        else:
+            engine = AnomalyEngine(
+                prepare_historical(data.load('historical').copy()),
+                prepare_predictions(data.load('predictions').copy()),
+            )
+        _engine = (versions, engine)
+        return engine
@@ -0,0 +1,224 @@
+"""Choice of inference backend for the CNN-LSTM forecasters.
+
+``keras`` (the default) runs the pickled Keras models. ``tflite`` runs a
+TensorFlow Lite export of the same model instead. It needs only a lean
+interpreter package (``ai-edge-litert`` or ``tflite-runtime``) and not the full
+TensorFlow install, once the export exists. Select the backend and the
+quantization with environment variables:
+
+    CLIMATEMAP_BACKEND=tflite
+    CLIMATEMAP_QUANTIZATION=none|float16|int8
+
+Exports are keyed by the digest of the source pickle, so a new model version
+gets a new export. Create them, and check that their forecasts match Keras,
+with:
+
+    python -m climatemap.backend [country] [subnational] --quantization int8
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from climatemap.registry import registry
+
+BACKENDS = ('keras', 'tflite')
+QUANTIZATIONS = ('none', 'float16', 'int8')
+
+BACKEND = os.environ.get('CLIMATEMAP_BACKEND', 'keras')
+QUANTIZATION = os.environ.get('CLIMATEMAP_QUANTIZATION', 'none')
+
+LITE_DIR = 'models/lite'
+
+# Forecast months compared by the parity check, and the largest differences it accepts
+PARITY_STEPS = 72
+TOLERANCE = 0.5  # °C
+SCALED_TOLERANCE = 0.02  # used when the data is not available for °C
+
+_lite_models = {}  # export path -> LiteModel
+_lite_lock = threading.Lock()
+
+
+def lite_path(name, quantization=QUANTIZATION):
+    return os.path.join(LITE_DIR, f'{name}-{registry.version(name)[:12]}-{quantization}.tflite')
+
+
+def _unrolled(model):
+    """A copy of a Keras model with its recurrent layers unrolled over the (fixed) window length"""
+    import keras
+
+    def clone(layer):
+        config = layer.get_config()
+        return layer.__class__.from_config({**config, 'unroll': True} if 'unroll' in config else config)
+
+    unrolled = keras.models.clone_model(model, clone_function=clone)
+    unrolled.set_weights(model.get_weights())
+    return unrolled
+
+
+def export(name, quantization=QUANTIZATION):
+    """Convert a registry Keras model to TensorFlow Lite; needs TensorFlow"""
+    import keras
+    import tensorflow as tf
+
+    model = _unrolled(registry.get(name))
+    # An unrolled LSTM converts with a dynamic batch, so a rollout's windows go through in one invoke
+    signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)]
+    archive = keras.export.ExportArchive()
+    archive.track(model)
+    archive.add_endpoint('serve', lambda x: model(x, training=False), input_signature=signature)
+
+    saved_model_dir = tempfile.mkdtemp()
+    try:
+        archive.write_out(saved_model_dir)
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        if quantization != 'none':
+            # Dynamic-range int8 weights, or float16 weights
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantization == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        flatbuffer = converter.convert()
+    finally:
+        shutil.rmtree(saved_model_dir, ignore_errors=True)
+
+    path = lite_path(name, quantization)
+    os.makedirs(LITE_DIR, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(flatbuffer)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _interpreter(path):
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+    return Interpreter(model_path=path)
+
+
+class LiteModel:
+    """A TensorFlow Lite export with the ``predict`` interface the rollout uses"""
+
+    def __init__(self, path):
+        self.path = path
+        self._interpreter = _interpreter(path)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(self._input['shape'][1:])
+        # Exports made before the LSTM was unrolled have a fixed batch of one
+        self._resizable = self._input['shape_signature'][0] == -1
+        self._batch = int(self._input['shape'][0])
+        # The interpreter keeps state between set_tensor and get_tensor
+        self._lock = threading.Lock()
+
+    def _invoke(self, x):
+        if len(x) != self._batch:
+            self._interpreter.resize_tensor_input(self._input['index'], x.shape, strict=True)
+            self._interpreter.allocate_tensors()
+            self._batch = len(x)
+        self._interpreter.set_tensor(self._input['index'], x)
+        self._interpreter.invoke()
+        return self._interpreter.get_tensor(self._output['index']).copy()
+
+    def predict(self, x, **kwargs):
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if self._resizable:
+                return self._invoke(x)
+            return np.concatenate([self._invoke(row[np.newaxis]) for row in x])
+
+
+def get_lite_model(name, quantization=QUANTIZATION):
+    """The TensorFlow Lite export of a registry model, exporting it first if needed"""
+    path = lite_path(name, quantization)
+    with _lite_lock:
+        if path not in _lite_models:
+            if not os.path.exists(path):
+                export(name, quantization)
+            # Only the current export of each model is kept
+            prefix = os.path.join(LITE_DIR, f'{name}-')
+            for stale in [p for p in _lite_models if p.startswith(prefix)]:
+                del _lite_models[stale]
+            _lite_models[path] = LiteModel(path)
+        return _lite_models[path]
+
+
+def get_forecaster(name):
+    """The model to roll out for a registry name, on the configured backend"""
+    if BACKEND == 'tflite':
+        return get_lite_model(name)
+    if BACKEND != 'keras':
+        raise ValueError(f"Unknown CLIMATEMAP_BACKEND {BACKEND!r}; expected one of {', '.join(BACKENDS)}")
+    return registry.get(name)
+
+
+def parity(name, quantization=QUANTIZATION, steps=PARITY_STEPS):
+    """Max absolute difference between Keras and TensorFlow Lite forecasts, scaled and in °C"""
+    from climatemap import forecast_store, preprocessing
+    from climatemap.inference import rollout
+
+    keras_model = registry.get(name)
+    lite_model = get_lite_model(name, quantization)
+    source = forecast_store.STORES[name][1]
+    try:
+        stage = preprocessing.get_stage(source)
+        windows, scaler = stage.last_window[np.newaxis], stage.scaler
+    except (FileNotFoundError, KeyError, ValueError):
+        # Bundled data not available: compare on random windows in the scaled range
+        windows = np.random.default_rng(0).random((4,) + tuple(keras_model.input_shape[1:]))
+        scaler = None
+
+    expected = rollout(keras_model, windows, steps)
+    actual = rollout(lite_model, windows, steps)
+    scaled = float(np.max(np.abs(expected - actual)))
+    if scaler is None:
+        return scaled, None
+    celsius = max(
+        float(np.max(np.abs(scaler.inverse_transform(e) - scaler.inverse_transform(a))))
+        for e, a in zip(expected, actual)
+    )
+    return scaled, celsius
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export forecasters to TensorFlow Lite and check parity with Keras.')
+    parser.add_argument('names', nargs='*', help='models to export (default: country subnational)')
+    parser.add_argument('--quantization', default=QUANTIZATION, help=f"one of {', '.join(QUANTIZATIONS)}")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='largest acceptable difference in °C')
+    parser.add_argument('--scaled-tolerance', type=float, default=SCALED_TOLERANCE,
+                        help='largest acceptable scaled difference, used when the data is not available for °C')
+    args = parser.parse_args()
+    if args.quantization not in QUANTIZATIONS:
+        parser.error(f"unknown quantization: {args.quantization}")
+
+    failed = False
+    for name in args.names or ['country', 'subnational']:
+        if not os.path.exists(registry.path(name)):
+            print(f"{name}: skipped, {registry.path(name)} not found")
+            continue
+        path = export(name, args.quantization)
+        scaled, celsius = parity(name, args.quantization)
+        if celsius is None:
+            print(f"{name}: wrote {path} ({os.path.getsize(path) // 1024} KB); "
+                  f"max diff {scaled:.2e} scaled (data not available for °C)")
+            failed |= scaled > args.scaled_tolerance
+        else:
+            print(f"{name}: wrote {path} ({os.path.getsize(path) // 1024} KB); "
+                  f"max diff {scaled:.2e} scaled, {celsius:.3f} °C over {PARITY_STEPS} months")
+            failed |= celsius > args.tolerance
+    if failed:
+        print("parity check failed: keep CLIMATEMAP_BACKEND=keras for these models")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
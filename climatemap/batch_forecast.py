@@ -0,0 +1,146 @@
+"""Offline forecasts for every country, region and city in one run.
+
+Each model family (country, subnational, city) is forecast from the same
+artifacts the pages use: the country and subnational families in worker
+processes, the city family in the main process. Each writes a
+Hive-partitioned Parquet dataset shaped like ``monthly_pred_temp_2025-2029.csv``,
+with one row per series and month:
+
+    date, country, city, temperature[, lat, lng]
+
+For the country family ``city`` is empty; for the subnational family it holds
+the region. City rows keep the source's country code and coordinates. Output
+is partitioned by family and country:
+
+    <out>/family=city/country=KE/part-0.parquet
+
+City predictions are sharded across ``--city-workers`` processes (default: one
+per core the other families leave free), and the time each shard took is
+reported. The city family runs in the main process so that its shard pool is
+never nested inside another pool's worker.
+
+Refresh every family with:
+    python -m climatemap.batch_forecast [country] [subnational] [city] --horizon 60
+"""
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+OUTPUT_DIR = 'data/predictions'
+
+# 2025-2029, the range of monthly_pred_temp_2025-2029.csv
+DEFAULT_HORIZON = 60
+
+COORDINATE_COLUMNS = ('lat', 'lng', 'latitude', 'longitude')
+
+
+def _store_frame(name, horizon):
+    from climatemap import forecast_store
+
+    future = forecast_store.forecast(name, horizon)
+    future = future.set_axis(forecast_store.forecast_dates(name, horizon)).rename_axis('date')
+    return future.reset_index().melt(id_vars='date', var_name='series', value_name='temperature')
+
+
+def country_frame(horizon, workers=None):
+    """Forecast rows and a note for the report"""
+    df = _store_frame('country', horizon)
+    return pd.DataFrame({'date': df['date'], 'country': df['series'], 'city': None, 'temperature': df['temperature']}), ''
+
+
+def subnational_frame(horizon, workers=None):
+    df = _store_frame('subnational', horizon)
+    # Columns are '<country>_<region>'
+    parts = df['series'].str.split('_', n=1, expand=True)
+    return pd.DataFrame({'date': df['date'], 'country': parts[0], 'city': parts[1], 'temperature': df['temperature']}), ''
+
+
+def city_frame(horizon, workers=None):
+    from climatemap import city_forecast, data
+
+    # Every city's forecast, its cities split across worker processes
+    future, shards = city_forecast.predict_sharded(horizon, workers)
+    note = f"{len(shards)} shards: " + ', '.join(f'{n} cities {seconds:.2f}s' for n, seconds, _ in shards)
+    future = future.rename(columns={'unique_id': 'city', 'ds': 'date', 'LinearRegression': 'temperature'})
+    future['date'] = future['date'].dt.to_period('M').dt.to_timestamp()
+
+    history = data.load('city')
+    coordinates = [col for col in COORDINATE_COLUMNS if col in history.columns]
+    info = history[['city', 'country'] + coordinates].drop_duplicates('city').astype({'city': str, 'country': str})
+    future = future.astype({'city': str}).merge(info, on='city', how='left')
+    return future[['date', 'country', 'city', 'temperature'] + coordinates], note
+
+
+FAMILIES = {
+    'country': country_frame,
+    'subnational': subnational_frame,
+    'city': city_frame,
+}
+
+
+def run_family(family, horizon, out_dir, workers=None):
+    """Forecast one family and write its partitions; returns (family, rows, seconds, note)"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    start = time.perf_counter()
+    df, note = FAMILIES[family](horizon, workers)
+    # Fixed types, so families with an empty city column still read as one dataset
+    df = df.astype({'country': 'string', 'city': 'string', 'temperature': 'float32'}).round({'temperature': 2})
+    table = pa.Table.from_pandas(df.sort_values(['country', 'date']), preserve_index=False)
+
+    # Write beside the old output and swap, so readers never see a half-written family
+    root = os.path.join(out_dir, f'family={family}')
+    tmp_root = f'{root}.{os.getpid()}.tmp'
+    ds.write_dataset(table, tmp_root, format='parquet', partitioning=['country'], partitioning_flavor='hive')
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(tmp_root, root)
+    return family, len(df), time.perf_counter() - start, note
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Forecast every series of each model family to Parquet.')
+    parser.add_argument('families', nargs='*', help=f"families to forecast (default: {' '.join(FAMILIES)})")
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON, help='months to forecast')
+    parser.add_argument('--out', default=OUTPUT_DIR, help='output directory')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes for the country and subnational families (default: one per family)')
+    parser.add_argument('--city-workers', type=int, default=None, help='processes sharing the city predictions (default: the cores the other families leave)')
+    args = parser.parse_args()
+    unknown = set(args.families) - set(FAMILIES)
+    if unknown:
+        parser.error(f"unknown family: {', '.join(sorted(unknown))}")
+    families = args.families or list(FAMILIES)
+
+    failed = []
+
+    def report(family, result):
+        try:
+            family, rows, seconds, note = result()
+        except Exception as e:
+            failed.append(family)
+            print(f"{family}: failed: {e}")
+        else:
+            print(f"{family}: wrote {rows} rows to {os.path.join(args.out, f'family={family}')} in {seconds:.1f}s")
+            if note:
+                print(f"  {note}")
+
+    pooled = [family for family in families if family != 'city']
+    with ProcessPoolExecutor(max_workers=args.workers or max(len(pooled), 1)) as pool:
+        futures = {pool.submit(run_family, family, args.horizon, args.out): family for family in pooled}
+        if 'city' in families:
+            # The city family shards its predictions over its own pool, so it runs here rather than
+            # in a worker, on the cores the other families leave
+            city_workers = args.city_workers or max((os.cpu_count() or 1) - len(pooled), 1)
+            report('city', lambda: run_family('city', args.horizon, args.out, city_workers))
+        for future in as_completed(futures):
+            report(futures[future], future.result)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Micro-batching of concurrent forecast requests.
+
+When many sessions forecast at once, each would run its own rollout on the
+same model. Requests are instead collected for a short window per model.
+Their input windows are stacked into one batch, the batch is rolled out
+once for the longest horizon asked for, and each caller gets back its own
+row cut to its own horizon. The first request of a batch waits out the
+window and runs it; the others block until their result is ready.
+"""
+import threading
+
+import numpy as np
+
+from climatemap.backend import get_forecaster
+from climatemap.inference import rollout
+from climatemap.registry import registry
+
+# Seconds a batch stays open for more requests
+MAX_WAIT = 0.01
+
+# A full batch runs without waiting out the window
+MAX_BATCH = 64
+
+
+class _Batch:
+    def __init__(self):
+        self.windows = []
+        self.steps = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class BatchScheduler:
+    """Coalesce concurrent rollouts on the same model into one batched call"""
+
+    def __init__(self, max_wait=MAX_WAIT, max_batch=MAX_BATCH):
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._open = {}  # (model name, model version, window shape) -> batch accepting requests
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def predict(self, model_name, window, num_steps):
+        """Forecast ``num_steps`` months from one (seq_length, features) window of a registry model"""
+        window = np.asarray(window, dtype=np.float32)
+        key = (model_name, registry.version(model_name), window.shape)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            position = len(batch.windows)
+            batch.windows.append(window)
+            batch.steps.append(num_steps)
+            self.requests += 1
+            if len(batch.windows) >= self.max_batch:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            self._run(key, batch)
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[position, :num_steps]
+
+    def _run(self, key, batch):
+        batch.full.wait(self.max_wait)
+        with self._lock:
+            # Close the batch unless it already closed itself by filling up
+            if self._open.get(key) is batch:
+                del self._open[key]
+            self.batches += 1
+        try:
+            batch.results = rollout(get_forecaster(key[0]), np.stack(batch.windows), max(batch.steps))
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+
+# Shared by all sessions in this server process
+scheduler = BatchScheduler()
+
+
+def predict_future(model_name, last_sequence, num_steps, seq_length):
+    """``inference.predict_future`` for a registry model, batched with concurrent callers"""
+    window = np.asarray(last_sequence).reshape(seq_length, -1)
+    return scheduler.predict(model_name, window, num_steps)
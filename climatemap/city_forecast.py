@@ -0,0 +1,275 @@
+"""Fit-once MLForecast predictions for the city level page.
+
+The page used to refit the MLForecast model on every city's history and
+predict every series each time the horizon slider moved. Here the model is
+fitted once per (model, data) version, persisted next to the other models so
+restarts and other workers can reuse it, and predictions are made only for
+the requested city and cached per horizon. The engineered features it is
+fitted on are kept in ``climatemap.feature_store``.
+
+Forecasting every city at once (``predict_sharded``) splits the cities across a
+process pool. Each worker loads the persisted fitted model once and predicts
+its share. The batch job uses it, and the service uses it to precompute the
+full horizon (``warm_predictions``) so that cold requests slice the result.
+
+After ``data.append`` adds rows, the previous fitted model is carried over
+with ``MLForecast.update``. This extends the stored series with the new
+months without refitting the regressor on all history. Each city trains on
+months up to ``LAST_OBSERVED``, or up to its own latest appended month, so an
+append for one city leaves the others' partial months out. Cached predictions
+of the cities the append did not touch are kept.
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import pandas as pd
+
+from climatemap import data, feature_store
+from climatemap.metrics import metrics, span
+from climatemap.registry import registry
+
+FITTED_MODEL_DIR = 'models/fitted'
+
+# Months of the bundled file after this are partial and excluded from training and charts
+LAST_OBSERVED = '2024-12-01'
+
+# Number of (city, horizon) forecasts kept in memory
+PREDICTION_CACHE_SIZE = 512
+
+# 10 years, the longest forecast the service serves
+FULL_HORIZON = 120
+
+# Each predict call pays a fixed cost per month (about 0.2s for 120 months),
+# so smaller shards would spend most of their time on it
+MIN_SHARD_CITIES = 2000
+
+_fitted = {}  # (model digest, data version) -> fitted MLForecast
+_fit_lock = threading.Lock()
+_predictions = OrderedDict()  # (model digest, data version, city, horizon) -> forecast
+_predictions_lock = threading.Lock()
+_full = None  # ((model digest, data version), horizon, {city: forecast})
+_worker_model = None  # fitted model of a predict_sharded worker process
+_cutoffs = None  # (data version, per-city cutoffs past LAST_OBSERVED)
+
+
+def fitted_model_path(model_version, data_version):
+    return os.path.join(FITTED_MODEL_DIR, f'nixtla_forecast-{model_version[:12]}-{data_version[:12]}.pkl')
+
+
+def cutoffs():
+    """Per-city training cutoffs past LAST_OBSERVED: each city's latest appended month
+
+    A city's months up to its own latest appended month are taken to be
+    complete. Cities no append has taken past LAST_OBSERVED are not listed.
+    """
+    global _cutoffs
+    if data.last_append('city') is None:
+        return pd.Series(dtype='datetime64[ns]')
+    data_version = data.version('city')
+    if _cutoffs is None or _cutoffs[0] != data_version:
+        rows = data.appended_rows('city', every=True)
+        latest = rows.groupby(rows['city'].astype(str))['date'].max()
+        _cutoffs = (data_version, latest[latest > pd.Timestamp(LAST_OBSERVED)])
+    return _cutoffs[1]
+
+
+def last_observed(city=None):
+    """The last month to train on: the city's cutoff, or without a city, the latest of any city"""
+    latest = cutoffs()
+    if city is not None:
+        return latest.get(city, pd.Timestamp(LAST_OBSERVED))
+    return latest.max() if len(latest) else pd.Timestamp(LAST_OBSERVED)
+
+
+def changed_cities():
+    """Cities whose training history the last append changed: the cities it touched
+
+    Only those cities' cutoffs can move, so the months a new cutoff takes in
+    belong to them too.
+    """
+    appended = data.last_append('city')
+    if appended is None:
+        return frozenset()
+    return frozenset(appended['series'].get('city', ()))
+
+
+def prepare_history(df):
+    """Rename a slice of the city source to MLForecast's unique_id/ds/y columns, cut at each city's cutoff"""
+    latest = cutoffs()
+    if len(latest):
+        cutoff = df['city'].astype(str).map(latest).fillna(pd.Timestamp(LAST_OBSERVED))
+        df = df[df['date'] <= cutoff]
+    else:
+        df = df[df['date'] <= pd.Timestamp(LAST_OBSERVED)]
+    df = df.rename(columns={"temperature": "y", "date": "ds", "city": "unique_id"})
+    df["y"] = df["y"].round(2)
+    return df.sort_values(["unique_id", "ds"])
+
+
+def get_fitted_model():
+    """Return the city model fitted on the full city source, fitting at most once per data version"""
+    return fit_current()[0]
+
+
+def fit_current():
+    """The fitted model of the current data version, and how it was obtained
+
+    How is ``'cached'`` or ``'loaded'`` (already built), ``'updated'`` (the
+    previous version's model with the appended months), ``'unchanged'`` (the
+    previous version's model; the append added no months it trains on) or
+    ``'fitted'``.
+    """
+    model_version = registry.version('city')
+    data_version = data.version('city')
+    key = (model_version, data_version)
+    with _fit_lock:
+        if key in _fitted:
+            return _fitted[key], 'cached'
+        path = fitted_model_path(model_version, data_version)
+        appended = data.last_append('city')
+        previous_path = fitted_model_path(model_version, appended['from']) if appended else None
+        if os.path.exists(path):
+            model, how = joblib.load(path), 'loaded'
+        elif previous_path and os.path.exists(previous_path) and (updated := _updated(previous_path)) is not None:
+            model, how = updated
+            os.makedirs(FITTED_MODEL_DIR, exist_ok=True)
+            joblib.dump(model, path)
+        else:
+            # Fit a copy so the shared registry artifact is never mutated
+            df_model = prepare_history(data.load('city'))[["unique_id", "ds", "y"]]
+            model, how = copy.deepcopy(registry.get('city')), 'fitted'
+            with span('mlforecast_fit'):
+                # Lag and date features come from the feature store when it has them
+                feature_store.fit(model, df_model.astype({'unique_id': str}))
+            os.makedirs(FITTED_MODEL_DIR, exist_ok=True)
+            joblib.dump(model, path)
+        # Only the latest version is needed in memory
+        _fitted.clear()
+        _fitted[key] = model
+        return model, how
+
+
+def _updated(previous_path):
+    """(model, how) from the previous version's fitted model, or None if the new months do not extend its series"""
+    model = joblib.load(previous_path)
+    changed = changed_cities()
+    df = data.load('city')
+    rows = prepare_history(df[df['city'].isin(changed)])[["unique_id", "ds", "y"]].astype({'unique_id': str})
+    last = rows['unique_id'].map(pd.Series(model.ts.last_dates, index=model.ts.uids))
+    appended = prepare_history(data.appended_rows('city'))[["unique_id", "ds"]].astype({'unique_id': str})
+    appended_last = appended['unique_id'].map(pd.Series(model.ts.last_dates, index=model.ts.uids))
+    if last.isna().any() or (appended['ds'] <= appended_last).any():
+        # A new city, or months inserted before a city's last one, need a refit
+        return None
+    new_rows = rows[rows['ds'] > last]
+    if new_rows.empty:
+        return model, 'unchanged'
+    try:
+        with span('mlforecast_update'):
+            # Gaps in the new months need a refit instead
+            model.update(new_rows, validate_new_data=True)
+    except ValueError:
+        return None
+    return model, 'updated'
+
+
+def known_cities():
+    """Cities the fitted model can forecast"""
+    return get_fitted_model().ts.uids
+
+
+def predict_city(city, horizon):
+    """Forecast ``horizon`` months for a single city as columns unique_id, ds, y"""
+    key = (registry.version('city'), data.version('city'), city, horizon)
+    with _predictions_lock:
+        if key in _predictions:
+            _predictions.move_to_end(key)
+            return _predictions[key].copy()
+        appended = data.last_append('city')
+        previous_key = (key[0], appended['from'], city, horizon) if appended else None
+        if previous_key in _predictions and city not in changed_cities():
+            # The update left this city's series and the regressor unchanged
+            _predictions[key] = _predictions.pop(previous_key)
+            return _predictions[key].copy()
+
+    full = _full
+    if full is not None and full[0] == key[:2] and horizon <= full[1] and city in full[2]:
+        # A recursive forecast's first months do not depend on how far it runs
+        future = full[2][city].iloc[:horizon].reset_index(drop=True)
+    else:
+        with span('mlforecast_predict'):
+            future = _format(get_fitted_model().predict(h=horizon, ids=[city]))
+
+    with _predictions_lock:
+        _predictions[key] = future
+        while len(_predictions) > PREDICTION_CACHE_SIZE:
+            _predictions.popitem(last=False)
+    return future.copy()
+
+
+def _format(future):
+    """Month-start dates and the prediction, rounded, as column y"""
+    future["ds"] = future["ds"].dt.to_period("M").dt.to_timestamp()
+    future = future.rename(columns={'LinearRegression': 'y'})
+    future['y'] = future['y'].round(2)
+    return future
+
+
+def _load_worker_model(path):
+    from threadpoolctl import threadpool_limits
+
+    global _worker_model
+    _worker_model = joblib.load(path)
+    # One BLAS thread per worker, so the pool does not oversubscribe the cores
+    threadpool_limits(1)
+
+
+def _predict_shard(ids, horizon):
+    start = time.perf_counter()
+    future = _worker_model.predict(h=horizon, ids=ids)
+    return future, len(ids), time.perf_counter() - start, os.getpid()
+
+
+def predict_shards(model_path, ids, horizon, workers=None):
+    """Forecast ``ids`` with a persisted fitted model, split across worker processes
+
+    Returns the forecast (columns unique_id, ds, LinearRegression) and one
+    (cities, seconds, pid) tuple per shard.
+    """
+    ids = list(ids)
+    workers = min(workers or os.cpu_count() or 1, -(-len(ids) // MIN_SHARD_CITIES))
+    shards = [ids[i::workers] for i in range(workers)]
+    # Workers load the model file rather than receiving it pickled with each task
+    with ProcessPoolExecutor(workers, initializer=_load_worker_model, initargs=(model_path,)) as pool:
+        results = list(pool.map(_predict_shard, shards, [horizon] * workers))
+    for _, _, seconds, _ in results:
+        metrics.observe('mlforecast_predict_shard', seconds)
+    future = pd.concat([result[0] for result in results], ignore_index=True)
+    return future, [result[1:] for result in results]
+
+
+def predict_sharded(horizon, workers=None):
+    """Forecast every city with the current fitted model; see ``predict_shards``"""
+    model = get_fitted_model()
+    ids = model.ts.uids
+    if workers == 1 or len(ids) <= MIN_SHARD_CITIES:
+        start = time.perf_counter()
+        with span('mlforecast_predict'):
+            future = model.predict(h=horizon)
+        return future, [(len(ids), time.perf_counter() - start, os.getpid())]
+    return predict_shards(fitted_model_path(registry.version('city'), data.version('city')), ids, horizon, workers)
+
+
+def warm_predictions(horizon=FULL_HORIZON, workers=None):
+    """Forecast every city for ``horizon`` months so predict_city misses slice it; returns the shard timings"""
+    global _full
+    key = (registry.version('city'), data.version('city'))
+    future, shards = predict_sharded(horizon, workers)
+    future = _format(future)
+    _full = (key, horizon, {city: frame for city, frame in future.groupby('unique_id', sort=False)})
+    return shards
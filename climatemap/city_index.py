@@ -0,0 +1,63 @@
+"""Prebuilt city lookups for the Climate Map Dashboard.
+
+Built once from the city-sorted historical table, so resolving a city's rows,
+its coordinates or a country's cities is a dictionary or array lookup rather
+than a boolean mask over every row.
+"""
+import numpy as np
+
+
+class CityIndex:
+    """City -> row range, city -> (lat, lng) and country -> cities"""
+
+    def __init__(self, cities, bounds, df):
+        # df must be sorted so that rows bounds[i]:bounds[i + 1] belong to cities[i]
+        self.cities = cities
+        self._bounds = bounds
+        self._positions = {city: i for i, city in enumerate(cities)}
+
+        has_rows = bounds[1:] > bounds[:-1]
+        first_rows = df.iloc[bounds[:-1][has_rows]]
+        self._coordinates = {
+            city: (lat, lng)
+            for city, lat, lng in zip(first_rows['city'], first_rows['latitude'], first_rows['lng'])
+        }
+        self._countries = {}
+        for city, country in zip(first_rows['city'], first_rows['country_name']):
+            if isinstance(country, str):
+                self._countries.setdefault(country, []).append(city)
+
+    def __len__(self):
+        return len(self._coordinates)
+
+    def __contains__(self, city):
+        return city in self._coordinates
+
+    @property
+    def countries(self):
+        """Sorted names of the countries with at least one city"""
+        return sorted(self._countries)
+
+    def position(self, city):
+        """Position of a city in ``cities``, or -1 if unknown"""
+        return self._positions.get(city, -1)
+
+    def rows(self, city):
+        """Slice of the city's rows in the sorted table (empty if unknown)"""
+        i = self.position(city)
+        if i < 0:
+            return slice(0, 0)
+        return slice(int(self._bounds[i]), int(self._bounds[i + 1]))
+
+    def coordinates(self, city):
+        """(latitude, longitude) of a city"""
+        return self._coordinates[city]
+
+    def cities_in(self, countries):
+        """Sorted cities of the given countries"""
+        return sorted(city for country in countries for city in self._countries.get(country, []))
+
+
+def sorted_bounds(codes, n):
+    """Row bounds of each code in an array sorted by code"""
+    return np.searchsorted(codes, np.arange(n + 1), side='left')
@@ -0,0 +1,63 @@
+"""The dashboard's historical and predicted city tables.
+
+``load_data`` returns the process-wide ``AnomalyEngine`` over both tables,
+with the columns the dashboard adds. It is shared by the page and the
+benchmarks.
+"""
+from climatemap import anomaly
+from climatemap.metrics import timed
+
+# Country code to country name mapping for African countries
+country_mapping = {
+    'DZ': 'Algeria', 'AO': 'Angola', 'BJ': 'Benin', 'BW': 'Botswana',
+    'BF': 'Burkina Faso', 'BI': 'Burundi', 'CM': 'Cameroon', 'CV': 'Cape Verde',
+    'CF': 'Central African Republic', 'TD': 'Chad', 'KM': 'Comoros', 'CG': 'Congo',
+    'CD': 'Democratic Republic of Congo', 'CI': 'Côte d\'Ivoire', 'DJ': 'Djibouti',
+    'EG': 'Egypt', 'EH': 'Western Sahara', 'GQ': 'Equatorial Guinea', 'ER': 'Eritrea', 'ET': 'Ethiopia',
+    'GA': 'Gabon', 'GM': 'Gambia', 'GH': 'Ghana', 'GN': 'Guinea', 'GW': 'Guinea-Bissau',
+    'KE': 'Kenya', 'LS': 'Lesotho', 'LR': 'Liberia', 'LY': 'Libya', 'MG': 'Madagascar',
+    'MW': 'Malawi', 'ML': 'Mali', 'MR': 'Mauritania', 'MU': 'Mauritius',
+    'MA': 'Morocco', 'MZ': 'Mozambique', 'NA': 'Namibia', 'NE': 'Niger',
+    'NG': 'Nigeria', 'RW': 'Rwanda', 'ST': 'São Tomé and Príncipe', 'SN': 'Senegal',
+    'SC': 'Seychelles', 'SL': 'Sierra Leone', 'SO': 'Somalia', 'ZA': 'South Africa',
+    'SS': 'South Sudan', 'SD': 'Sudan', 'SZ': 'Eswatini', 'TZ': 'Tanzania',
+    'TG': 'Togo', 'TN': 'Tunisia', 'UG': 'Uganda', 'ZM': 'Zambia', 'ZW': 'Zimbabwe'
+}
+
+
+def prepare_historical(df):
+    """Add the coordinate and country name columns the page uses to historical rows"""
+    if 'latitude' not in df.columns:
+        df['latitude'] = df['lat']
+    if 'lng' not in df.columns and 'longitude' in df.columns:
+        df['lng'] = df['longitude']
+
+    df['country_name'] = df['country'].map(country_mapping)
+    return df
+
+
+def prepare_predictions(df_pred):
+    """Add the date parts, coordinate and country name columns the page uses to predicted rows"""
+    # The date column ("Jul-2025" in the CSV) is parsed by the data layer
+    df_pred['date_parsed'] = df_pred['date']
+    df_pred['year'] = df_pred['date_parsed'].dt.year
+    df_pred['month'] = df_pred['date_parsed'].dt.month
+    df_pred['month_name'] = df_pred['date_parsed'].dt.strftime('%b')
+
+    if 'latitude' not in df_pred.columns:
+        df_pred['latitude'] = df_pred['lat']
+    if 'lng' not in df_pred.columns and 'longitude' in df_pred.columns:
+        df_pred['lng'] = df_pred['longitude']
+
+    df_pred['country_name'] = df_pred['country'].map(country_mapping)
+    return df_pred
+
+
+@timed('load_data')
+def load_data():
+    """Both tables sorted by city, with anomalies and the city index, shared by all sessions
+
+    Built once per data version; after an append only the new rows are prepared
+    and only the baselines they change are recomputed.
+    """
+    return anomaly.load_engine(prepare_historical, prepare_predictions)
@@ -0,0 +1,415 @@
+"""Typed loading of the CSV inputs with an Arrow cache.
+
+Each source CSV is parsed once with explicit dtypes (categorical names,
+float32 temperatures, datetime64 dates) and written to an uncompressed
+Feather file under ``data/.cache``. Later loads read that file, with the
+types already applied, instead of parsing the CSV again. The conversion to
+pandas copies the columns, so each process holds its own copy of a loaded
+source. The cache is keyed by the source files' mtime and size, and falls
+back to their SHA-256 when those change, so touching a file without editing
+it does not trigger a rebuild.
+
+Sources with a ``partition_by`` column are also written as Hive-style Parquet
+directories (``Country=Kenya/...``) so ``load_country`` reads only the
+partition a page needs, with date-range filters pushed down to the row
+groups.
+
+New rows are added with ``append``, which extends the CSV and the caches in
+place instead of reparsing everything. It records the append in the cache
+metadata: the previous data version and the series it touched. Caches built
+on top of a source (matrices, pivots, fitted models, predictions) read that
+record through ``last_append``. They keep their entries for untouched
+series and update only the rest.
+
+Frames returned by ``load`` are shared by every caller in the process; copy
+before modifying them in place.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from urllib.parse import unquote
+
+import pandas as pd
+
+from climatemap.metrics import span, timed
+from climatemap.registry import registry
+
+CACHE_DIR = 'data/.cache'
+
+
+@dataclass(frozen=True)
+class Source:
+    """A CSV input: its file(s), column dtypes and date formats"""
+    paths: tuple
+    dtypes: dict
+    dates: dict = field(default_factory=dict)  # column -> strptime format, or None to infer
+    lowercase: bool = False  # lower-case column names before applying dtypes
+    partition_by: str = None  # column to partition the Parquet copy on
+    keys: tuple = ()  # series columns then the time column; appended rows must not repeat them
+
+
+SOURCES = {
+    'country': Source(
+        paths=('data/Monthly_Temperature_Data_2010.csv',),
+        dtypes={'Country': 'category', 'Monthly_temperature': 'float32'},
+        dates={'Date': None},
+        keys=('Country', 'Date'),
+    ),
+    'subnational': Source(
+        paths=('data/subnational_monthly_temp_1990.csv',),
+        dtypes={'Country': 'category', 'Area': 'category', 'Monthly_temperature': 'float32'},
+        dates={'Date': None},
+        partition_by='Country',
+        keys=('Country', 'Area', 'Date'),
+    ),
+    'city': Source(
+        paths=('data/monthly_temp_2015-2025.csv',),
+        dtypes={'city': 'category', 'country': 'category', 'temperature': 'float32'},
+        dates={'date': None},
+        partition_by='country',
+        keys=('city', 'date'),
+    ),
+    'historical': Source(
+        paths=('data/sample_temp_1950-2025_1.csv', 'data/sample_temp_1950-2025_2.csv'),
+        dtypes={
+            'city': 'category', 'country': 'category', 'year': 'int16', 'temperature': 'float32',
+            'lat': 'float32', 'latitude': 'float32', 'lng': 'float32', 'longitude': 'float32',
+        },
+        lowercase=True,
+        keys=('city', 'year'),
+    ),
+    'predictions': Source(
+        paths=('data/monthly_pred_temp_2025-2029.csv',),
+        dtypes={
+            'city': 'category', 'country': 'category', 'temperature': 'float32',
+            'lat': 'float32', 'latitude': 'float32', 'lng': 'float32', 'longitude': 'float32',
+        },
+        dates={'date': '%b-%Y'},
+        lowercase=True,
+        keys=('city', 'date'),
+    ),
+}
+
+# Number of per-country frames kept in memory
+PARTITION_CACHE_SIZE = 64
+
+_frames = {}  # cache file -> DataFrame
+_partitions = OrderedDict()  # (dataset root, country, start, end) -> DataFrame
+_lock = threading.Lock()
+
+
+def _read_file(path, source):
+    header = pd.read_csv(path, nrows=0).columns
+    names = {col: col.lower() if source.lowercase else col for col in header}
+    # Categoricals are read as strings and converted after concatenation,
+    # so every file shares one set of categories
+    dtype = {
+        col: ('str' if source.dtypes[name] == 'category' else source.dtypes[name])
+        for col, name in names.items() if name in source.dtypes
+    }
+    # Only empty cells are missing: 'NA' is Namibia's country code
+    df = pd.read_csv(path, dtype=dtype, keep_default_na=False, na_values=[''])
+    return df.rename(columns=names)
+
+
+def _apply_types(df, source):
+    for col, dtype in source.dtypes.items():
+        if dtype == 'category' and col in df.columns:
+            df[col] = df[col].astype('category')
+    for col, date_format in source.dates.items():
+        df[col] = pd.to_datetime(df[col], format=date_format)
+    return df
+
+
+def _read_csv(source):
+    frames = [_read_file(path, source) for path in source.paths]
+    df = pd.concat(frames, axis=0).reset_index(drop=True) if len(frames) > 1 else frames[0]
+    return _apply_types(df, source)
+
+
+def concat_rows(df, new_rows):
+    """``new_rows`` after ``df``, keeping categorical columns categorical over both sets of categories"""
+    df, new_rows = df.copy(deep=False), new_rows.copy(deep=False)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and col in new_rows.columns:
+            # Sorted, as astype('category') would order them on a full parse
+            categories = df[col].cat.categories.union(pd.Index(new_rows[col].dropna().unique()).astype(str))
+            df[col] = df[col].cat.set_categories(categories)
+            new_rows[col] = new_rows[col].astype(pd.CategoricalDtype(categories))
+    return pd.concat([df, new_rows], axis=0, ignore_index=True)
+
+
+def version(name):
+    """Combined SHA-256 of a source's files, used to key caches built from it"""
+    digest = hashlib.sha256()
+    for path in SOURCES[name].paths:
+        digest.update(registry.digest(path).encode())
+    return digest.hexdigest()
+
+
+def _stats(source):
+    return [[os.stat(path).st_mtime_ns, os.stat(path).st_size] for path in source.paths]
+
+
+def cache_path(name):
+    """Return an up-to-date Feather cache for a source, rebuilding it if the CSV changed"""
+    source = SOURCES[name]
+    meta_path = os.path.join(CACHE_DIR, f'{name}.json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        meta = {}
+
+    stats = _stats(source)
+    cache_file = meta.get('cache')
+    if cache_file and os.path.exists(cache_file):
+        if meta.get('stats') == stats:
+            return cache_file
+        if meta.get('version') == version(name):
+            # Touched but unchanged: record the new stats and keep the cache
+            meta['stats'] = stats
+            _write_meta(meta_path, meta)
+            return cache_file
+
+    data_version = version(name)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    new_cache = os.path.join(CACHE_DIR, f'{name}-{data_version[:12]}.feather')
+    tmp_path = f'{new_cache}.{os.getpid()}.tmp'
+    with span('csv_parse'):
+        _read_csv(source).to_feather(tmp_path, compression='uncompressed')
+    os.replace(tmp_path, new_cache)
+    if cache_file and cache_file != new_cache and os.path.exists(cache_file):
+        os.remove(cache_file)
+        # Partitioned copies of the old cache are stale too
+        stale_prefix = os.path.basename(cache_file).replace('.feather', '-by-')
+        for entry in os.listdir(CACHE_DIR):
+            if entry.startswith(stale_prefix):
+                shutil.rmtree(os.path.join(CACHE_DIR, entry), ignore_errors=True)
+    _write_meta(meta_path, {'stats': stats, 'version': data_version, 'cache': new_cache})
+    return new_cache
+
+
+def _read_meta(name):
+    try:
+        with open(os.path.join(CACHE_DIR, f'{name}.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+@timed('data_load')
+def load(name):
+    """Return a source as a typed DataFrame, read from its Arrow cache"""
+    from pyarrow import feather
+
+    with _lock:
+        path = cache_path(name)
+        if path not in _frames:
+            # Drop frames from superseded caches of the same source
+            prefix = os.path.join(CACHE_DIR, f'{name}-')
+            for stale in [p for p in _frames if p.startswith(prefix)]:
+                del _frames[stale]
+            # Mapping the file spares a read buffer; to_pandas still copies every column
+            _frames[path] = feather.read_table(path, memory_map=True).to_pandas()
+        return _frames[path]
+
+
+def partition_root(name):
+    """Return the Hive-partitioned Parquet copy of a source, writing it if needed"""
+    import pyarrow.dataset as ds
+    from pyarrow import feather
+
+    source = SOURCES[name]
+    if source.partition_by is None:
+        raise ValueError(f"Source {name!r} is not partitioned")
+    cache_file = cache_path(name)
+    root = cache_file.replace('.feather', f'-by-{source.partition_by}')
+    if not os.path.isdir(root):
+        table = feather.read_table(cache_file, memory_map=True)
+        # Sorting by date keeps each row group's date statistics tight for pushdown
+        date_column = next(iter(source.dates))
+        table = table.sort_by(date_column)
+        tmp_root = f'{root}.{os.getpid()}.tmp'
+        ds.write_dataset(
+            table, tmp_root, format='parquet', partitioning=[source.partition_by],
+            partitioning_flavor='hive', existing_data_behavior='delete_matching',
+        )
+        try:
+            os.rename(tmp_root, root)
+        except OSError:
+            # Another worker finished first
+            shutil.rmtree(tmp_root, ignore_errors=True)
+    return root
+
+
+def countries(name):
+    """Sorted partition values (countries) of a partitioned source, without reading any rows"""
+    root = partition_root(name)
+    prefix = f'{SOURCES[name].partition_by}='
+    return sorted(unquote(entry[len(prefix):]) for entry in os.listdir(root) if entry.startswith(prefix))
+
+
+@timed('data_load_country')
+def load_country(name, country, start=None, end=None):
+    """Return one country's rows of a partitioned source, optionally limited to a date range"""
+    import pyarrow.dataset as ds
+
+    source = SOURCES[name]
+    root = partition_root(name)
+    key = (root, country, start, end)
+    with _lock:
+        if key in _partitions:
+            _partitions.move_to_end(key)
+            return _partitions[key]
+        previous = _previous_partition(name, country, start, end)
+        if previous is not None:
+            # The last append did not touch this country, so its rows are unchanged
+            _partitions[key] = previous
+            return previous
+
+    date_column = next(iter(source.dates))
+    condition = ds.field(source.partition_by) == country
+    if start is not None:
+        condition &= ds.field(date_column) >= pd.Timestamp(start)
+    if end is not None:
+        condition &= ds.field(date_column) <= pd.Timestamp(end)
+    dataset = ds.dataset(root, format='parquet', partitioning='hive')
+    df = dataset.to_table(filter=condition).to_pandas()
+
+    with _lock:
+        _partitions[key] = df
+        while len(_partitions) > PARTITION_CACHE_SIZE:
+            _partitions.popitem(last=False)
+    return df
+
+
+def _previous_partition(name, country, start, end):
+    """A cached partition read of the previous data version, if the last append left that partition alone"""
+    appended = last_append(name)
+    partition_by = SOURCES[name].partition_by
+    if not appended or country in appended['series'].get(partition_by, ()):
+        return None
+    old_root = os.path.join(CACHE_DIR, f"{name}-{appended['from'][:12]}-by-{partition_by}")
+    return _partitions.get((old_root, country, start, end))
+
+
+def _series_columns(source):
+    """Columns naming the series a row belongs to: its non-date keys and the partition column"""
+    columns = list(source.keys[:-1])
+    if source.partition_by and source.partition_by not in columns:
+        columns.append(source.partition_by)
+    return columns
+
+
+def last_append(name):
+    """The record of the ``append`` that produced the current version, or None
+
+    ``{'from': previous version, 'rows': rows before the append, 'first_rows':
+    rows before the first append since the source files were last replaced,
+    'series': {column: [values]}}``. None when the source was last replaced
+    rather than appended to.
+    """
+    meta = _read_meta(name)
+    appended = meta.get('appended')
+    if not appended or meta.get('stats') != _stats(SOURCES[name]):
+        return None
+    return appended
+
+
+def appended_rows(name, every=False):
+    """The rows added by the last ``append`` (or with ``every``, by all appends since the files were replaced)"""
+    appended = last_append(name)
+    return load(name).iloc[appended['first_rows'] if every else appended['rows']:]
+
+
+def append(name, path):
+    """Append the rows of a CSV laid out like the source's last file, updating the caches in place
+
+    The rows are added to the end of the source CSV, the Feather cache is
+    extended without reparsing it and only the touched partitions of the
+    Parquet copy are written. Returns ``(old_version, new_version, new_rows)``.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow import feather
+
+    source = SOURCES[name]
+    target = source.paths[-1]
+    with open(target, 'rb') as f:
+        header = f.readline()
+    with open(path, 'rb') as f:
+        new_header = f.readline()
+        body = f.read()
+    if new_header.strip() != header.strip():
+        raise ValueError(f"{path} must have the header of {target}: {header.decode().strip()}")
+    new_rows = _apply_types(_read_file(path, source), source)
+    if new_rows.empty:
+        raise ValueError(f"{path} has no rows")
+
+    with _lock:
+        old_cache = cache_path(name)
+        old_version = version(name)
+        previous = last_append(name)
+        df = _frames.get(old_cache)
+        if df is None:
+            df = feather.read_table(old_cache, memory_map=True).to_pandas()
+
+        if source.keys:
+            keys = list(source.keys)
+            repeated = new_rows.duplicated(keys).any() or not new_rows[keys].astype(str).merge(
+                df[keys].astype(str), on=keys, how='inner').empty
+            if repeated:
+                raise ValueError(f"{path} repeats rows already in {name} (same {', '.join(keys)})")
+
+        with open(target, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() and (f.seek(-1, os.SEEK_END), f.read(1))[1] != b'\n':
+                f.write(b'\n')
+            f.write(body if body.endswith(b'\n') else body + b'\n')
+        new_version = version(name)
+
+        new_cache = os.path.join(CACHE_DIR, f'{name}-{new_version[:12]}.feather')
+        tmp_path = f'{new_cache}.{os.getpid()}.tmp'
+        concat_rows(df, new_rows).to_feather(tmp_path, compression='uncompressed')
+        os.replace(tmp_path, new_cache)
+
+        if source.partition_by:
+            old_root = old_cache.replace('.feather', f'-by-{source.partition_by}')
+            new_root = new_cache.replace('.feather', f'-by-{source.partition_by}')
+            if os.path.isdir(old_root):
+                # Untouched partitions move over as they are; touched ones get one more file
+                os.rename(old_root, new_root)
+                date_column = next(iter(source.dates))
+                table = pa.Table.from_pandas(new_rows.sort_values(date_column), preserve_index=False)
+                ds.write_dataset(
+                    table, new_root, format='parquet', partitioning=[source.partition_by],
+                    partitioning_flavor='hive', existing_data_behavior='overwrite_or_ignore',
+                    basename_template=f'append-{new_version[:12]}-{{i}}.parquet',
+                )
+
+        os.remove(old_cache)
+        _frames.pop(old_cache, None)
+        series = {
+            col: sorted(str(value) for value in new_rows[col].dropna().unique())
+            for col in _series_columns(source) if col in new_rows.columns
+        }
+        appended = {
+            'from': old_version, 'rows': len(df),
+            'first_rows': previous.get('first_rows', previous['rows']) if previous else len(df), 'series': series,
+        }
+        _write_meta(os.path.join(CACHE_DIR, f'{name}.json'), {
+            'stats': _stats(source), 'version': new_version, 'cache': new_cache, 'appended': appended,
+        })
+    return old_version, new_version, new_rows
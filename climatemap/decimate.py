@@ -0,0 +1,87 @@
+"""Server-side decimation of long line-chart series.
+
+A chart can only show about one point per horizontal pixel, so long
+histories are reduced before they are sent to the browser. ``lttb`` (Largest
+Triangle Three Buckets) keeps the visual shape of the line. ``minmax`` keeps
+each bucket's extremes, so spikes always survive. Series at or below the
+target size are returned unchanged.
+"""
+import numpy as np
+
+# Points kept per horizontal pixel of chart width
+POINTS_PER_PIXEL = 1
+
+# Plotly's default figure width when a chart does not set one
+DEFAULT_CHART_WIDTH = 700
+
+
+def max_points(width=DEFAULT_CHART_WIDTH):
+    """Number of points worth sending for a chart ``width`` pixels wide"""
+    return max(3, int(width * POINTS_PER_PIXEL))
+
+
+def _numeric(x):
+    x = np.asarray(x)
+    if x.dtype.kind == 'M':
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the ``n_out`` points LTTB keeps, first and last always included"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _numeric(x)
+    y = np.asarray(y, dtype=np.float64)
+
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Average of the next bucket (or the last point for the final bucket)
+        if i + 2 < len(edges):
+            next_x, next_y = x[end:edges[i + 2]], y[end:edges[i + 2]]
+        else:
+            next_x, next_y = x[n - 1:], y[n - 1:]
+        finite = np.isfinite(next_y)
+        if finite.any():
+            avg_x, avg_y = next_x[finite].mean(), next_y[finite].mean()
+        else:
+            avg_x, avg_y = next_x.mean(), y[a]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + (int(np.nanargmax(area)) if np.isfinite(area).any() else 0)
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """Indices of each bucket's minimum and maximum, in order, about ``n_out`` in total"""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(np.int64)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        bucket = y[start:end]
+        if end <= start or not np.isfinite(bucket).any():
+            continue
+        selected.extend(sorted({start + int(np.nanargmin(bucket)), start + int(np.nanargmax(bucket))}))
+    return np.asarray(selected, dtype=np.int64)
+
+
+def decimate(x, y, n_out=None, method='lttb'):
+    """Return (x, y) reduced to about ``n_out`` points"""
+    n_out = max_points() if n_out is None else n_out
+    x, y = np.asarray(x), np.asarray(y)
+    if method == 'lttb':
+        indices = lttb_indices(x, y, n_out)
+    elif method == 'minmax':
+        indices = minmax_indices(y, n_out)
+    else:
+        raise ValueError(f"Unknown decimation method: {method}")
+    return x[indices], y[indices]
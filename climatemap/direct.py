@@ -0,0 +1,227 @@
+"""Direct multi-step forecasters.
+
+The recursive CNN-LSTM predicts one month and feeds it back, so a forecast
+of N months is N sequential model calls and errors compound along the way.
+A direct forecaster has the same Conv1D/LSTM body but a head that emits
+``horizon`` months at once from the 12-month window. Any forecast up to
+the horizon is a single forward pass. Longer forecasts chain whole blocks.
+
+One model is trained per horizon in ``HORIZONS``. A forecast takes each month
+from the shortest-horizon model that reaches it: months 1-12 from the
+12-month model, 13-24 from the 24-month one and the rest from the 72-month
+one, which is also chained past 72 months.
+
+Models are saved with joblib next to the recursive ones, under the registry
+names ``country_direct`` and ``subnational_direct`` (72 months) and
+``<name>_12``/``<name>_24``, each with a JSON sidecar recording the horizon,
+the data version and the validation error. ``load`` warns when the data has
+moved on since training: the models still forecast from the latest window,
+but have not learned from the new months. Train them with:
+
+    python -m climatemap.direct country --horizons 12 24 72 --epochs 200
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from climatemap.metrics import timed
+from climatemap.registry import registry
+
+# Registry name of the longest-horizon direct model for each forecast store
+DIRECT_MODELS = {
+    'country': 'country_direct',
+    'subnational': 'subnational_direct',
+}
+
+# 2025-2030, the longest range offered by the page sliders
+DEFAULT_HORIZON = 72
+
+# Months each trained model predicts at once; shorter ones serve the first months
+HORIZONS = (12, 24, DEFAULT_HORIZON)
+
+logger = logging.getLogger(__name__)
+
+# Share of the training windows, taken from the end, held out for validation
+VALIDATION_SPLIT = 0.1
+
+
+def model_name(name, horizon=DEFAULT_HORIZON):
+    """Registry name of a forecast store's direct model for a horizon"""
+    return DIRECT_MODELS[name] if horizon == DEFAULT_HORIZON else f'{DIRECT_MODELS[name]}_{horizon}'
+
+
+def trained(name):
+    """Horizons with a trained direct model for a forecast store, shortest first"""
+    return [horizon for horizon in HORIZONS if os.path.exists(registry.path(model_name(name, horizon)))]
+
+
+def available(name):
+    """Whether a direct model has been trained for a forecast store"""
+    return bool(trained(name))
+
+
+def version(name):
+    """Combined digest of a store's trained direct models, used to key forecasts made with them"""
+    digest = hashlib.sha256()
+    for horizon in trained(name):
+        digest.update(f'{horizon}:{registry.version(model_name(name, horizon))}'.encode())
+    return digest.hexdigest()
+
+
+def metadata(name, horizon=DEFAULT_HORIZON):
+    """The JSON sidecar ``train`` wrote next to a direct model, or None"""
+    path = f'{os.path.splitext(registry.path(model_name(name, horizon)))[0]}.json'
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def stale(name):
+    """Whether any of a store's direct models was trained on an older version of its data"""
+    from climatemap import data, forecast_store
+
+    data_version = data.version(forecast_store.STORES[name][1])
+    return any(
+        meta is not None and meta.get('data_version') != data_version
+        for meta in (metadata(name, horizon) for horizon in trained(name))
+    )
+
+
+def load(name):
+    """The direct models of a forecast store by horizon, warning if they were trained on older data"""
+    if stale(name):
+        logger.warning("%s was trained on an older version of the data; retrain it with "
+                       "python -m climatemap.direct %s", DIRECT_MODELS[name], name)
+    return {horizon: registry.get(model_name(name, horizon)) for horizon in trained(name)}
+
+
+def training_windows(scaled, seq_length, horizon):
+    """(inputs, targets) pairs shaped (n, seq_length, f) and (n, horizon, f)"""
+    n = len(scaled) - seq_length - horizon + 1
+    if n < 1:
+        raise ValueError(f"{len(scaled)} months are too few for a {seq_length}-month window and a {horizon}-month horizon")
+    inputs = np.stack([scaled[i:i + seq_length] for i in range(n)])
+    targets = np.stack([scaled[i + seq_length:i + seq_length + horizon] for i in range(n)])
+    return inputs.astype(np.float32), targets.astype(np.float32)
+
+
+def build_model(seq_length, n_features, horizon):
+    """The recursive model's Conv1D/LSTM body with a (horizon, features) head"""
+    import keras
+
+    inputs = keras.Input((seq_length, n_features))
+    x = keras.layers.Conv1D(64, 3, activation='relu', padding='same')(inputs)
+    x = keras.layers.LSTM(128)(x)
+    x = keras.layers.Dropout(0.2)(x)
+    x = keras.layers.Dense(horizon * n_features)(x)
+    outputs = keras.layers.Reshape((horizon, n_features))(x)
+    model = keras.Model(inputs, outputs)
+    model.compile(optimizer='adam', loss='mse')
+    return model
+
+
+def train(name, horizon=DEFAULT_HORIZON, epochs=200, batch_size=16):
+    """Train a direct model on a store's scaled history and save it; returns (path, metadata)"""
+    from climatemap import forecast_store, matrix_store, preprocessing
+
+    store = matrix_store.open_store(forecast_store.STORES[name][1])
+    scaled = np.asarray(store.scaled, dtype=np.float32)
+    inputs, targets = training_windows(scaled, preprocessing.SEQ_LENGTH, horizon)
+    # A window with a month missing from the source is dropped rather than filled with a made-up value
+    complete = ~(np.isnan(inputs).any(axis=(1, 2)) | np.isnan(targets).any(axis=(1, 2)))
+    n_dropped = int(len(inputs) - complete.sum())
+    inputs, targets = inputs[complete], targets[complete]
+    if not len(inputs):
+        raise ValueError(f"every {preprocessing.SEQ_LENGTH + horizon}-month training window has a missing month")
+    n_val = max(1, int(len(inputs) * VALIDATION_SPLIT)) if len(inputs) > 1 else 0
+
+    model = build_model(preprocessing.SEQ_LENGTH, scaled.shape[1], horizon)
+    history = model.fit(
+        inputs[:len(inputs) - n_val], targets[:len(inputs) - n_val],
+        validation_data=(inputs[-n_val:], targets[-n_val:]) if n_val else None,
+        epochs=epochs, batch_size=batch_size, verbose=0,
+    )
+
+    import joblib
+
+    path = registry.path(model_name(name, horizon))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+    metadata = {
+        'store': name,
+        'horizon': horizon,
+        'seq_length': preprocessing.SEQ_LENGTH,
+        'columns': list(store.columns),
+        'data_version': store.data_version,
+        'train_windows': len(inputs) - n_val,
+        'dropped_windows': n_dropped,
+        'val_mse': float(history.history['val_loss'][-1]) if n_val else None,
+        'model_version': registry.digest(path),
+        'trained': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    with open(f'{os.path.splitext(path)[0]}.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return path, metadata
+
+
+@timed('predict_direct')
+def forecast(model, window, num_steps):
+    """Forecast ``num_steps`` months from one scaled (seq_length, features) window
+
+    Up to the model's horizon this is one forward pass; beyond it, each block's
+    last months become the next block's input.
+    """
+    window = np.asarray(window, dtype=np.float32)
+    seq_length = window.shape[0]
+    blocks = []
+    produced = 0
+    while produced < num_steps:
+        # A direct call skips predict()'s per-call setup, which dominates for one window
+        block = np.asarray(model(window[np.newaxis], training=False))[0]
+        blocks.append(block)
+        produced += len(block)
+        window = np.concatenate([window, block])[-seq_length:]
+    return np.concatenate(blocks)[:num_steps]
+
+
+def forecast_horizons(models, window, num_steps):
+    """Forecast ``num_steps`` months with ``{horizon: model}``, each month from the shortest model reaching it"""
+    horizons = sorted(models)
+    future = forecast(models[horizons[-1]], window, num_steps)
+    start = 0
+    for horizon in horizons[:-1]:
+        stop = min(horizon, num_steps)
+        if stop > start:
+            future[start:stop] = forecast(models[horizon], window, stop)[start:]
+        start = max(start, horizon)
+    return future
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a direct multi-step forecaster.')
+    parser.add_argument('name', choices=sorted(DIRECT_MODELS))
+    parser.add_argument('--horizons', type=int, nargs='+', default=list(HORIZONS), choices=HORIZONS,
+                        help='horizons to train, one model each (default: all)')
+    parser.add_argument('--epochs', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+    for horizon in sorted(set(args.horizons)):
+        try:
+            path, metadata = train(args.name, horizon, args.epochs, args.batch_size)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"{args.name}: wrote {path} (horizon {metadata['horizon']}, {metadata['train_windows']} windows, "
+              f"{metadata['dropped_windows']} dropped for missing months, val MSE {metadata['val_mse']})")
+
+
+if __name__ == '__main__':
+    main()
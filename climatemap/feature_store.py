@@ -0,0 +1,123 @@
+"""Engineered MLForecast features of the city history, materialized once per data version.
+
+``MLForecast.fit`` computes the lag, rolling and date features of every city
+before it fits the regressor. Here that matrix is written once to an
+uncompressed Feather file in ``data/.cache``, keyed by the city model and data
+versions. Refits map it back and go straight to ``fit_models``.
+
+After ``data.append`` adds months, only the new rows of the touched cities are
+computed, from the last ``lookback`` months of their history, and merged into
+the previous matrix. The fitted model's series state comes from a preprocess
+of the same short tail of every city, because that is all the recursive
+predictions read. Models whose features look back without bound (expanding
+windows, target transforms, global transforms) are fitted the usual way.
+"""
+import copy
+import os
+
+import pandas as pd
+
+from climatemap import data
+from climatemap.metrics import span
+from climatemap.registry import registry
+
+KEY_COLUMNS = ['unique_id', 'ds']
+
+
+def lookback(model):
+    """Months of history a city's newest feature row depends on, or None if unbounded"""
+    ts = model.ts
+    if ts.target_transforms:
+        return None
+    months = max(ts.lags or [0])
+    for lag, transforms in (ts.lag_transforms or {}).items():
+        for transform in transforms:
+            window = getattr(transform, 'window_size', None)
+            if window is None or getattr(transform, 'global_', False) or getattr(transform, 'groupby', None):
+                return None
+            months = max(months, lag + window * getattr(transform, 'season_length', 1) - 1)
+    return months
+
+
+def feature_path(model_version, data_version):
+    return os.path.join(data.CACHE_DIR, f'city-features-{model_version[:12]}-{data_version[:12]}.feather')
+
+
+def _tail(history, n):
+    """The last ``n`` rows of each city; history is sorted by city and date"""
+    return history.groupby('unique_id', observed=True, sort=False).tail(n)
+
+
+def _preprocess(model, history, dropna=True):
+    return model.preprocess(history, static_features=[], dropna=dropna).reset_index(drop=True)
+
+
+def _appended(model, history, previous_path, n):
+    """The previous matrix with the rows the last append added, or None if they are not all newer months"""
+    from pyarrow import feather
+
+    previous = feather.read_table(previous_path, memory_map=True).to_pandas()
+    from climatemap.city_forecast import changed_cities
+
+    touched = changed_cities()
+    rows = history[history['unique_id'].isin(touched)]
+    last = rows['unique_id'].map(previous.groupby('unique_id', sort=False)['ds'].max())
+    new = last.isna() | (rows['ds'] > last)
+    # A month inserted before a city's last one would change its existing feature rows
+    if (new.groupby(rows['unique_id'], sort=False).cummin() != new).any():
+        return None
+    from_end = rows.groupby('unique_id', sort=False).cumcount(ascending=False)
+    window = rows['unique_id'].map(new.groupby(rows['unique_id'], sort=False).sum()) + n
+    tail_model = copy.deepcopy(model)
+    with span('features_tail'):
+        prep = _preprocess(tail_model, rows[from_end < window], dropna=False)
+    fresh = prep.merge(rows.loc[new, KEY_COLUMNS], on=KEY_COLUMNS, how='inner')
+    # As a full preprocess does, drop rows of cities too short for every lag
+    fresh = fresh.dropna(subset=tail_model.ts.features)
+    merged = pd.concat([previous, fresh[previous.columns]], ignore_index=True)
+    return merged.sort_values(KEY_COLUMNS, kind='stable', ignore_index=True)
+
+
+def features(model, history):
+    """The feature matrix of the full prepared city history, from the store when possible"""
+    from pyarrow import feather
+
+    model_version, data_version = registry.version('city'), data.version('city')
+    path = feature_path(model_version, data_version)
+    if os.path.exists(path):
+        return feather.read_table(path, memory_map=True).to_pandas()
+
+    prep = None
+    appended = data.last_append('city')
+    n = lookback(model)
+    if appended is not None and n is not None:
+        previous_path = feature_path(model_version, appended['from'])
+        if os.path.exists(previous_path):
+            prep = _appended(model, history, previous_path, n)
+    if prep is None:
+        with span('features_compute'):
+            prep = _preprocess(copy.deepcopy(model), history)
+
+    os.makedirs(data.CACHE_DIR, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    prep.to_feather(tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+    # Matrices of older data versions are no longer read
+    prefix = f'city-features-{model_version[:12]}-'
+    for entry in os.listdir(data.CACHE_DIR):
+        if entry.startswith(prefix) and os.path.join(data.CACHE_DIR, entry) != path:
+            os.remove(os.path.join(data.CACHE_DIR, entry))
+    return prep
+
+
+def fit(model, history):
+    """Fit an MLForecast model on the prepared city history, reusing the stored feature matrix"""
+    n = lookback(model)
+    if n is None:
+        return model.fit(history, static_features=[])
+    prep = features(model, history)
+    # The series state the recursive predictions read: each city's last n months
+    model.preprocess(_tail(history, n), static_features=[], dropna=False)
+    with span('mlforecast_fit_models'):
+        model.fit_models(prep[model.ts.features_order_], prep['y'].to_numpy())
+    return model
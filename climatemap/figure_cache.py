@@ -0,0 +1,90 @@
+"""Process-wide cache of serialized plotly figures.
+
+Charts that depend only on static inputs (a city's history, a stored forecast,
+a map date) are built once and kept as plotly JSON, keyed by chart type, the
+city or country, the year and the data version. Entries are evicted least
+recently used first once the cache grows past its memory cap.
+
+A hit wraps the cached spec in a figure without validating it again, since it
+was valid when it was built. ``st.plotly_chart`` then only serializes it.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from climatemap.metrics import span
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def _figure(spec):
+    """A figure of a cached spec, skipping plotly's property validation"""
+    return go.Figure(json.loads(spec), _validate=False)
+
+
+class FigureCache:
+    """LRU cache of figure JSON specs with a cap on their total size"""
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._specs = OrderedDict()  # key -> JSON string
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._specs)
+
+    @property
+    def size(self):
+        """Total size of the cached specs in bytes"""
+        return self._size
+
+    def get(self, chart, key, year, version, build):
+        """Return the figure for a chart, calling ``build()`` only on a miss
+
+        ``build`` returns a plotly figure or None; None results are not cached.
+        """
+        cache_key = (chart, key, year, version)
+        with self._lock:
+            spec = self._specs.get(cache_key)
+            if spec is not None:
+                self._specs.move_to_end(cache_key)
+                self.hits += 1
+                return _figure(spec)
+            self.misses += 1
+
+        with span(f'figure:{chart}'):
+            fig = build()
+            if fig is None:
+                return None
+            spec = pio.to_json(fig, validate=False)
+        self._put(cache_key, spec)
+        return _figure(spec)
+
+    def _put(self, cache_key, spec):
+        size = len(spec)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._specs.pop(cache_key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._specs[cache_key] = spec
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._specs.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._specs.clear()
+            self._size = 0
+
+
+# Shared by all sessions and pages in this server process
+figure_cache = FigureCache()
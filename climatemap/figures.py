@@ -0,0 +1,341 @@
+"""Plotly figure builders of the country page and the dashboard.
+
+The pages call these through ``figure_cache``, and ``benchmarks/run_benchmarks.py``
+times the same functions, so a benchmark run measures what the pages build.
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+from climatemap.decimate import decimate, max_points
+
+
+# --- Country page ---
+
+def create_country_heatmap(heatmap_data, country, month_names):
+    """Build the months x years heatmap of one country's forecast"""
+    country_df = heatmap_data[[country, 'Year', 'Month']].copy()
+    country_df = country_df.rename(columns={country: 'Temperature'})
+
+    # Create pivot table for heatmap (Months vs. Years)
+    heatmap_pivot = country_df.pivot_table(index='Month', columns='Year', values='Temperature')
+
+    sorted_months = sorted(heatmap_pivot.index)
+    sorted_months = sorted_months[::-1]
+
+    # Build heatmap figure
+    heatmap_fig = go.Figure(data=go.Heatmap(
+        x=heatmap_pivot.columns,  # Years
+        #y=[month_names[m] for m in heatmap_pivot.index],  # Month names
+        z=heatmap_pivot.loc[sorted_months].values,
+        y=[month_names[m] for m in sorted_months],
+        colorscale='RdBu',
+        colorbar=dict(title='Temperature (°C)'),
+        reversescale=True,
+        hovertemplate='Year: %{x}<br>Month: %{y}<br>Temperature: %{z}°C<extra></extra>'
+    ))
+
+    heatmap_fig.update_layout(
+        title=f'Monthly Temperature Heatmap by Year - {country}',
+        xaxis_title='Year',
+        yaxis_title='Month',
+        title_font=dict(size=22),
+        xaxis_title_font=dict(size=18),
+        yaxis_title_font=dict(size=18),
+        xaxis=dict(tickangle=-45)
+    )
+    return heatmap_fig
+
+
+def create_choropleth(map_df, title, common_min, common_max):
+    """Build a map of Africa coloured by each country's temperature"""
+    import plotly.express as px  # deferred: only needed on a figure cache miss
+
+    return px.choropleth(
+        map_df,
+        locations='Country',
+        locationmode='country names',
+        color='Temperature',
+        scope='africa',
+        color_continuous_scale='RdBu_r',
+        range_color=(common_min, common_max),
+        title=title
+    )
+
+
+# --- Dashboard ---
+
+def create_climate_heatmap(city_data, selected_city):
+    """Create an enhanced climate stripes style heatmap with anomaly data for a single city"""
+    if not selected_city:
+        return None
+
+    # city_data holds only the selected city's rows, already sorted by year
+    if city_data.empty:
+        return None
+
+    # Create heatmap with anomaly scale (single row for the city)
+    fig = go.Figure(data=go.Heatmap(
+        z=[city_data['temperature_anomaly'].values],
+        x=city_data['year'].values,
+        y=[selected_city],
+        zmin=-3,
+        zmax=3,
+        colorscale='RdBu_r',
+        showscale=False,
+        hovertemplate='<b>%{y}</b><br>' +
+                      'Year: %{x}<br>' +
+                      'Anomaly: %{z:.2f}°C<br>' +
+                      '<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title=f"Historical Heatmap Temperature Anomalies for {selected_city}",
+        paper_bgcolor='rgba(255,255,255,0.95)',
+        margin=dict(l=40, r=40, t=60, b=40),
+        xaxis_title="Year",
+        yaxis=dict(showticklabels=False, gridcolor='rgba(0,0,0,0.1)'),
+        height=350,
+        font=dict(size=12),
+        title_font=dict(size=16, color='#2c3e50'),
+        xaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
+        autosize=True
+    )
+
+    return fig
+
+
+def create_yearly_monthly_trend_chart(city_pred_data, selected_city, selected_year):
+    """Create a line chart showing monthly predicted temperature trends for a specific year"""
+    if not selected_city or not selected_year:
+        return None
+
+    city_data = city_pred_data[city_pred_data['year'] == selected_year]
+
+    if city_data.empty:
+        return None
+
+    # Sort by month to ensure proper order
+    city_data = city_data.sort_values('month')
+
+    fig = go.Figure()
+
+    # Add predicted temperature line
+    fig.add_trace(go.Scatter(
+        x=city_data['month_name'],
+        y=city_data['temperature'],
+        mode='lines+markers',
+        name=f'Predicted Temperature {selected_year}',
+        line=dict(color='#FF8C00', width=3),
+        marker=dict(size=8, color='#FF8C00'),
+        hovertemplate='Month: %{x}<br>Predicted Temperature: %{y:.1f}°C<extra></extra>'
+    ))
+
+    # Add trend line across months
+    x_numeric = np.arange(len(city_data))
+    z = np.polyfit(x_numeric, city_data['temperature'], 1)
+    p = np.poly1d(z)
+    fig.add_trace(go.Scatter(
+        x=city_data['month_name'],
+        y=p(x_numeric),
+        mode='lines',
+        name=f'Monthly Trend {selected_year}',
+        line=dict(color='#DC143C', width=3, dash='dash'),
+        hovertemplate='Month: %{x}<br>Trend: %{y:.1f}°C<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title=f"Monthly Temperature Predictions for {selected_city} - {selected_year}",
+        plot_bgcolor='rgba(255,255,255,0.9)',
+        paper_bgcolor='rgba(255,255,255,0.95)',
+        margin=dict(l=40, r=40, t=60, b=40),
+        xaxis_title="Month",
+        yaxis_title="Temperature (°C)",
+        height=400,
+        font=dict(size=12),
+        title_font=dict(size=16, color='#2c3e50'),
+        xaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
+        yaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
+        legend=dict(
+            bgcolor='rgba(255,255,255,0.8)',
+            bordercolor='rgba(0,0,0,0.2)',
+            borderwidth=1
+        ),
+        autosize=True
+    )
+
+    return fig
+
+
+def create_yearly_monthly_heatmap(city_pred_data, selected_city, selected_year):
+    """Create a monthly heatmap for a specific year showing temperature anomalies"""
+    if not selected_city or not selected_year:
+        return None
+
+    # Filter the city's predictions for the selected year
+    city_data = city_pred_data[city_pred_data['year'] == selected_year]
+
+    if city_data.empty:
+        return None
+
+    # Sort by month
+    city_data = city_data.sort_values('month')
+
+    # Create heatmap with months on x-axis and single row
+    fig = go.Figure(data=go.Heatmap(
+        z=[city_data['temperature_anomaly'].values],
+        x=city_data['month_name'].values,
+        y=[selected_city],
+        zmin=-3,
+        zmax=3,
+        colorscale='RdBu_r',
+        showscale=True,
+        colorbar=dict(title="Anomaly (°C)"),
+        hovertemplate='<b>%{y}</b><br>' +
+                      'Month: %{x}<br>' +
+                      'Predicted Anomaly: %{z:.2f}°C<br>' +
+                      '<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title=f"Heatmap Monthly Temperature Anomalies for {selected_city} - {selected_year}",
+        paper_bgcolor='rgba(255,255,255,0.95)',
+        margin=dict(l=40, r=40, t=60, b=40),
+        xaxis_title="Month",
+        yaxis=dict(showticklabels=False, gridcolor='rgba(0,0,0,0.1)'),
+        height=400,
+        font=dict(size=12),
+        title_font=dict(size=16, color='#2c3e50'),
+        xaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
+        autosize=True
+    )
+
+    return fig
+
+
+def create_temperature_trend_chart(city_data, selected_city):
+    """Create a line chart showing temperature trends for the selected city"""
+    if not selected_city:
+        return None
+
+    # city_data holds only the selected city's rows, already sorted by year
+
+    if city_data.empty:
+        return None
+
+    fig = go.Figure()
+
+    # Add temperature line, decimated to about one point per pixel for long histories
+    years, temperatures = decimate(city_data['year'], city_data['temperature'], max_points())
+    fig.add_trace(go.Scatter(
+        x=years,
+        y=temperatures,
+        mode='lines+markers',
+        name='Historical Temperature',
+        line=dict(color='#4B9CD3', width=3),
+        marker=dict(size=6, color='#4B9CD3'),
+        hovertemplate='Year: %{x}<br>Temperature: %{y:.1f}°C<extra></extra>'
+    ))
+
+    # Add trend line
+    # Fitted on every year; a straight line only needs its two end points
+    z = np.polyfit(city_data['year'], city_data['temperature'], 1)
+    p = np.poly1d(z)
+    trend_years = city_data['year'].iloc[[0, -1]]
+    fig.add_trace(go.Scatter(
+        x=trend_years,
+        y=p(trend_years),
+        mode='lines',
+        name='Historical Trend',
+        line=dict(color='#FF0000', width=4, dash='dash'),
+        hovertemplate='Year: %{x}<br>Trend: %{y:.1f}°C<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title=f"Historical Temperature Trend for {selected_city}",
+        plot_bgcolor='rgba(255,255,255,0.9)',
+        paper_bgcolor='rgba(255,255,255,0.95)',
+        margin=dict(l=40, r=40, t=60, b=40),
+        xaxis_title="Year",
+        yaxis_title="Temperature (°C)",
+        height=350,
+        font=dict(size=12),
+        title_font=dict(size=16, color='#2c3e50'),
+        xaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
+        yaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
+        legend=dict(
+            bgcolor='rgba(255,255,255,0.8)',
+            bordercolor='rgba(0,0,0,0.2)',
+            borderwidth=1
+        ),
+        autosize=True
+    )
+
+    return fig
+
+
+def create_city_map(map_layers, map_center, map_zoom, trim=False):
+    """Create the map of the latest year's average temperature, one point per city cluster
+
+    Every cluster of the zoom level is sent, so panning and zooming out on the
+    client still show the other cities; ``trim`` keeps only those in the initial view.
+    """
+    level = map_layers.level(map_zoom)
+    cells = map_layers.view(map_center, map_zoom) if trim else np.arange(len(level))
+    counts = level.count[cells]
+    temperatures = level.temperature[cells]
+
+    hover = []
+    for cell, count, temperature in zip(cells, counts, temperatures):
+        if count == 1:
+            i = level.first[cell]
+            hover.append(f"<b>{map_layers.cities[i]}</b><br>{map_layers.countries[i]}<br>{temperature:.1f}°C")
+        else:
+            hover.append(f"<b>{count} cities</b><br>{temperature:.1f}°C on average<br>Click to zoom in")
+
+    fig_map = go.Figure(go.Scattermapbox(
+        lat=np.round(level.lat[cells], 4),
+        lon=np.round(level.lng[cells], 4),
+        mode="markers",
+        # Clusters grow with the number of cities they hold
+        marker=dict(
+            size=np.minimum(13 + 4 * np.log2(counts), 34).round(1),
+            color=np.round(temperatures, 1),
+            colorscale="RdBu_r",
+            showscale=True,
+        ),
+        customdata=cells,
+        hovertext=hover,
+        hoverinfo="text",
+    ))
+    fig_map.update_layout(
+        mapbox=dict(style="carto-positron", center=map_center, zoom=map_zoom),
+        height=700, width=1500, margin=dict(l=0, r=0, t=30, b=0),
+    )
+    fig_map.update_traces(
+        marker_colorbar=dict(
+            title="Average Temperature(°C) 2025",
+            title_side='top',
+            title_font=dict(
+                color='black',
+                size=14
+            ),
+            tickfont=dict(
+                color='black',
+                size=12
+            ),
+            x=0.70,
+            y=0.05,
+            xanchor='left',
+            yanchor='bottom',
+            orientation='h',
+            len=0.3,
+            thickness=15
+        )
+    )
+    fig_map.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+    )
+
+    return fig_map
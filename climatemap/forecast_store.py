@@ -0,0 +1,170 @@
+"""Precomputed 2025-2030 forecasts for the country and subnational pages.
+
+Both pages always forecast from the last 12 months of a fixed dataset, so every
+user gets the same numbers. The forecast is built offline and saved as a
+compressed NPZ file, tagged with the digests of the model and the data it was
+built from. Pages slice the file through ``forecast`` and only fall back to running the
+model when it is missing or stale.
+
+Each store has a ``recursive`` forecast, rolled out month by month by the
+CNN-LSTM, and, once a direct model is trained (see ``climatemap.direct``), a
+``direct`` one predicted in a single pass.
+
+Build or refresh the stores with:
+    python -m climatemap.forecast_store [country] [subnational] [--method direct]
+"""
+import argparse
+import datetime
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from climatemap import data, preprocessing
+from climatemap.registry import registry
+
+STORE_DIR = 'data/forecasts'
+
+# 2025-2030, the longest range offered by the page sliders
+FORECAST_STEPS = 72
+
+# Store name -> (model name, data source)
+STORES = {
+    'country': ('country', 'country'),
+    'subnational': ('subnational', 'subnational'),
+}
+
+# How a forecast is produced: month-by-month rollout or one direct pass
+METHODS = ('recursive', 'direct')
+
+_loaded = {}  # store path -> ((mtime_ns, size), contents)
+_loaded_lock = threading.Lock()
+_computed = {}  # (store name, method) -> ((model version, data version), forecast frame)
+_compute_locks = {(name, method): threading.Lock() for name in STORES for method in METHODS}
+
+
+def model_version(name, method='recursive'):
+    """Digest of the model(s) behind a store's forecast"""
+    if method == 'direct':
+        from climatemap import direct
+
+        return direct.version(name)
+    return registry.version(STORES[name][0])
+
+
+def store_path(name, method='recursive'):
+    suffix = '' if method == 'recursive' else f'-{method}'
+    return os.path.join(STORE_DIR, f'{name}{suffix}.npz')
+
+
+def compute(name, num_steps=FORECAST_STEPS, method='recursive'):
+    """Run the model for at least the full store range, once per model and data version
+
+    Concurrent callers for the same store wait for a single model call and
+    share its result.
+    """
+    source = STORES[name][1]
+    key = (model_version(name, method), data.version(source))
+    with _compute_locks[name, method]:
+        cached = _computed.get((name, method))
+        if cached is None or cached[0] != key or len(cached[1]) < num_steps:
+            stage = preprocessing.get_stage(source)
+            steps = max(num_steps, FORECAST_STEPS)
+            if method == 'direct':
+                from climatemap import direct
+
+                future_scaled = direct.forecast_horizons(direct.load(name), stage.last_window, steps)
+            else:
+                from climatemap.batching import predict_future
+
+                future_scaled = predict_future(STORES[name][0], stage.last_window, steps, preprocessing.SEQ_LENGTH)
+            future = stage.scaler.inverse_transform(future_scaled).astype(np.float32)
+            cached = _computed[name, method] = (key, pd.DataFrame(future, columns=stage.pivot.columns))
+    return cached[1].iloc[:num_steps]
+
+
+def build(name, steps=FORECAST_STEPS, method='recursive'):
+    """Run the model over the full forecast range and write the store file"""
+    source = STORES[name][1]
+    stage = preprocessing.get_stage(source)
+    future = compute(name, steps, method)
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    path = store_path(name, method)
+    np.savez_compressed(
+        path,
+        values=future.to_numpy(),
+        columns=np.array(stage.pivot.columns, dtype=str),
+        last_date=str(stage.pivot.index[-1].date()),
+        model_hash=model_version(name, method),
+        data_hash=stage.data_version,
+        created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    )
+    return path
+
+
+def _load(path):
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != signature:
+            with np.load(path) as npz:
+                contents = {key: npz[key] for key in npz.files}
+            cached = _loaded[path] = (signature, contents)
+        return cached[1]
+
+
+def read(name, num_steps, method='recursive'):
+    """Return the first ``num_steps`` forecast months as a DataFrame, or None if the store is missing or stale"""
+    source = STORES[name][1]
+    path = store_path(name, method)
+    if not os.path.exists(path):
+        return None
+    contents = _load(path)
+    if (str(contents['model_hash']) != model_version(name, method)
+            or str(contents['data_hash']) != data.version(source)
+            or num_steps > len(contents['values'])):
+        return None
+    return pd.DataFrame(contents['values'][:num_steps], columns=contents['columns'])
+
+
+def forecast(name, num_steps, method='recursive'):
+    """First ``num_steps`` forecast months, from the store or from the model if the store is missing or stale"""
+    stored = read(name, num_steps, method)
+    if stored is not None:
+        return stored
+    return compute(name, num_steps, method)
+
+
+def forecast_dates(name, num_steps):
+    """Month-start dates of the first ``num_steps`` forecast months"""
+    last_date = preprocessing.get_stage(STORES[name][1]).pivot.index[-1]
+    return pd.date_range(start=last_date + pd.DateOffset(months=1), periods=num_steps, freq='MS')
+
+
+def year_steps(name, first_year, last_year):
+    """Store rows (start, stop) of the forecast months from January of ``first_year`` to December of ``last_year``"""
+    first = forecast_dates(name, 1)[0]
+    start = max(12 * (first_year - first.year) - (first.month - 1), 0)
+    stop = max(12 * (last_year + 1 - first.year) - (first.month - 1), start)
+    return start, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the precomputed forecast stores.')
+    parser.add_argument('names', nargs='*', help=f"stores to build (default: {' '.join(sorted(STORES))})")
+    parser.add_argument('--method', default='recursive', help=f"one of {', '.join(METHODS)}")
+    args = parser.parse_args()
+    if args.method not in METHODS:
+        parser.error(f"unknown method: {args.method}")
+    unknown = set(args.names) - set(STORES)
+    if unknown:
+        parser.error(f"unknown store: {', '.join(sorted(unknown))}")
+    for name in args.names or sorted(STORES):
+        print(f"{name}: wrote {build(name, method=args.method)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Autoregressive rollout for the CNN-LSTM forecasters.
+
+The pages used to call ``model.predict`` once per forecast month and shift the
+input window with ``np.roll``. Here the whole rollout runs as one compiled
+TensorFlow loop per model, so a forecast costs a single graph call whatever
+the horizon, and a batch of windows is rolled out together.
+"""
+import threading
+import weakref
+
+import numpy as np
+
+from climatemap.metrics import timed
+
+# id(model) -> compiled rollout, dropped when the model is garbage collected
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def _is_keras_model(model):
+    return type(model).__module__.startswith(('keras', 'tensorflow'))
+
+
+def _build_rollout(model):
+    import tensorflow as tf
+
+    # A weak reference lets a hot-swapped model be collected along with its graph
+    model_ref = weakref.ref(model)
+
+    @tf.function(reduce_retracing=True)
+    def rollout(windows, num_steps):
+        batch_size = tf.shape(windows)[0]
+        outputs = tf.TensorArray(windows.dtype, size=num_steps)
+
+        def step(i, window, outputs):
+            prediction = model_ref()(window, training=False)
+            prediction = tf.reshape(tf.cast(prediction, window.dtype), [batch_size, -1])
+            outputs = outputs.write(i, prediction)
+            # Slide the window: drop the oldest month and append the prediction
+            window = tf.concat([window[:, 1:, :], prediction[:, tf.newaxis, :]], axis=1)
+            return i + 1, window, outputs
+
+        _, _, outputs = tf.while_loop(
+            lambda i, window, outputs: i < num_steps,
+            step,
+            (tf.constant(0), windows, outputs),
+        )
+        # (steps, batch, features) -> (batch, steps, features)
+        return tf.transpose(outputs.stack(), [1, 0, 2])
+
+    return rollout
+
+
+def _compiled_rollout(model):
+    key = id(model)
+    with _compiled_lock:
+        if key not in _compiled:
+            _compiled[key] = _build_rollout(model)
+            weakref.finalize(model, _compiled.pop, key, None)
+        return _compiled[key]
+
+
+def _rollout_eager(predict, windows, num_steps):
+    """Roll out with any ``predict`` callable over a preallocated history buffer"""
+    batch_size, seq_length, n_features = windows.shape
+    history = np.empty((batch_size, seq_length + num_steps, n_features), dtype=windows.dtype)
+    history[:, :seq_length] = windows
+    for i in range(num_steps):
+        # history[:, i:i + seq_length] is a view, so no window is ever copied
+        prediction = predict(history[:, i:i + seq_length])
+        history[:, seq_length + i] = np.reshape(prediction, (batch_size, n_features))
+    return history[:, seq_length:]
+
+
+@timed('predict_future')
+def rollout(model, windows, num_steps):
+    """Forecast ``num_steps`` months for a batch of windows shaped (batch, seq_length, features)"""
+    windows = np.asarray(windows, dtype=np.float32)
+    if num_steps <= 0:
+        return np.empty((windows.shape[0], 0, windows.shape[2]), dtype=np.float32)
+    if _is_keras_model(model):
+        import tensorflow as tf
+
+        compiled = _compiled_rollout(model)
+        return compiled(tf.constant(windows), tf.constant(num_steps, dtype=tf.int32)).numpy()
+    return _rollout_eager(model.predict, windows, num_steps)
+
+
+def predict_future(model, last_sequence, num_steps, seq_length):
+    """Drop-in replacement for the pages' step-by-step ``predict_future``"""
+    windows = np.asarray(last_sequence).reshape(1, seq_length, -1)
+    return rollout(model, windows, num_steps)[0]
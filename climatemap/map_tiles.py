@@ -0,0 +1,131 @@
+"""Zoom-dependent clusters of the dashboard's city map.
+
+Every city is placed on a web-mercator quadtree. Its Morton code interleaves
+the bits of its cell column and row at the finest zoom, so the cell at a
+coarser zoom is the same code shifted right. The cities are sorted by code
+once. At each zoom level, the cities sharing a cell are then a contiguous run.
+The run is reduced to one point with the cell's city count, centroid and mean
+temperature, kept as compact NumPy arrays.
+
+A map sends every cell of its zoom level, so panning or zooming out on the
+client still shows the other clusters. At coarse zooms a level holds far fewer
+cells than cities. ``view`` can trim a level to the cells inside a viewport
+when the map will not be panned. A cell's run of cities is also the click
+index: clicking a cell maps straight back to its cities.
+"""
+import math
+
+import numpy as np
+
+# Grid cells are CELL_PIXELS wide on screen: 256 / 32 = 8 cells per tile
+TILE_PIXELS = 256
+CELL_PIXELS = 32
+CELL_BITS = 3  # log2(TILE_PIXELS / CELL_PIXELS)
+
+# Finest zoom with its own level; closer views use it too
+MAX_ZOOM = 16
+
+MAX_LATITUDE = 85.05112878  # web-mercator limit
+
+
+def _mercator(lat, lng):
+    """Fractions (0-1) of the world's width and height, from the top left"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    x = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+    y = 0.5 - np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) / (2 * np.pi)
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+def _spread(v):
+    """Insert a zero bit after each of the low 32 bits"""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def _compact(v):
+    """Inverse of _spread"""
+    v = v & np.uint64(0x5555555555555555)
+    for shift, mask in ((1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                        (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)):
+        v = (v | (v >> np.uint64(shift))) & np.uint64(mask)
+    return v.astype(np.int64)
+
+
+class Level:
+    """The cells of one zoom level that hold at least one city"""
+
+    def __init__(self, zoom, codes, lat, lng, temperature):
+        shift = np.uint64(2 * (MAX_ZOOM - zoom))
+        keys = codes >> shift
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        self.zoom = zoom
+        self.first = starts.astype(np.int32)  # cells' runs in the sorted cities
+        self.count = np.diff(np.r_[starts, len(keys)]).astype(np.int32)
+        self.x = _compact(keys[starts])
+        self.y = _compact(keys[starts] >> np.uint64(1))
+        self.lat = (np.add.reduceat(lat, starts) / self.count).astype(np.float32)
+        self.lng = (np.add.reduceat(lng, starts) / self.count).astype(np.float32)
+        finite = np.isfinite(temperature)
+        totals = np.add.reduceat(np.where(finite, temperature, 0.0), starts)
+        counts = np.add.reduceat(finite.astype(np.int64), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.temperature = np.where(counts > 0, totals / counts, np.nan).astype(np.float32)
+
+    def __len__(self):
+        return len(self.first)
+
+
+class MapLayers:
+    """Per-zoom city clusters of a table with city, latitude, lng, temperature and country_name"""
+
+    def __init__(self, df):
+        df = df[np.isfinite(df['latitude'].to_numpy(dtype=np.float64)) & np.isfinite(df['lng'].to_numpy(dtype=np.float64))]
+        x, y = _mercator(df['latitude'], df['lng'])
+        cells = 1 << (MAX_ZOOM + CELL_BITS)
+        codes = _spread((x * cells).astype(np.int64)) | (_spread((y * cells).astype(np.int64)) << np.uint64(1))
+        order = np.argsort(codes, kind='stable')
+
+        self.codes = codes[order]
+        self.cities = df['city'].to_numpy()[order].astype(str)
+        self.countries = df['country_name'].to_numpy()[order]
+        self.lat = df['latitude'].to_numpy(dtype=np.float64)[order]
+        self.lng = df['lng'].to_numpy(dtype=np.float64)[order]
+        self.temperature = df['temperature'].to_numpy(dtype=np.float64)[order]
+        self.levels = [Level(zoom, self.codes, self.lat, self.lng, self.temperature) for zoom in range(MAX_ZOOM + 1)]
+
+    def level(self, zoom):
+        return self.levels[int(min(max(math.floor(zoom), 0), MAX_ZOOM))]
+
+    def view(self, center, zoom, width=1500, height=700):
+        """Indices into ``level(zoom)`` of the cells inside a width x height pixel viewport"""
+        level = self.level(zoom)
+        cells = 1 << (level.zoom + CELL_BITS)
+        x, y = _mercator(center['lat'], center['lon'])
+        # Viewport half-extent in cells, plus one so edge clusters are kept
+        half_x = width / 2 / CELL_PIXELS * 2 ** (zoom - level.zoom) + 1
+        half_y = height / 2 / CELL_PIXELS * 2 ** (zoom - level.zoom) + 1
+        in_x = np.abs(level.x - float(x) * cells) <= half_x
+        in_x |= np.abs(level.x - float(x) * cells) >= cells - half_x  # across the antimeridian
+        in_y = np.abs(level.y - float(y) * cells) <= half_y
+        return np.flatnonzero(in_x & in_y)
+
+    def members(self, level, cell):
+        """Slice of ``cities`` in a cell of a level"""
+        first = int(level.first[cell])
+        return slice(first, first + int(level.count[cell]))
+
+    def expand_zoom(self, level, cell):
+        """The first zoom at which a cell's cities fall into more than one cell, or None if they never do
+
+        Cities at (nearly) the same location share a cell even at ``MAX_ZOOM``;
+        zooming cannot separate them, so they are listed by ``members`` instead.
+        """
+        codes = self.codes[self.members(level, cell)]
+        for zoom in range(level.zoom + 1, MAX_ZOOM + 1):
+            keys = codes >> np.uint64(2 * (MAX_ZOOM - zoom))
+            if keys[0] != keys[-1]:
+                return zoom
+        return None
@@ -0,0 +1,181 @@
+"""Shared, memory-mapped float32 pivot matrices.
+
+The first process that needs the country or subnational matrix pivots the
+source and fits its MinMaxScaler. It writes the raw and the scaled values as
+float32 ``.npy`` files, next to a JSON file that holds the column names,
+dates and scaler min/max. Every other process and session maps the same
+files read-only. They share the OS page cache instead of each holding its
+own float64 pivot and scaled copy, and none of them pivots or refits.
+
+When the source only had rows appended (``data.append``), the next version
+is derived from the previous matrices. The new rows are folded in and the
+min/max bounds are widened. Only the new cells, and the columns whose bounds
+moved, are rescaled.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from climatemap import data
+from climatemap.metrics import span
+
+_stores = {}  # source name -> MatrixStore
+_lock = threading.Lock()
+
+
+def _paths(name, data_version):
+    stem = os.path.join(data.CACHE_DIR, f'{name}-{data_version[:12]}-matrix')
+    return f'{stem}.npy', f'{stem}-scaled.npy', f'{stem}.json'
+
+
+def _save(path, array):
+    tmp_path = f'{path}.{os.getpid()}.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def build(name):
+    """Pivot a source, fit its scaler and write the matrix files"""
+    from sklearn.preprocessing import MinMaxScaler
+
+    from climatemap.preprocessing import PIVOTS
+
+    data_version = data.version(name)
+    df = data.load(name)
+    with span('pivot'):
+        df_pivot = PIVOTS[name](df)
+    with span('scaler_fit'):
+        scaler = MinMaxScaler().fit(df_pivot)
+    _write(name, data_version, df_pivot.columns, df_pivot.index, df_pivot.to_numpy(dtype=np.float32),
+           scaler.transform(df_pivot).astype(np.float32), scaler.data_min_, scaler.data_max_)
+
+
+def _scale(values, data_min, data_max):
+    """MinMaxScaler.transform for the given bounds, computed the way sklearn does"""
+    data_range = data_max - data_min
+    # Constant columns are scaled by 1, as sklearn does
+    data_range = np.where(np.isfinite(data_range) & (data_range > 10 * np.finfo(np.float64).eps), data_range, 1.0)
+    scale = 1.0 / data_range
+    scaled = np.array(values, dtype=np.float32)
+    scaled *= scale
+    scaled += -data_min * scale
+    return scaled
+
+
+def append(name, old_version, new_rows):
+    """Write the current version's matrices from the previous version's plus appended rows
+
+    Returns the columns the rows touched, or None after a full ``build``. That
+    happens when the previous matrices are gone or the rows add a column.
+    """
+    from climatemap.preprocessing import PIVOTS
+
+    data_version = data.version(name)
+    if not os.path.exists(_paths(name, old_version)[2]):
+        build(name)
+        return None
+    old = MatrixStore(name, old_version)
+    with span('pivot_append'):
+        new_pivot = PIVOTS[name](new_rows)
+    new_pivot.index = pd.to_datetime(new_pivot.index)
+    if not set(new_pivot.columns) <= set(old.columns):
+        build(name)
+        return None
+
+    new_pivot = new_pivot.reindex(columns=old.columns).astype(np.float32)
+    combined = new_pivot.combine_first(old.frame())[old.columns]
+    values = combined.to_numpy(dtype=np.float32)
+
+    # Appended values can only widen each column's bounds
+    new_values = new_pivot.to_numpy(dtype=np.float64)
+    data_min = np.fmin(old._data_min, np.fmin.reduce(new_values, axis=0, initial=np.inf))
+    data_max = np.fmax(old._data_max, np.fmax.reduce(new_values, axis=0, initial=-np.inf))
+    moved = ~(np.isclose(data_min, old._data_min, rtol=0, atol=0, equal_nan=True)
+              & np.isclose(data_max, old._data_max, rtol=0, atol=0, equal_nan=True))
+
+    scaled = np.empty(values.shape, dtype=np.float32)
+    scaled[combined.index.get_indexer(old.index)] = old.scaled
+    touched = combined.index.get_indexer(new_pivot.index)
+    scaled[touched] = _scale(values[touched], data_min, data_max)
+    scaled[:, moved] = _scale(values[:, moved], data_min[moved], data_max[moved])
+
+    _write(name, data_version, combined.columns, combined.index, values, scaled, data_min, data_max)
+    return [col for col in new_pivot.columns if new_pivot[col].notna().any()]
+
+
+def _write(name, data_version, columns, index, values, scaled, data_min, data_max):
+    values_path, scaled_path, meta_path = _paths(name, data_version)
+    os.makedirs(data.CACHE_DIR, exist_ok=True)
+    _save(values_path, values)
+    _save(scaled_path, scaled)
+    meta = {
+        'data_version': data_version,
+        'columns': [str(col) for col in columns],
+        'index': [str(date.date()) for date in pd.to_datetime(index)],
+        'data_min': np.asarray(data_min).tolist(),
+        'data_max': np.asarray(data_max).tolist(),
+    }
+    # The metadata is written last, so its presence means the matrices are complete
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+    # Matrices of older data versions are no longer read
+    prefix = f'{name}-'
+    current = {os.path.basename(p) for p in (values_path, scaled_path, meta_path)}
+    for entry in os.listdir(data.CACHE_DIR):
+        if entry.startswith(prefix) and '-matrix' in entry and entry not in current:
+            os.remove(os.path.join(data.CACHE_DIR, entry))
+
+
+class MatrixStore:
+    """Read-only views over a source's mapped matrices"""
+
+    def __init__(self, name, data_version):
+        values_path, scaled_path, meta_path = _paths(name, data_version)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.name = name
+        self.data_version = data_version
+        self.columns = pd.Index(meta['columns'])
+        self.index = pd.DatetimeIndex(meta['index'])
+        self.values = np.load(values_path, mmap_mode='r')  # dates x columns, °C
+        self.scaled = np.load(scaled_path, mmap_mode='r')  # dates x columns, scaled to [0, 1]
+        self._data_min = np.asarray(meta['data_min'], dtype=np.float64)
+        self._data_max = np.asarray(meta['data_max'], dtype=np.float64)
+
+    def frame(self):
+        """The pivot as a DataFrame backed by the mapped values (no copy)"""
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+    def scaler(self):
+        """A MinMaxScaler equal to the one fitted on the full pivot"""
+        from sklearn.preprocessing import MinMaxScaler
+
+        # Fitting on just the column minima and maxima reproduces every fitted attribute
+        bounds = pd.DataFrame([self._data_min, self._data_max], columns=self.columns)
+        return MinMaxScaler().fit(bounds)
+
+    def last_window(self, seq_length):
+        return np.array(self.scaled[-seq_length:])
+
+
+def open_store(name):
+    """Return the mapped store of a source, building its files if they are missing or stale"""
+    data_version = data.version(name)
+    with _lock:
+        store = _stores.get(name)
+        if store is not None and store.data_version == data_version:
+            return store
+        if not os.path.exists(_paths(name, data_version)[2]):
+            appended = data.last_append(name)
+            if appended is not None:
+                append(name, appended['from'], data.appended_rows(name))
+            else:
+                build(name)
+        store = _stores[name] = MatrixStore(name, data_version)
+        return store
@@ -0,0 +1,164 @@
+"""Per-stage timing histograms for the pages and the forecast service.
+
+Wrap a stage in ``with span('pivot'):`` or decorate it with ``@timed('load')``.
+Each duration is recorded in a histogram keyed by (page, stage). The page
+label comes from ``set_page``, which each page calls once per rerun.
+Histograms are shared by every session of the server process. They can be
+read as Prometheus text (``prometheus_text``, also served at ``/metrics`` by
+``climatemap.service``), written to a JSON file (``write_json``, done
+automatically when ``CLIMATEMAP_METRICS_FILE`` is set) or shown on a page
+with ``debug_panel``.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, Prometheus style; +Inf is implied
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# JSON snapshot written at most every METRICS_FILE_INTERVAL seconds when set
+METRICS_FILE = os.environ.get('CLIMATEMAP_METRICS_FILE')
+METRICS_FILE_INTERVAL = 10.0
+
+_page = contextvars.ContextVar('climatemap_page', default='')
+
+
+class Histogram:
+    """Bucketed durations with their count, sum and maximum"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last is the +Inf overflow
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count, 'sum': self.sum, 'max': self.max,
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+        }
+
+
+class Metrics:
+    """Histograms keyed by (page, stage)"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+
+    def observe(self, stage, seconds, page=None):
+        key = (_page.get() if page is None else page, stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+        if METRICS_FILE and time.monotonic() - self._last_write > METRICS_FILE_INTERVAL:
+            self._last_write = time.monotonic()
+            self.write_json(METRICS_FILE)
+
+    def snapshot(self, page=None):
+        """{(page, stage): Histogram} copy, optionally for one page"""
+        with self._lock:
+            items = list(self._histograms.items())
+        return {key: histogram for key, histogram in items if page is None or key[0] == page}
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def prometheus_text(self):
+        lines = [
+            '# HELP climatemap_stage_seconds Time spent in each page stage',
+            '# TYPE climatemap_stage_seconds histogram',
+        ]
+        for (page, stage), histogram in sorted(self.snapshot().items()):
+            labels = f'page="{page}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip([str(b) for b in histogram.buckets] + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'climatemap_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'climatemap_stage_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'climatemap_stage_seconds_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        body = {f'{page}/{stage}': histogram.to_dict() for (page, stage), histogram in self.snapshot().items()}
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'written': time.time(), 'stages': body}, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+# Shared by all sessions and pages in this server process
+metrics = Metrics()
+
+
+def set_page(page):
+    """Label the spans of the current rerun (or request) with a page name"""
+    _page.set(page)
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as ``stage`` of the current page"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """Decorator form of ``span``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def debug_panel(st, page=None):
+    """Render this process's stage timings in a collapsed expander
+
+    Shown only when the page URL has ``?debug=1`` or CLIMATEMAP_DEBUG is set.
+    """
+    if not (os.environ.get('CLIMATEMAP_DEBUG') or st.query_params.get('debug') == '1'):
+        return
+    page = _page.get() if page is None else page
+    rows = [
+        {
+            'stage': stage, 'calls': h.count, 'mean ms': round(1000 * h.sum / h.count, 1),
+            'p95 ms ≤': round(1000 * h.quantile(0.95), 1), 'max ms': round(1000 * h.max, 1),
+        }
+        for (_, stage), h in sorted(metrics.snapshot(page).items())
+    ]
+    with st.expander('Stage timings (all sessions)'):
+        st.table(rows)
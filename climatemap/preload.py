@@ -0,0 +1,66 @@
+"""Deferred imports of the heavy libraries, preloaded after the first paint.
+
+Pages import only what their first render needs. TensorFlow/Keras, sklearn,
+MLForecast and plotly.express are imported where they are used, the first
+time a forecast or chart needs them. To keep that first use fast, each page
+calls ``start()`` once it has rendered. This imports the libraries in a
+background thread, once per process, while the user is still reading. Set
+``CLIMATEMAP_PRELOAD=0`` to turn preloading off, for example for one-off
+scripts.
+
+The time each import took is kept in ``import_times`` and recorded as
+``import:<module>`` stages of the ``preload`` page in ``climatemap.metrics``.
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+from climatemap import backend
+from climatemap.metrics import metrics
+
+PRELOAD = os.environ.get('CLIMATEMAP_PRELOAD', '1') != '0'
+
+# Heavy imports used somewhere in the app, cheapest first
+HEAVY_MODULES = ('plotly.express', 'sklearn.preprocessing', 'mlforecast', 'keras', 'tensorflow')
+
+# The TensorFlow Lite backend never needs TensorFlow itself
+LITE_MODULES = ('plotly.express', 'sklearn.preprocessing', 'mlforecast', 'ai_edge_litert.interpreter')
+
+import_times = {}  # module -> seconds taken by the preload thread
+_started = False
+_lock = threading.Lock()
+
+
+def modules():
+    """The heavy modules the configured backend needs"""
+    return LITE_MODULES if backend.BACKEND == 'tflite' else HEAVY_MODULES
+
+
+def _import_all(names):
+    for name in names:
+        if name in sys.modules:
+            continue
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            # Optional here: the code that needs it reports the error when used
+            continue
+        import_times[name] = time.perf_counter() - start
+        metrics.observe(f'import:{name}', import_times[name], page='preload')
+
+
+def start(names=None):
+    """Import the heavy modules in a daemon thread, once per process"""
+    global _started
+    if not PRELOAD:
+        return None
+    with _lock:
+        if _started:
+            return None
+        _started = True
+    thread = threading.Thread(target=_import_all, args=(names or modules(),), name='preload-imports', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,97 @@
+"""Pivot the long temperature tables into the wide matrices the CNN-LSTM models use.
+
+``get_stage`` keeps the pivoted matrix, the scaler fitted on it and the last
+input window for the whole process, rebuilt only when the source data
+changes, so no page pivots or fits a scaler while serving a request. The
+matrix itself is a read-only float32 memory map shared by every process
+(see ``climatemap.matrix_store``).
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from climatemap import data, matrix_store
+
+# The subnational model was trained on data from 2010 onwards
+SUBNATIONAL_START = '2010-01-01'
+
+SEQ_LENGTH = 12  # Sequence length (1 year)
+
+# Number of per-country subnational pivots kept in memory
+COUNTRY_PIVOT_CACHE_SIZE = 64
+
+
+def country_pivot(df):
+    """Dates x countries matrix of monthly temperatures"""
+    df_pivot = df.pivot_table(index='Date', columns='Country', values='Monthly_temperature', aggfunc='first', observed=True)
+    df_pivot.columns = df_pivot.columns.astype(str)
+    df_pivot.index = pd.to_datetime(df_pivot.index)
+    return df_pivot.sort_index()
+
+
+def subnational_pivot(df):
+    """Dates x 'Country_Area' matrix of monthly temperatures"""
+    df = df[pd.to_datetime(df['Date']) >= SUBNATIONAL_START]
+    df_pivot = df.pivot_table(index='Date', columns=['Country', 'Area'], values='Monthly_temperature', aggfunc='first', observed=True)
+    df_pivot.columns = ['_'.join(col).strip() for col in df_pivot.columns.values]
+    return df_pivot.sort_index()
+
+
+PIVOTS = {
+    'country': country_pivot,
+    'subnational': subnational_pivot,
+}
+
+
+@dataclass(frozen=True)
+class PivotStage:
+    """The pivoted history of a source, the scaler fitted on it and the last model input window"""
+    data_version: str
+    pivot: pd.DataFrame
+    scaler: object  # fitted sklearn MinMaxScaler
+    last_window: np.ndarray  # (SEQ_LENGTH, columns), scaled
+
+
+def build_stage(name, seq_length=SEQ_LENGTH):
+    """Map a source's float32 matrix store, pivoting and fitting the scaler only if no process has yet"""
+    store = matrix_store.open_store(name)
+    return PivotStage(store.data_version, store.frame(), store.scaler(), store.last_window(seq_length))
+
+
+_stages = {}  # source name -> PivotStage
+_country_pivots = OrderedDict()  # (data version, country) -> DataFrame
+_lock = threading.Lock()
+
+
+def get_stage(name):
+    """Return the cached stage for a source, rebuilding it when the data version changes"""
+    data_version = data.version(name)
+    with _lock:
+        stage = _stages.get(name)
+        if stage is None or stage.data_version != data_version:
+            stage = _stages[name] = build_stage(name)
+        return stage
+
+
+def subnational_country_pivot(country):
+    """Cached dates x 'Country_Area' matrix for one country's areas only"""
+    key = (data.version('subnational'), country)
+    with _lock:
+        if key in _country_pivots:
+            _country_pivots.move_to_end(key)
+            return _country_pivots[key]
+        appended = data.last_append('subnational')
+        previous_key = (appended['from'], country) if appended else None
+        if previous_key in _country_pivots and country not in appended['series'].get('Country', ()):
+            # The last append did not touch this country's areas
+            _country_pivots[key] = _country_pivots.pop(previous_key)
+            return _country_pivots[key]
+    df_pivot = subnational_pivot(data.load_country('subnational', country, start=SUBNATIONAL_START))
+    with _lock:
+        _country_pivots[key] = df_pivot
+        while len(_country_pivots) > COUNTRY_PIVOT_CACHE_SIZE:
+            _country_pivots.popitem(last=False)
+    return df_pivot
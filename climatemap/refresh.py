@@ -0,0 +1,89 @@
+"""Append new observations to a source and bring what is built from it up to date.
+
+    python -m climatemap.refresh country data/new_months.csv
+
+The CSV must have the header of the source's (last) file. ``data.append``
+adds its rows to the source and extends the Arrow and Parquet caches without
+reparsing. The derived artifacts other processes read are then updated:
+
+- ``country``/``subnational``: the float32 matrices are extended, and only the
+  columns whose min/max moved are rescaled. Existing precomputed forecast
+  files are rebuilt. The CNN-LSTM models take every series as input, so the
+  whole forecast changes.
+- ``city``: the fitted MLForecast model is carried over with
+  ``MLForecast.update`` instead of being refitted. Appended months past
+  ``city_forecast.LAST_OBSERVED`` move the training cutoff of their own
+  city only. The refresh says so when the append added no month the model
+  trains on, or when it had to refit.
+- ``historical``/``predictions``: the dashboard extends its anomaly engine
+  on its next rerun and recomputes only the baselines the rows change.
+
+In every process, caches keyed by data version keep the entries of series
+the append did not touch (see ``data.last_append``).
+"""
+import argparse
+import os
+import time
+
+from climatemap import data
+
+
+def refresh(name, path):
+    """Append a CSV to a source and update its dependents; returns (step, seconds) timings"""
+    timings = []
+
+    def step(label, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append((label, time.perf_counter() - start))
+        return result
+
+    step('append', data.append, name, path)
+
+    from climatemap import direct, forecast_store, matrix_store, preprocessing
+
+    if name in preprocessing.PIVOTS:
+        step('matrices', matrix_store.open_store, name)
+        for store, (_, source) in forecast_store.STORES.items():
+            if source != name:
+                continue
+            for method in forecast_store.METHODS:
+                if method == 'direct' and not direct.available(store):
+                    continue
+                if os.path.exists(forecast_store.store_path(store, method)):
+                    step(f'forecast {store} ({method})', forecast_store.build, store, method=method)
+
+    if name == 'city':
+        from climatemap import city_forecast
+        from climatemap.registry import registry
+
+        previous = city_forecast.fitted_model_path(registry.version('city'), data.last_append(name)['from'])
+        if os.path.exists(previous):
+            start = time.perf_counter()
+            _, how = city_forecast.fit_current()
+            label = {'updated': 'city model update', 'unchanged': 'city model: no new city rows',
+                     'fitted': 'city model refit'}.get(how, 'city model (already built)')
+            timings.append((label, time.perf_counter() - start))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append new rows to a source and refresh its dependents.')
+    parser.add_argument('name', help=f"source to append to: {', '.join(sorted(data.SOURCES))}")
+    parser.add_argument('path', help="CSV of new rows with the source file's header")
+    args = parser.parse_args()
+    if args.name not in data.SOURCES:
+        parser.error(f"unknown source: {args.name}")
+    try:
+        timings = refresh(args.name, args.path)
+    except ValueError as e:
+        parser.error(str(e))
+    appended = data.last_append(args.name)
+    series = ', '.join(f'{len(values)} {col}' for col, values in appended['series'].items())
+    print(f"{args.name}: appended to version {data.version(args.name)[:12]} ({series} touched)")
+    for label, seconds in timings:
+        print(f"  {label:<32} {seconds:8.3f}s")
+
+
+if __name__ == '__main__':
+    main()
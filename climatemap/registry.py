@@ -0,0 +1,129 @@
+"""Process-wide registry for the pickled models and scalers used by the pages.
+
+Streamlit re-executes a page script on every interaction, but imported modules
+stay in memory for the lifetime of the server process. Keeping the unpickled
+artifacts here means each one is loaded once and shared by every session and
+every page.
+
+Artifacts are keyed by their path plus a SHA-256 of the file contents, so
+overwriting a pickle in place, or pointing a name at another file through
+``models/active.json``, swaps the model on the next rerun without a restart::
+
+    {"country": "temperature_forecaster_032025.pkl"}
+"""
+import hashlib
+import json
+import os
+import threading
+
+import joblib
+
+# Default artifact for each model name used by the pages
+MODEL_PATHS = {
+    'country': 'temperature_forecaster.pkl',
+    'country_scaler': 'models/scaler.pkl',
+    'subnational': 'models/subnational_temp_forecaster.pkl',
+    'city': 'nixtla_forecast.pkl',
+    # Direct multi-step forecasters (72 months, then 12 and 24), see climatemap.direct
+    'country_direct': 'models/direct_country_forecaster.pkl',
+    'subnational_direct': 'models/direct_subnational_forecaster.pkl',
+    'country_direct_12': 'models/direct_country_forecaster_12.pkl',
+    'country_direct_24': 'models/direct_country_forecaster_24.pkl',
+    'subnational_direct_12': 'models/direct_subnational_forecaster_12.pkl',
+    'subnational_direct_24': 'models/direct_subnational_forecaster_24.pkl',
+}
+
+# Optional overrides of MODEL_PATHS, re-read whenever the file changes
+ACTIVE_MODELS_PATH = 'models/active.json'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Load each artifact once per process and reload it when its file changes"""
+
+    def __init__(self, paths=None, active_path=ACTIVE_MODELS_PATH):
+        self._defaults = dict(MODEL_PATHS if paths is None else paths)
+        self._active_path = active_path
+        self._active = {}
+        self._active_stat = None
+        self._artifacts = {}  # (absolute path, digest) -> loaded object
+        self._digests = {}    # absolute path -> (mtime_ns, size, digest)
+        self._lock = threading.RLock()
+
+    def _refresh_active(self):
+        """Re-read the active model overrides if the file was added or edited"""
+        try:
+            stat = os.stat(self._active_path)
+        except FileNotFoundError:
+            self._active, self._active_stat = {}, None
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._active_stat:
+            with open(self._active_path) as f:
+                self._active = json.load(f)
+            self._active_stat = signature
+
+    def path(self, name):
+        """Return the file currently serving the given model name"""
+        with self._lock:
+            self._refresh_active()
+            if name in self._active:
+                return self._active[name]
+            if name not in self._defaults:
+                raise KeyError(f"Unknown model name: {name}")
+            return self._defaults[name]
+
+    def digest(self, path):
+        """Return the content digest of a file, rehashing only when its stat changes"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._digests.get(path)
+            if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                return cached[2]
+            digest = file_digest(path)
+            self._digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            return digest
+
+    def load(self, path):
+        """Return the unpickled object for a path, loading it on first use"""
+        path = os.path.abspath(path)
+        with self._lock:
+            key = (path, self.digest(path))
+            if key not in self._artifacts:
+                # Drop superseded versions of the same file before loading the new one
+                for stale in [k for k in self._artifacts if k[0] == path]:
+                    del self._artifacts[stale]
+                self._artifacts[key] = joblib.load(path)
+            return self._artifacts[key]
+
+    def get(self, name):
+        """Return the loaded artifact for a model name"""
+        return self.load(self.path(name))
+
+    def version(self, name):
+        """Return the content digest of the artifact behind a model name"""
+        return self.digest(self.path(name))
+
+    def activate(self, name, path):
+        """Point a model name at another artifact for the rest of the process"""
+        with self._lock:
+            self._defaults[name] = path
+
+    def clear(self):
+        """Forget every loaded artifact"""
+        with self._lock:
+            self._artifacts.clear()
+            self._digests.clear()
+
+
+# Shared by all sessions and pages in this server process
+registry = ModelRegistry()
@@ -0,0 +1,226 @@
+"""Standalone HTTP forecast service.
+
+Serves the same forecasts as the Streamlit pages without the UI, for systems
+that want the numbers directly:
+
+    GET /forecast/country?countries=Kenya,Ghana&steps=24
+    GET /forecast/subnational?country=Kenya&regions=Nairobi&steps=24
+    GET /forecast/city?city=Nairobi&horizon=12
+    GET /health
+    GET /metrics    (stage timings in Prometheus text format)
+
+Responses are JSON by default. Pass ``format=arrow``, or send
+``Accept: application/vnd.apache.arrow.stream``, to get an Arrow IPC stream
+with a ``date`` column and one column per series. Models are loaded once
+and kept warm. Concurrent requests for the same forecast share one model call
+(see ``forecast_store.compute``).
+
+Run locally against the bundled models with:
+    python -m climatemap.service --port 8000
+"""
+import argparse
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from climatemap import city_forecast, data, forecast_store
+from climatemap.metrics import metrics, set_page
+from climatemap.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Longest forecast served, in months
+MAX_STEPS = 120
+
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+class RequestError(ValueError):
+    """A request parameter is missing or invalid; reported as HTTP 400"""
+
+
+def _param(query, name, default=None):
+    values = query.get(name)
+    if not values or values[0] == '':
+        if default is None:
+            raise RequestError(f"Missing parameter: {name}")
+        return default
+    return values[0]
+
+
+def _list_param(query, name):
+    values = query.get(name)
+    if not values:
+        return None
+    return [item for value in values for item in value.split(',') if item]
+
+
+def _steps(query, name='steps', default=12):
+    try:
+        steps = int(_param(query, name, str(default)))
+    except ValueError:
+        raise RequestError(f"{name} must be an integer") from None
+    if not 1 <= steps <= MAX_STEPS:
+        raise RequestError(f"{name} must be between 1 and {MAX_STEPS}")
+    return steps
+
+
+def _select(columns, wanted, label):
+    unknown = sorted(set(wanted) - set(columns))
+    if unknown:
+        raise RequestError(f"Unknown {label}: {', '.join(unknown)}")
+    return wanted
+
+
+def country_forecast(query):
+    """Forecast frame (date + one column per country) for /forecast/country"""
+    steps = _steps(query)
+    future = forecast_store.forecast('country', steps)
+    countries = _list_param(query, 'countries')
+    if countries:
+        future = future[_select(future.columns, countries, 'countries')]
+    versions = {'model_version': registry.version('country'), 'data_version': data.version('country')}
+    return future.set_axis(forecast_store.forecast_dates('country', steps)), versions
+
+
+def subnational_forecast(query):
+    """Forecast frame (date + one column per region) for /forecast/subnational"""
+    country = _param(query, 'country')
+    steps = _steps(query)
+    future = forecast_store.forecast('subnational', steps)
+    prefix = f'{country}_'
+    regions = {col[len(prefix):]: col for col in future.columns if col.startswith(prefix)}
+    if not regions:
+        raise RequestError(f"Unknown country: {country}")
+    selected = _select(regions, _list_param(query, 'regions') or sorted(regions), 'regions')
+    future = future[[regions[region] for region in selected]].set_axis(selected, axis=1)
+    versions = {'model_version': registry.version('subnational'), 'data_version': data.version('subnational')}
+    return future.set_axis(forecast_store.forecast_dates('subnational', steps)), versions
+
+
+def city_forecast_frame(query):
+    """Forecast frame (date + the city's column) for /forecast/city"""
+    city = _param(query, 'city')
+    horizon = _steps(query, 'horizon')
+    if city not in set(city_forecast.known_cities()):
+        raise RequestError(f"Unknown city: {city}")
+    future = city_forecast.predict_city(city, horizon)
+    frame = pd.DataFrame({city: future['y'].to_numpy()}, index=pd.DatetimeIndex(future['ds']))
+    versions = {'model_version': registry.version('city'), 'data_version': data.version('city')}
+    return frame, versions
+
+
+ROUTES = {
+    '/forecast/country': country_forecast,
+    '/forecast/subnational': subnational_forecast,
+    '/forecast/city': city_forecast_frame,
+}
+
+
+def to_json(frame, versions):
+    body = {
+        **versions,
+        'dates': frame.index.strftime('%Y-%m-%d').tolist(),
+        'series': {str(col): [round(float(v), 2) for v in frame[col]] for col in frame.columns},
+    }
+    return json.dumps(body).encode('utf-8')
+
+
+def to_arrow(frame, versions):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame.rename_axis('date').reset_index(), preserve_index=False)
+    table = table.replace_schema_metadata({key.encode(): value.encode() for key, value in versions.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    server_version = 'ClimateMapForecast/1.0'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/health':
+            return self._send(200, 'application/json', json.dumps({'status': 'ok'}).encode())
+        if url.path == '/metrics':
+            return self._send(200, 'text/plain; version=0.0.4', metrics.prometheus_text().encode())
+        route = ROUTES.get(url.path)
+        if route is None:
+            return self._error(404, f"Unknown endpoint: {url.path}")
+        set_page(f'service{url.path}')
+        try:
+            frame, versions = route(query)
+        except RequestError as e:
+            return self._error(400, str(e))
+        except Exception:
+            logger.exception("Forecast failed for %s", self.path)
+            return self._error(500, "Forecast failed")
+
+        fmt = query.get('format', [''])[0]
+        if fmt == 'arrow' or (not fmt and ARROW_CONTENT_TYPE in self.headers.get('Accept', '')):
+            self._send(200, ARROW_CONTENT_TYPE, to_arrow(frame, versions))
+        else:
+            self._send(200, 'application/json', to_json(frame, versions))
+
+    def _error(self, status, message):
+        self._send(status, 'application/json', json.dumps({'error': message}).encode())
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def warm():
+    """Load every model and build the forecasts once so the first requests are fast"""
+    loaders = [(name, lambda name=name: forecast_store.forecast(name, forecast_store.FORECAST_STEPS))
+               for name in forecast_store.STORES]
+    loaders.append(('city', city_forecast.get_fitted_model))
+    # Every city's full horizon, so a first request for any city is a slice
+    loaders.append(('city predictions', city_forecast.warm_predictions))
+    for name, load in loaders:
+        try:
+            load()
+        except Exception:
+            logger.exception("Could not warm the %s forecast", name)
+
+
+def make_server(host='127.0.0.1', port=8000):
+    return ThreadingHTTPServer((host, port), ForecastHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve forecasts over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--no-warm', action='store_true', help="don't load the models before serving")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    server = make_server(args.host, args.port)
+    if not args.no_warm:
+        # Warm in the background so /health answers while the models load
+        threading.Thread(target=warm, name='warm-models', daemon=True).start()
+    logger.info("Serving forecasts on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Streaming validation of user-uploaded temperature CSVs.
+
+Uploads are checked on their header before any rows are parsed, then read in
+chunks, keeping only the trailing months the forecast and the chart need.
+Oversized or malformed files, and empty cells in the months the forecast
+starts from, are rejected with an ``UploadError`` that the page can show
+as-is.
+"""
+from dataclasses import dataclass
+
+import pandas as pd
+
+from climatemap.metrics import timed
+
+DATE_COLUMN = 'Date'
+
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+MAX_COLUMNS = 500
+CHUNK_ROWS = 5000
+
+
+class UploadError(ValueError):
+    """The uploaded file is too large or does not match the expected structure"""
+
+
+@dataclass
+class UploadWindow:
+    """The trailing rows of an upload, aligned to the model's columns"""
+    history: pd.DataFrame  # DatetimeIndex x expected columns, NaN where not uploaded
+    n_rows: int
+    matched_columns: list
+    missing_columns: list
+
+
+def _file_size(file):
+    size = getattr(file, 'size', None)
+    if size is None:
+        position = file.tell()
+        size = file.seek(0, 2)
+        file.seek(position)
+    return size
+
+
+@timed('upload')
+def read_upload(file, expected_columns, keep_rows, min_rows=12,
+                max_bytes=MAX_UPLOAD_BYTES, chunksize=CHUNK_ROWS):
+    """Validate an uploaded CSV and return its last ``keep_rows`` rows"""
+    if _file_size(file) > max_bytes:
+        raise UploadError(f"The uploaded file is larger than {max_bytes // (1024 * 1024)} MB.")
+
+    try:
+        header = pd.read_csv(file, nrows=0).columns
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        raise UploadError(f"The uploaded file is not a readable CSV: {e}") from e
+    file.seek(0)
+
+    if len(header) > MAX_COLUMNS:
+        raise UploadError(f"The uploaded file has {len(header)} columns; at most {MAX_COLUMNS} are supported.")
+    if header.duplicated().any():
+        raise UploadError(f"Duplicate columns in the uploaded file: {', '.join(header[header.duplicated()])}")
+    if DATE_COLUMN not in header:
+        raise UploadError(f"The uploaded file needs a '{DATE_COLUMN}' column.")
+
+    expected = pd.Index(expected_columns)
+    matched = expected.intersection(header, sort=False).tolist()
+    if not matched:
+        raise UploadError("No columns in the uploaded data match the historical data columns.")
+
+    tail = None
+    n_rows = 0
+    try:
+        reader = pd.read_csv(file, usecols=[DATE_COLUMN] + matched,
+                             dtype={col: 'float32' for col in matched}, chunksize=chunksize)
+        for chunk in reader:
+            n_rows += len(chunk)
+            tail = chunk if tail is None else pd.concat([tail, chunk])
+            tail = tail.iloc[-keep_rows:]
+    except (pd.errors.ParserError, ValueError) as e:
+        raise UploadError(f"Could not parse row {n_rows + 1} onwards: {e}") from e
+
+    if n_rows < min_rows:
+        raise UploadError(f"The uploaded file has {n_rows} rows; at least {min_rows} months are needed.")
+
+    try:
+        dates = pd.to_datetime(tail[DATE_COLUMN])
+    except (ValueError, TypeError) as e:
+        raise UploadError(f"Could not parse the '{DATE_COLUMN}' column: {e}") from e
+
+    history = tail[matched].set_axis(pd.DatetimeIndex(dates, name=DATE_COLUMN))
+    # Only missing columns are filled from the stored history, never gaps in uploaded ones
+    empty = history.iloc[-min_rows:].isna().stack()
+    empty = [f"{col} ({date:%b-%Y})" for date, col in empty[empty].index]
+    if empty:
+        shown = ', '.join(empty[:10]) + (f" and {len(empty) - 10} more" if len(empty) > 10 else '')
+        raise UploadError(f"Empty cells in the last {min_rows} months, which the forecast starts from: {shown}")
+
+    history = history.reindex(columns=expected)
+    return UploadWindow(
+        history=history,
+        n_rows=n_rows,
+        matched_columns=matched,
+        missing_columns=expected.difference(matched, sort=False).tolist(),
+    )
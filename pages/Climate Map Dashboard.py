@@ -1,15 +1,21 @@
 
 
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import numpy as np
 from datetime import datetime
 import calendar
+from climatemap import data
+from climatemap.dashboard import load_data
+from climatemap.figure_cache import figure_cache
+from climatemap.figures import (
+    create_city_map, create_climate_heatmap, create_temperature_trend_chart,
+    create_yearly_monthly_heatmap, create_yearly_monthly_trend_chart,
+)
+from climatemap.metrics import debug_panel, set_page
+from climatemap import preload
 
 
 st.set_page_config(layout="wide", page_title="Climate Map Africa", page_icon="🌍")
+set_page('dashboard')  # labels this rerun's stage timings
 
 # Enhanced CSS styling with SDG colors and climate imagery
 
@@ -272,89 +278,6 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Country code to country name mapping for African countries
-country_mapping = {
-    'DZ': 'Algeria', 'AO': 'Angola', 'BJ': 'Benin', 'BW': 'Botswana',
-    'BF': 'Burkina Faso', 'BI': 'Burundi', 'CM': 'Cameroon', 'CV': 'Cape Verde',
-    'CF': 'Central African Republic', 'TD': 'Chad', 'KM': 'Comoros', 'CG': 'Congo',
-    'CD': 'Democratic Republic of Congo', 'CI': 'Côte d\'Ivoire', 'DJ': 'Djibouti',
-    'EG': 'Egypt', 'EH': 'Western Sahara', 'GQ': 'Equatorial Guinea', 'ER': 'Eritrea', 'ET': 'Ethiopia', 
-    'GA': 'Gabon', 'GM': 'Gambia', 'GH': 'Ghana', 'GN': 'Guinea', 'GW': 'Guinea-Bissau',
-    'KE': 'Kenya', 'LS': 'Lesotho', 'LR': 'Liberia', 'LY': 'Libya', 'MG': 'Madagascar',
-    'MW': 'Malawi', 'ML': 'Mali', 'MR': 'Mauritania', 'MU': 'Mauritius',
-    'MA': 'Morocco', 'MZ': 'Mozambique', 'NA': 'Namibia', 'NE': 'Niger',
-    'NG': 'Nigeria', 'RW': 'Rwanda', 'ST': 'São Tomé and Príncipe', 'SN': 'Senegal',
-    'SC': 'Seychelles', 'SL': 'Sierra Leone', 'SO': 'Somalia', 'ZA': 'South Africa',
-    'SS': 'South Sudan', 'SD': 'Sudan', 'SZ': 'Eswatini', 'TZ': 'Tanzania',
-    'TG': 'Togo', 'TN': 'Tunisia', 'UG': 'Uganda', 'ZM': 'Zambia', 'ZW': 'Zimbabwe'
-}
-
-# Load and prepare the dataset
-# Load and prepare the dataset
-@st.cache_data
-def load_data():
-    # Load historical data
-    df1 = pd.read_csv("data/sample_temp_1950-2025_1.csv")
-    df2 = pd.read_csv("data/sample_temp_1950-2025_2.csv")
-    df = pd.concat([df1, df2], axis=0).reset_index(drop=True)
-    df.fillna("NA", inplace=True)
-    df.columns = df.columns.str.lower()
-
-    if 'latitude' not in df.columns:
-        df['latitude'] = df['lat']
-    if 'lng' not in df.columns and 'longitude' in df.columns:
-        df['lng'] = df['longitude']
-
-    df['country_name'] = df['country'].map(country_mapping)
-    
-    # Load prediction data
-    df_pred = pd.read_csv("data/monthly_pred_temp_2025-2029.csv")
-    df_pred.columns = df_pred.columns.str.lower()
-
-    # Parse the date column (mm-year format like "Jul-2025")
-    df_pred['date_parsed'] = pd.to_datetime(df_pred['date'], format='%b-%Y')
-    df_pred['year'] = df_pred['date_parsed'].dt.year
-    df_pred['month'] = df_pred['date_parsed'].dt.month
-    df_pred['month_name'] = df_pred['date_parsed'].dt.strftime('%b')
-
-    if 'latitude' not in df_pred.columns:
-        df_pred['latitude'] = df_pred['lat']
-    if 'lng' not in df_pred.columns and 'longitude' in df_pred.columns:
-        df_pred['lng'] = df_pred['longitude']
-
-    df_pred['country_name'] = df_pred['country'].map(country_mapping)
-    
-    return df, df_pred
-
-def calculate_temperature_anomaly(df, baseline_start=1961, baseline_end=1990):
-    """Calculate temperature anomaly based on baseline period (1961-1990)"""
-    anomaly_df = df.copy()
-    
-    # Calculate baseline temperature for each city
-    baseline_data = df[(df['year'] >= baseline_start) & (df['year'] <= baseline_end)]
-    baseline_temps = baseline_data.groupby('city')['temperature'].mean().reset_index()
-    baseline_temps.columns = ['city', 'baseline_temp']
-    
-    # Merge with main dataframe
-    anomaly_df = anomaly_df.merge(baseline_temps, on='city', how='left')
-    
-    # Calculate anomaly
-    anomaly_df['temperature_anomaly'] = anomaly_df['temperature'] - anomaly_df['baseline_temp']
-    
-    return anomaly_df
-
-def calculate_prediction_anomaly(df_pred, baseline_temps):
-    """Calculate temperature anomaly for prediction data using historical baseline"""
-    anomaly_df = df_pred.copy()
-    
-    # Merge with baseline temperatures
-    anomaly_df = anomaly_df.merge(baseline_temps, on='city', how='left')
-    
-    # Calculate anomaly
-    anomaly_df['temperature_anomaly'] = anomaly_df['temperature'] - anomaly_df['baseline_temp']
-    
-    return anomaly_df
-
 def generate_climate_narrative(city_data, city_name, country_name):
     """Generate dynamic climate narrative based on 1980s trend and baseline comparison"""
     if city_data.empty:
@@ -440,213 +363,6 @@ def generate_climate_narrative(city_data, city_name, country_name):
     
     return message
 
-def create_climate_heatmap(df, selected_city):
-    """Create an enhanced climate stripes style heatmap with anomaly data for a single city"""
-    if not selected_city:
-        return None
-    
-    # Filter data for selected city
-    city_data = df[df['city'] == selected_city]
-    
-    if city_data.empty:
-        return None
-    
-    # Sort by year
-    city_data = city_data.sort_values('year')
-    
-    # Create heatmap with anomaly scale (single row for the city)
-    fig = go.Figure(data=go.Heatmap(
-        z=[city_data['temperature_anomaly'].values],
-        x=city_data['year'].values,
-        y=[selected_city],
-        zmin=-3,
-        zmax=3,
-        colorscale='RdBu_r',
-        showscale=False,
-        hovertemplate='<b>%{y}</b><br>' +
-                      'Year: %{x}<br>' +
-                      'Anomaly: %{z:.2f}°C<br>' +
-                      '<extra></extra>'
-    ))
-    
-    fig.update_layout(
-        title=f"Historical Heatmap Temperature Anomalies for {selected_city}",
-        paper_bgcolor='rgba(255,255,255,0.95)',
-        margin=dict(l=40, r=40, t=60, b=40),
-        xaxis_title="Year",
-        yaxis=dict(showticklabels=False, gridcolor='rgba(0,0,0,0.1)'),
-        height=350,
-        font=dict(size=12),
-        title_font=dict(size=16, color='#2c3e50'),
-        xaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
-        autosize=True
-    )
-    
-    return fig
-
-def create_yearly_monthly_trend_chart(df_pred, selected_city, selected_year):
-    """Create a line chart showing monthly predicted temperature trends for a specific year"""
-    if not selected_city or not selected_year:
-        return None
-    
-    city_data = df_pred[(df_pred['city'] == selected_city) & (df_pred['year'] == selected_year)].copy()
-    
-    if city_data.empty:
-        return None
-    
-    # Sort by month to ensure proper order
-    city_data = city_data.sort_values('month')
-    
-    fig = go.Figure()
-    
-    # Add predicted temperature line
-    fig.add_trace(go.Scatter(
-        x=city_data['month_name'],
-        y=city_data['temperature'],
-        mode='lines+markers',
-        name=f'Predicted Temperature {selected_year}',
-        line=dict(color='#FF8C00', width=3),
-        marker=dict(size=8, color='#FF8C00'),
-        hovertemplate='Month: %{x}<br>Predicted Temperature: %{y:.1f}°C<extra></extra>'
-    ))
-    
-    # Add trend line across months
-    x_numeric = np.arange(len(city_data))
-    z = np.polyfit(x_numeric, city_data['temperature'], 1)
-    p = np.poly1d(z)
-    fig.add_trace(go.Scatter(
-        x=city_data['month_name'],
-        y=p(x_numeric),
-        mode='lines',
-        name=f'Monthly Trend {selected_year}',
-        line=dict(color='#DC143C', width=3, dash='dash'),
-        hovertemplate='Month: %{x}<br>Trend: %{y:.1f}°C<extra></extra>'
-    ))
-    
-    fig.update_layout(
-        title=f"Monthly Temperature Predictions for {selected_city} - {selected_year}",
-        plot_bgcolor='rgba(255,255,255,0.9)',
-        paper_bgcolor='rgba(255,255,255,0.95)',
-        margin=dict(l=40, r=40, t=60, b=40),
-        xaxis_title="Month",
-        yaxis_title="Temperature (°C)",
-        height=400,
-        font=dict(size=12),
-        title_font=dict(size=16, color='#2c3e50'),
-        xaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
-        yaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
-        legend=dict(
-            bgcolor='rgba(255,255,255,0.8)',
-            bordercolor='rgba(0,0,0,0.2)',
-            borderwidth=1
-        ),
-        autosize=True
-    )
-    
-    return fig
-
-def create_yearly_monthly_heatmap(df_pred, selected_city, selected_year):
-    """Create a monthly heatmap for a specific year showing temperature anomalies"""
-    if not selected_city or not selected_year:
-        return None
-    
-    # Filter data for selected city and year
-    city_data = df_pred[(df_pred['city'] == selected_city) & (df_pred['year'] == selected_year)]
-    
-    if city_data.empty:
-        return None
-    
-    # Sort by month
-    city_data = city_data.sort_values('month')
-    
-    # Create heatmap with months on x-axis and single row
-    fig = go.Figure(data=go.Heatmap(
-        z=[city_data['temperature_anomaly'].values],
-        x=city_data['month_name'].values,
-        y=[selected_city],
-        zmin=-3,
-        zmax=3,
-        colorscale='RdBu_r',
-        showscale=True,
-        colorbar=dict(title="Anomaly (°C)"),
-        hovertemplate='<b>%{y}</b><br>' +
-                      'Month: %{x}<br>' +
-                      'Predicted Anomaly: %{z:.2f}°C<br>' +
-                      '<extra></extra>'
-    ))
-    
-    fig.update_layout(
-        title=f"Heatmap Monthly Temperature Anomalies for {selected_city} - {selected_year}",
-        paper_bgcolor='rgba(255,255,255,0.95)',
-        margin=dict(l=40, r=40, t=60, b=40),
-        xaxis_title="Month",
-        yaxis=dict(showticklabels=False, gridcolor='rgba(0,0,0,0.1)'),
-        height=400,
-        font=dict(size=12),
-        title_font=dict(size=16, color='#2c3e50'),
-        xaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
-        autosize=True
-    )
-    
-    return fig
-
-def create_temperature_trend_chart(df, selected_city):
-    """Create a line chart showing temperature trends for the selected city"""
-    if not selected_city:
-        return None
-    
-    city_data = df[df['city'] == selected_city].sort_values('year')
-    
-    if city_data.empty:
-        return None
-    
-    fig = go.Figure()
-    
-    # Add temperature line
-    fig.add_trace(go.Scatter(
-        x=city_data['year'],
-        y=city_data['temperature'],
-        mode='lines+markers',
-        name='Historical Temperature',
-        line=dict(color='#4B9CD3', width=3),
-        marker=dict(size=6, color='#4B9CD3'),
-        hovertemplate='Year: %{x}<br>Temperature: %{y:.1f}°C<extra></extra>'
-    ))
-    
-    # Add trend line
-    z = np.polyfit(city_data['year'], city_data['temperature'], 1)
-    p = np.poly1d(z)
-    fig.add_trace(go.Scatter(
-        x=city_data['year'],
-        y=p(city_data['year']),
-        mode='lines',
-        name='Historical Trend',
-        line=dict(color='#FF0000', width=4, dash='dash'),
-        hovertemplate='Year: %{x}<br>Trend: %{y:.1f}°C<extra></extra>'
-    ))
-    
-    fig.update_layout(
-        title=f"Historical Temperature Trend for {selected_city}",
-        plot_bgcolor='rgba(255,255,255,0.9)',
-        paper_bgcolor='rgba(255,255,255,0.95)',
-        margin=dict(l=40, r=40, t=60, b=40),
-        xaxis_title="Year",
-        yaxis_title="Temperature (°C)",
-        height=350,
-        font=dict(size=12),
-        title_font=dict(size=16, color='#2c3e50'),
-        xaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
-        yaxis=dict(gridcolor='rgba(0,0,0,0.1)'),
-        legend=dict(
-            bgcolor='rgba(255,255,255,0.8)',
-            bordercolor='rgba(0,0,0,0.2)',
-            borderwidth=1
-        ),
-        autosize=True
-    )
-    
-    return fig
-
 # Initialize session state for selected city
 if 'selected_city' not in st.session_state:
     st.session_state.selected_city = None
@@ -658,21 +374,15 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-# Load data and calculate anomalies
-df, df_pred = load_data()
-df = calculate_temperature_anomaly(df)
-
-# Calculate baseline temperatures for predictions
-baseline_data = df[(df['year'] >= 1961) & (df['year'] <= 1990)]
-baseline_temps = baseline_data.groupby('city')['temperature'].mean().reset_index()
-baseline_temps.columns = ['city', 'baseline_temp']
-
-# Calculate anomalies for prediction data
-df_pred = calculate_prediction_anomaly(df_pred, baseline_temps)
+# Load data, anomalies and the city index (shared by all sessions)
+data_version = (data.version('historical'), data.version('predictions'))
+anomaly_engine = load_data()
+df, df_pred = anomaly_engine.df, anomaly_engine.df_pred
+city_index = anomaly_engine.index
 
 # Display key statistics
-latest_year = df['year'].max()
-latest_data = df[df['year'] == latest_year]
+latest_year = anomaly_engine.latest_year
+latest_data = anomaly_engine.latest_data
 
 with st.container():
     col1, col2, col3, col4 = st.columns(4)
@@ -680,14 +390,14 @@ with st.container():
         st.markdown(f"""
             <div class="stats-card-1">
                 <h5>Cities and Towns Monitored</h5>
-                <h2>{len(df['city'].unique())}</h2>
+                <h2>{len(city_index)}</h2>
             </div>
         """, unsafe_allow_html=True)
     with col2:
         st.markdown(f"""
             <div class="stats-card-2">
                 <h5>Countries Covered</h5>
-                <h2>{len(df['country_name'].unique())}</h2>
+                <h2>{len(city_index.countries)}</h2>
             </div>
         """, unsafe_allow_html=True)
     with col3:
@@ -717,7 +427,7 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # Country and city selection (appears first for better UX)
-countries = sorted(df['country_name'].dropna().unique())
+countries = city_index.countries
 
 # Create two columns for aligned filters
 col1, col2 = st.columns(2)
@@ -731,7 +441,7 @@ with col1:
     )
 
 # Filter cities based on selected countries
-available_cities = df[df['country_name'].isin(selected_countries)]['city'].sort_values().unique() if selected_countries else []
+available_cities = city_index.cities_in(selected_countries)
 
 with col2:
     selected_cities = st.multiselect(
@@ -745,54 +455,25 @@ with col2:
 map_center = {"lat": 0, "lon": 20}
 map_zoom = 2
 
+# A clicked cluster zooms the map in until its cities separate
+if st.session_state.get("map_view"):
+    map_center, map_zoom = st.session_state.map_view
+    if st.button("Show the whole continent"):
+        del st.session_state["map_view"]
+        st.rerun()
+
 # If only one city is selected, zoom into it
 if len(selected_cities) == 1:
-    city_info = df[df['city'] == selected_cities[0]].iloc[0]
-    map_center = {"lat": city_info["latitude"], "lon": city_info["lng"]}
+    city_lat, city_lng = city_index.coordinates(selected_cities[0])
+    map_center = {"lat": city_lat, "lon": city_lng}
     map_zoom = 12
 
-fig_map = px.scatter_mapbox(
-    latest_data,
-    lat="latitude",
-    lon="lng",
-    color="temperature",
-    hover_name="city",
-    hover_data={"temperature": ":.1f", "country_name": True},
-    center=map_center,
-    zoom=map_zoom,
-    #mapbox_style="open-street-map",
-    mapbox_style="carto-positron",
-    color_continuous_scale="RdBu_r",
-)
+map_layers = anomaly_engine.map_layers
+map_level = map_layers.level(map_zoom)
 
-# Set marker size after creation
-fig_map.update_traces(marker=dict(size=13))
-fig_map.update_layout(height=700, width=1500, margin=dict(l=0, r=0, t=30, b=0))
-fig_map.update_layout(
-    coloraxis_colorbar=dict(
-        title="Average Temperature(°C) 2025",
-        title_side='top',
-        title_font=dict(
-            color='black',        
-            size=14              
-        ),
-        tickfont=dict(
-            color='black',     
-            size=12            
-        ),
-        x=0.70,                 
-        y=0.05,                 
-        xanchor='left',
-        yanchor='bottom',
-        orientation='h',        
-        len=0.3,                
-        thickness=15            
-    )
-)
-fig_map.update_layout(
-    margin=dict(l=0, r=0, t=0, b=0),
-    paper_bgcolor="rgba(0,0,0,0)",
-    plot_bgcolor="rgba(0,0,0,0)",
+fig_map = figure_cache.get(
+    'city_map', (map_center['lat'], map_center['lon']), latest_year, (data_version, map_zoom),
+    lambda: create_city_map(map_layers, map_center, map_zoom),
 )
 
 # Display the map and capture click events
@@ -800,25 +481,39 @@ map_click = st.plotly_chart(fig_map, use_container_width=True, on_select="rerun"
 
 # Handle map click events
 if map_click and map_click.selection and map_click.selection.points:
-    # Get the clicked point
+    # Get the clicked point; its customdata is the cell index in the map's zoom level
     clicked_point = map_click.selection.points[0]
-    
-    # Find the city based on the clicked point's hover_name
-    if 'hovertext' in clicked_point:
-        clicked_city = clicked_point['hovertext']
-        st.session_state.selected_city = clicked_city
-    elif 'customdata' in clicked_point:
-        # Alternative method to get city name
-        point_index = clicked_point['point_index']
-        if point_index < len(latest_data):
-            clicked_city = latest_data.iloc[point_index]['city']
-            st.session_state.selected_city = clicked_city
+    cell = clicked_point.get('customdata')
+    if isinstance(cell, list):
+        cell = cell[0]
+    if cell is not None and 0 <= int(cell) < len(map_level):
+        cell = int(cell)
+        members = map_layers.members(map_level, cell)
+        if members.stop - members.start == 1:
+            st.session_state.selected_city = map_layers.cities[members.start]
+        else:
+            expand_zoom = map_layers.expand_zoom(map_level, cell)
+            if expand_zoom is not None and expand_zoom > map_zoom:
+                # Zoom in on the cluster until it splits
+                st.session_state.map_view = (
+                    {"lat": float(map_level.lat[cell]), "lon": float(map_level.lng[cell])},
+                    expand_zoom,
+                )
+                st.rerun()
+            # Cities at the same location never split: pick one from the list instead of zooming
+            cities_here = sorted(map_layers.cities[members])
+            picked = st.selectbox(
+                f"{len(cities_here)} cities at this location:", cities_here, index=None,
+                placeholder="Choose a city", key=f"cities_at_{map_level.zoom}_{cell}",
+            )
+            if picked:
+                st.session_state.selected_city = picked
 
 # Function to display city analysis
-def display_city_analysis(city, df, df_pred):
+def display_city_analysis(city, anomaly_engine):
     """Display complete analysis for a single city"""
-    city_data = df[df['city'] == city]
-    city_pred_data = df_pred[df_pred['city'] == city]
+    city_data = anomaly_engine.city(city)
+    city_pred_data = anomaly_engine.city_predictions(city)
     
     if city_data.empty:
         return
@@ -836,12 +531,18 @@ def display_city_analysis(city, df, df_pred):
     col1, col2 = st.columns(2)
 
     with col1:
-        trend_chart = create_temperature_trend_chart(df, city)
+        trend_chart = figure_cache.get(
+            'temperature_trend', city, None, data_version,
+            lambda: create_temperature_trend_chart(city_data, city),
+        )
         if trend_chart:
             st.plotly_chart(trend_chart, use_container_width=True)
 
     with col2:
-        heatmap = create_climate_heatmap(df, city)
+        heatmap = figure_cache.get(
+            'climate_heatmap', city, None, data_version,
+            lambda: create_climate_heatmap(city_data, city),
+        )
         if heatmap:
             st.plotly_chart(heatmap, use_container_width=True)
 
@@ -874,13 +575,19 @@ def display_city_analysis(city, df, df_pred):
             
             with col3:
                 # Monthly trend chart
-                monthly_trend_chart = create_yearly_monthly_trend_chart(df_pred, city, selected_year)
+                monthly_trend_chart = figure_cache.get(
+                    'monthly_trend', city, selected_year, data_version,
+                    lambda: create_yearly_monthly_trend_chart(city_pred_data, city, selected_year),
+                )
                 if monthly_trend_chart:
                     st.plotly_chart(monthly_trend_chart, use_container_width=True)
             
             with col4:
                 # Monthly heatmap
-                monthly_heatmap = create_yearly_monthly_heatmap(df_pred, city, selected_year)
+                monthly_heatmap = figure_cache.get(
+                    'monthly_heatmap', city, selected_year, data_version,
+                    lambda: create_yearly_monthly_heatmap(city_pred_data, city, selected_year),
+                )
                 if monthly_heatmap:
                     st.plotly_chart(monthly_heatmap, use_container_width=True)
             
@@ -908,7 +615,7 @@ def display_city_analysis(city, df, df_pred):
 # Display analysis for selected city from map click (only if actually clicked)
 if st.session_state.selected_city is not None:
     selected_city = st.session_state.selected_city
-    display_city_analysis(selected_city, df, df_pred)
+    display_city_analysis(selected_city, anomaly_engine)
     
     # Add button to clear selection
     if st.button("Clear Selection", key="clear_selection_map"):
@@ -918,7 +625,7 @@ if st.session_state.selected_city is not None:
 # Display analysis for cities selected from multiselect (only if cities are selected)
 if selected_cities:
     for city in selected_cities:
-        display_city_analysis(city, df, df_pred)
+        display_city_analysis(city, anomaly_engine)
 
 # Footer information
 st.markdown("---")
@@ -1003,3 +710,9 @@ st.markdown("""
         <p>🤝 Together, we can build a sustainable future for Africa and the world!</p>
     </div>
 """, unsafe_allow_html=True)
+
+# Stage timings, shown with ?debug=1
+debug_panel(st)
+
+# The page has rendered: import the heavy libraries in the background for the next forecast
+preload.start()
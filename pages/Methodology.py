@@ -1,4 +1,5 @@
 import streamlit as st
+from climatemap import preload
 
 st.title('Methodology')
 
@@ -13,3 +14,6 @@ The model employs a Convolutional Neural Networks (CNNs) and Long Short-Term Mem
 Model performance was evaluated using Mean Squared Error (MSE), showing good predictive accuracy in capturing temperature trends, though some discrepancies emerged during rapid changes. The approach proved effective for temperature forecasting, with further tuning potentially improving results. 
 For more information about the whole methodology please go this website: [climatemapped.AFRICA](https://climatemapped-africa.dev.codeforafrica.org/about/Methodology)
 """)
+
+# Text only; warm up the forecasting libraries for the next page visited
+preload.start()
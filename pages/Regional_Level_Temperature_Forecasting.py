@@ -2,27 +2,19 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objs as go
-from mlforecast import MLForecast
-import joblib
+from climatemap import city_forecast, data
+from climatemap.metrics import debug_panel, set_page
+from climatemap import preload
 
 # ---------------------------
 # Streamlit Configuration
 # ---------------------------
 st.set_page_config(layout="wide", page_title="Regions Level Temperature Forecasting")
+set_page('city')  # labels this rerun's stage timings
 st.image("images/climatemap_logo.png", width=200)
 st.title("Regions Level Temperature Forecasting")
 st.write("Select your country and region to explore historical and future temperature trends.")
 
-# ---------------------------
-# Load model + data
-# ---------------------------
-model = joblib.load("nixtla_forecast.pkl")
-model.static_features = []
-
-df = pd.read_csv("data/monthly_temp_2015-2025.csv")
-df.fillna("NA", inplace=True)
-df = df[df.date <= "2024-12-01"].copy()
-
 # ---------------------------
 # Country Mapping
 # ---------------------------
@@ -39,27 +31,29 @@ country_mapping = {
     'TG': 'Togo','TN': 'Tunisia','UG': 'Uganda','ZM': 'Zambia','ZW': 'Zimbabwe'
 }
 
-df["country_name"] = df["country"].map(country_mapping)
-
-# ---------------------------
-# Prepare Data
-# ---------------------------
-df = df.rename(columns={"temperature":"y","date":"ds","city":"unique_id"})
-df["y"] = df["y"].round(2)
-df["ds"] = pd.to_datetime(df["ds"])
-df = df.sort_values(["unique_id","ds"])
+country_codes = {name: code for code, name in country_mapping.items()}
 
 # ---------------------------
 # USER INPUTS
 # ---------------------------
-country_options = ["Select Country"] + sorted(df["country_name"].dropna().unique())
+# Country names come from the partition directories, so no rows are read yet
+country_options = ["Select Country"] + sorted(
+    country_mapping[code] for code in data.countries("city") if code in country_mapping
+)
 selected_country = st.selectbox("Select Country", country_options)
 
 if selected_country == "Select Country":
     st.info("Please select a country to continue.")
     st.stop()
 
-city_options = ["Select City/Region"] + sorted(df[df["country_name"] == selected_country]["unique_id"].unique())
+# ---------------------------
+# Load only the selected country's history
+# ---------------------------
+df = data.load_country("city", country_codes[selected_country], end=city_forecast.last_observed())
+df = city_forecast.prepare_history(df)
+df["country_name"] = selected_country
+
+city_options = ["Select City/Region"] + sorted(df["unique_id"].unique())
 selected_city = st.selectbox("Select City/Region", city_options)
 
 if selected_city == "Select City/Region":
@@ -88,17 +82,11 @@ st.info(f"Forecast horizon selected: {horizon} months ({years_equivalent} year{'
 # RUN PREDICTION
 # ---------------------------
 with st.spinner(f"Predicting {horizon} month(s)..."):
-    df_model = df[["unique_id","ds","y"]]
-    model.fit(df_model)
-    future = model.predict(h=horizon)
+    # The model is fitted once per data version and shared across sessions
+    future_city = city_forecast.predict_city(selected_city, horizon)
 
 st.success("Prediction completed!")
 
-future["ds"] = future["ds"].dt.to_period("M").dt.to_timestamp()
-future_city = future[future["unique_id"] == selected_city]
-future_city = future_city.rename(columns={'LinearRegression':'y'})
-future_city['y'] = future_city['y'].round(2)
-
 # ---------------------------
 # LINE CHART
 # ---------------------------
@@ -166,3 +154,9 @@ heatmap_fig.update_layout(
     height=600, template="plotly_white"
 )
 st.plotly_chart(heatmap_fig, use_container_width=True)
+
+# Stage timings, shown with ?debug=1
+debug_panel(st)
+
+# The page has rendered: import the heavy libraries in the background for the next forecast
+preload.start()
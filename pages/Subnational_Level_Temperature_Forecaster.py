@@ -1,15 +1,16 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import tensorflow as tf
-import keras
-from sklearn.preprocessing import MinMaxScaler
-import joblib
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
+from climatemap import data, direct, forecast_store, preprocessing
+from climatemap.decimate import decimate, max_points
+from climatemap.metrics import debug_panel, set_page
+from climatemap import preload
 
 # Page config
 st.set_page_config(layout="wide", page_title="Regions Level Temperature Forecasting")
+set_page('subnational')  # labels this rerun's stage timings
 
 # Add logo
 image = 'images/climatemap_logo.png'
@@ -19,52 +20,39 @@ st.image(image, width=200)
 st.title("Regions Level Temperature Forecasting")
 st.write('Curious about how temperature will vary in your region in the future? Select your country and region.')
 
-# Load the model
-model = joblib.load('models/subnational_temp_forecaster.pkl')
-
-# Load and prepare data
-df = pd.read_csv('data/subnational_monthly_temp_1990.csv')
-df['Date'] = pd.to_datetime(df['Date'])
-df = df[df['Date'] >= '2010-01-01']
-
+# --- filters ---
+# Country names come from the partition directories, so no rows are read yet
+selected_country = st.selectbox('Select a country:', data.countries('subnational'))
 
-df_pivot = df.pivot_table(index='Date', columns=['Country', 'Area'], values='Monthly_temperature', aggfunc='first')
-df_pivot.columns = ['_'.join(col).strip() for col in df_pivot.columns.values]
-df_pivot = df_pivot.sort_index()
+# Pivoted history of only the selected country's regions, cached per data version
+df_pivot = preprocessing.subnational_country_pivot(selected_country)
 
-# --- filters ---
-selected_country = st.selectbox('Select a country:', sorted(df['Country'].unique().tolist()))
-available_regions = df[df['Country'] == selected_country]['Area'].unique().tolist()
+available_regions = [col[len(selected_country) + 1:] for col in df_pivot.columns]
 selected_regions = st.multiselect('Select regions to forecast:', sorted(available_regions))
 year_range = st.slider("Select forecast range", 2025, 2030, (2025, 2030))
-num_months = 12 * (year_range[1] - year_range[0] + 1)
-
-# Define prediction function
-def predict_future(model, last_sequence, num_steps, seq_length):
-    future_predictions = []
-    current_sequence = last_sequence.copy()
-
-    for _ in range(num_steps):
-        pred = model.predict(current_sequence.reshape(1, seq_length, -1))[0]
-        future_predictions.append(pred)
-        current_sequence = np.roll(current_sequence, -1, axis=0)
-        current_sequence[-1] = pred
-
-    return np.array(future_predictions)
+method = st.radio(
+    'Forecast method', forecast_store.METHODS, horizontal=True,
+    format_func={'recursive': 'Recursive (month by month)', 'direct': 'Direct (all months at once)'}.get,
+    help='The direct model predicts every month in one pass, so errors do not compound over the years.',
+)
+if method == 'direct' and not direct.available('subnational'):
+    st.info('No direct model has been trained yet, so the recursive forecast is shown.')
+    method = 'recursive'
+elif method == 'direct' and direct.stale('subnational'):
+    st.warning('The direct model was trained before the latest data was added. Its forecast starts from the '
+               'latest months, but retrain it with `python -m climatemap.direct subnational` to learn from them.')
 
 if selected_regions:
-    with st.spinner('Generating forecast...'):
-        scaler = MinMaxScaler()
-        scaled_data = scaler.fit_transform(df_pivot)
-        seq_length = 12
-        full_last_sequence = scaled_data[-seq_length:]
+    # Rows of the forecast for the selected years, counted from the month after the last observation
+    start, stop = forecast_store.year_steps('subnational', *year_range)
 
-        future_scaled_all = predict_future(model, full_last_sequence, num_months, seq_length)
-        future_all = scaler.inverse_transform(future_scaled_all)
-        
-        #future_dates = pd.date_range(start=f'{year_range[0]}-01-01', periods=num_months, freq='M').strftime('%b-%Y')
+    with st.spinner('Generating forecast...'):
+        # Slice the precomputed forecast; the model only runs if the store is missing or stale.
+        # The model takes every region as input, so the forecast covers all of them
+        future_all = forecast_store.forecast('subnational', stop, method)[df_pivot.columns].to_numpy()[start:]
 
-        future_dates = pd.date_range(start=df_pivot.index[-1] + pd.DateOffset(months=1), periods=num_months, freq='MS')
+        # The store's months follow the full subnational pivot, not this country's last month
+        future_dates = forecast_store.forecast_dates('subnational', stop)[start:]
         future_df_all = pd.DataFrame(np.round(future_all, 2), index=future_dates, columns=df_pivot.columns)
         #future_df_all.index.name = 'Date'
 
@@ -92,15 +80,17 @@ if selected_regions:
         # Historical + Forecast Plot
         fig = make_subplots(rows=1, cols=1, subplot_titles=["Historical and Forecasted Temperatures"])
 
+        # Long histories are decimated to about one point per pixel on a real date axis
         for col in selected_columns:
-            fig.add_trace(go.Scatter(x=pd.to_datetime(historical_df.index).strftime('%b-%Y'), y=historical_df[col], name=f"{col} (Historical)", mode='lines'))
-            fig.add_trace(go.Scatter(x=pd.to_datetime(future_df.index).strftime('%b-%Y'), y=future_df[col], name=f"{col} (Forecast)", mode='lines'))
+            hist_x, hist_y = decimate(historical_df.index, historical_df[col], max_points())
+            fig.add_trace(go.Scatter(x=hist_x, y=hist_y, name=f"{col} (Historical)", mode='lines'))
+            fig.add_trace(go.Scatter(x=future_df.index, y=future_df[col], name=f"{col} (Forecast)", mode='lines'))
 
         fig.update_layout(
             title="Subnational Temperature Forecast",
             xaxis_title="Date",
             yaxis_title="Temperature (°C)",
-            xaxis=dict(tickformat="%Y-%m", tickangle=-45)
+            xaxis=dict(type="date", tickformat="%Y-%m", tickangle=-45)
         )
         st.plotly_chart(fig)
 
@@ -154,3 +144,9 @@ if selected_regions:
         
 else:
     st.warning("Please select at least one region to generate a forecast.")
+
+# Stage timings, shown with ?debug=1
+debug_panel(st)
+
+# The page has rendered: import the heavy libraries in the background for the next forecast
+preload.start()
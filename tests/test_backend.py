@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow', reason='exporting needs TensorFlow')
+
+from climatemap import backend  # noqa: E402
+from climatemap.inference import rollout  # noqa: E402
+from climatemap.registry import registry  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _lite_runtime():
+    for module in ('ai_edge_litert.interpreter', 'tflite_runtime.interpreter'):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+@pytest.fixture
+def country_model(tmp_path, monkeypatch):
+    if not _lite_runtime():
+        pytest.skip('no TensorFlow Lite runtime (ai-edge-litert or tflite-runtime)')
+    monkeypatch.chdir(ROOT)
+    # Bundled pickles may be Git LFS pointers
+    if os.path.getsize(registry.path('country')) < 1024:
+        pytest.skip('the country model pickle is not available')
+    monkeypatch.setattr(backend, 'LITE_DIR', str(tmp_path))
+    return registry.get('country')
+
+
+@pytest.mark.parametrize('quantization', ['none', 'float16'])
+def test_lite_forecast_matches_keras(country_model, quantization):
+    backend.export('country', quantization)
+    lite_model = backend.LiteModel(backend.lite_path('country', quantization))
+    windows = np.random.default_rng(0).random((4,) + tuple(country_model.input_shape[1:])).astype(np.float32)
+
+    # One invoke for the whole batch, and the same months as four single-window calls
+    batch = lite_model.predict(windows)
+    assert batch.shape == (4, country_model.output_shape[-1])
+    np.testing.assert_allclose(batch, np.concatenate([lite_model.predict(w[np.newaxis]) for w in windows]), atol=1e-6)
+
+    expected = rollout(country_model, windows, backend.PARITY_STEPS)
+    actual = rollout(lite_model, windows, backend.PARITY_STEPS)
+    assert np.max(np.abs(expected - actual)) <= backend.SCALED_TOLERANCE
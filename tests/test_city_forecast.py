@@ -0,0 +1,52 @@
+import json
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from climatemap import city_forecast, data
+
+
+@pytest.fixture
+def city_source(tmp_path, monkeypatch):
+    """A six-city source whose 2025 months are partial, and a stand-in city model"""
+    from mlforecast import MLForecast
+    from sklearn.linear_model import LinearRegression
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(city_forecast, '_fitted', {})
+    monkeypatch.setattr(city_forecast, '_cutoffs', None)
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'models').mkdir()
+    dates = pd.date_range('2015-01-01', '2025-06-01', freq='MS')
+    rng = np.random.default_rng(0)
+    df = pd.concat([
+        pd.DataFrame({
+            'city': f'City {i}', 'country': 'KE', 'date': dates,
+            'temperature': 20 + 5 * np.sin(2 * np.pi * dates.month / 12) + rng.normal(0, 0.5, len(dates)),
+        })
+        for i in range(6)
+    ])
+    df.to_csv('data/monthly_temp_2015-2025.csv', index=False)
+    joblib.dump(MLForecast(models=[LinearRegression()], freq='MS', lags=[1, 12]), 'models/standin.pkl')
+    (tmp_path / 'models' / 'active.json').write_text(json.dumps({'city': 'models/standin.pkl'}))
+    return df
+
+
+def test_an_append_moves_only_its_own_city_cutoff(city_source):
+    city_forecast.get_fitted_model()
+    new_month = city_source[(city_source['city'] == 'City 0') & (city_source['date'] == '2025-06-01')]
+    new_month.assign(date='2025-07-01').to_csv('new.csv', index=False)
+    data.append('city', 'new.csv')
+
+    assert city_forecast.changed_cities() == {'City 0'}
+    assert city_forecast.last_observed('City 0') == pd.Timestamp('2025-07-01')
+    assert city_forecast.last_observed('City 1') == pd.Timestamp(city_forecast.LAST_OBSERVED)
+
+    model, how = city_forecast.fit_current()
+    assert how == 'updated'
+    last_dates = pd.Series(model.ts.last_dates, index=model.ts.uids)
+    assert last_dates['City 0'] == pd.Timestamp('2025-07-01')
+    assert (last_dates.drop('City 0') == pd.Timestamp(city_forecast.LAST_OBSERVED)).all()
+    assert city_forecast.predict_city('City 1', 12)['ds'].iloc[0] == pd.Timestamp('2025-01-01')
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from climatemap.figures import create_city_map
+from climatemap.map_tiles import MapLayers
+
+
+def _layers():
+    rng = np.random.default_rng(0)
+    n = 200
+    return MapLayers(pd.DataFrame({
+        'city': [f'City {i:03d}' for i in range(n)],
+        'country_name': 'Kenya',
+        'latitude': rng.uniform(-30, 30, n),
+        'lng': rng.uniform(-15, 45, n),
+        'temperature': rng.uniform(10, 30, n),
+    }))
+
+
+def test_zooming_out_after_a_click_keeps_the_other_clusters():
+    layers = _layers()
+    level = layers.level(2)
+    cell = int(np.argmax(level.count))
+    zoom = layers.expand_zoom(level, cell)
+    assert zoom is not None and zoom > level.zoom
+
+    # The click re-centres the map on the cluster at a deeper zoom
+    center = {'lat': float(level.lat[cell]), 'lon': float(level.lng[cell])}
+    fig = create_city_map(layers, center, zoom)
+    zoomed = layers.level(zoom)
+    assert len(fig.data[0].customdata) == len(zoomed)
+    assert zoomed.count.sum() == len(layers.cities)
+
+    # Cities far from the clicked cluster are still on the map the client pans over
+    members = set(layers.cities[layers.members(level, cell)])
+    shown = {layers.cities[zoomed.first[c]] for c in fig.data[0].customdata}
+    assert shown - members
+
+
+
+def test_a_city_view_keeps_every_city_unless_trimmed():
+    layers = _layers()
+    center = {'lat': float(layers.lat[0]), 'lon': float(layers.lng[0])}
+    assert len(create_city_map(layers, center, 12).data[0].customdata) == len(layers.cities)
+    assert len(create_city_map(layers, center, 12, trim=True).data[0].customdata) < len(layers.cities)
+
+
+def test_colocated_cities_never_split():
+    layers = MapLayers(pd.DataFrame({
+        'city': ['A', 'B', 'C', 'D'],
+        'country_name': 'Kenya',
+        'latitude': [1.0, 1.0, 1.0, 5.0],
+        'lng': [2.0, 2.0, 2.0, 9.0],
+        'temperature': [20.0, 21.0, 22.0, 23.0],
+    }))
+    level = layers.level(16)
+    cell = next(c for c in range(len(level)) if level.count[c] == 3)
+    assert layers.expand_zoom(level, cell) is None
+    assert sorted(layers.cities[layers.members(level, cell)]) == ['A', 'B', 'C']
@@ -0,0 +1,83 @@
+import json
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+import synthetic
+
+from climatemap import data, forecast_store, matrix_store, preprocessing
+
+
+class Persistence:
+    """A stand-in country model that predicts each window's last month again"""
+
+    def predict(self, x, **kwargs):
+        return np.asarray(x)[:, -1, :]
+
+
+@pytest.fixture
+def country_source(tmp_path, monkeypatch):
+    """Five countries observed through June 2024, and the stand-in model"""
+    monkeypatch.chdir(tmp_path)
+    for module, name in ((preprocessing, '_stages'), (matrix_store, '_stores'),
+                         (forecast_store, '_computed'), (forecast_store, '_loaded')):
+        monkeypatch.setattr(module, name, {})
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'models').mkdir()
+    df = synthetic.country_table(n_countries=5, end='2024-06-01')
+    df.to_csv('data/Monthly_Temperature_Data_2010.csv', index=False)
+    joblib.dump(Persistence(), 'models/persistence.pkl')
+    (tmp_path / 'models' / 'active.json').write_text(json.dumps({'country': 'models/persistence.pkl'}))
+    return df
+
+
+def test_load_types_and_caches_the_source(country_source):
+    df = data.load('country')
+    assert len(df) == len(country_source)
+    assert isinstance(df['Country'].dtype, pd.CategoricalDtype)
+    assert df['Date'].dtype == 'datetime64[ns]'
+    assert df['Monthly_temperature'].dtype == np.float32
+    assert data.load('country') is df
+    assert data.cache_path('country').endswith('.feather')
+
+
+def test_compute_forecasts_from_the_last_window(country_source):
+    stage = preprocessing.get_stage('country')
+    future = forecast_store.compute('country')
+    assert future.shape == (forecast_store.FORECAST_STEPS, 5)
+    assert list(future.columns) == list(stage.pivot.columns)
+    # The stand-in repeats the last month, which must come back through the scaler unchanged
+    np.testing.assert_allclose(future.to_numpy(), np.tile(stage.pivot.iloc[-1], (len(future), 1)), atol=1e-4)
+    pd.testing.assert_frame_equal(forecast_store.compute('country', 12), future.iloc[:12])
+
+
+def test_year_steps_count_from_the_month_after_the_data(country_source):
+    assert forecast_store.forecast_dates('country', 1)[0] == pd.Timestamp('2024-07-01')
+    start, stop = forecast_store.year_steps('country', 2025, 2026)
+    assert (start, stop) == (6, 30)
+    dates = forecast_store.forecast_dates('country', stop)[start:]
+    assert (dates[0], dates[-1]) == (pd.Timestamp('2025-01-01'), pd.Timestamp('2026-12-01'))
+    assert forecast_store.year_steps('country', 2024, 2024) == (0, 6)
+
+
+def test_matrix_append_matches_a_full_build(country_source):
+    from sklearn.preprocessing import MinMaxScaler
+
+    old = matrix_store.open_store('country')
+    countries = list(old.columns[:2])
+    new_month = pd.DataFrame({
+        'Date': '2024-07-01', 'Country': countries,
+        # Above every value so far: the first country's bounds move
+        'Monthly_temperature': [float(old.values.max()) + 5, float(old.values[-1, 1])],
+    })
+    new_month.to_csv('new.csv', index=False)
+    old_version, new_version, new_rows = data.append('country', 'new.csv')
+
+    assert matrix_store.append('country', old_version, new_rows) == countries
+    store = matrix_store.MatrixStore('country', new_version)
+    pivot = preprocessing.country_pivot(data.load('country'))
+    assert store.index[-1] == pd.Timestamp('2024-07-01')
+    np.testing.assert_allclose(store.frame().to_numpy(), pivot.to_numpy(), atol=1e-5, equal_nan=True)
+    scaled = MinMaxScaler().fit(pivot).transform(pivot)
+    np.testing.assert_allclose(store.scaled, scaled, atol=1e-5, equal_nan=True)